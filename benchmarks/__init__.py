@@ -0,0 +1,5 @@
+"""
+Offline benchmarks for the road network analysis pipeline.
+
+Run from the repository root, e.g. ``python -m benchmarks.bench_sampling``.
+"""
@@ -0,0 +1,118 @@
+"""
+Compare weighted k-means clustering against the original point-duplication
+approach, for run time and for mileage balance across clusters.
+
+Exits non-zero if the mileage balance of the current implementation is worse
+than the original by more than ``--tolerance``.
+
+Usage:
+    python -m benchmarks.bench_clustering [--sizes 15 20] [--target 10]
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+from scipy import stats
+from sklearn.cluster import KMeans
+
+from osm_extractor import METERS_PER_MILE
+from osm_extractor.sampling import generate_points_along_lines
+from osm_extractor.clustering import create_cluster_polygons
+from benchmarks.synthetic import grid_network, radial_network
+
+
+def _legacy_inputs(points_gdf):
+    points_projected = points_gdf.to_crs(epsg=3857)
+    coords = np.array([[p.x, p.y] for p in points_projected.geometry])
+    sample_weights = points_projected['edge_length_mi'].values
+    return coords, sample_weights
+
+
+def legacy_fit(points_gdf, n_clusters):
+    """Original duplication + mode remap labelling, kept as the baseline."""
+    coords, sample_weights = _legacy_inputs(points_gdf)
+    kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=50, max_iter=1000)
+    weighted_coords = []
+    weighted_point_indices = []
+    for i, (coord, weight) in enumerate(zip(coords, sample_weights)):
+        num_duplicates = max(1, int(weight * 10))
+        for _ in range(num_duplicates):
+            weighted_coords.append(coord)
+            weighted_point_indices.append(i)
+    weighted_clusters = kmeans.fit_predict(np.array(weighted_coords))
+    point_clusters = np.zeros(len(coords), dtype=int)
+    for i in range(len(coords)):
+        point_indices = [idx for idx, p_idx in enumerate(weighted_point_indices) if p_idx == i]
+        if point_indices:
+            point_clusters[i] = stats.mode([weighted_clusters[idx] for idx in point_indices],
+                                           keepdims=True).mode[0]
+    return point_clusters
+
+
+def cluster_miles(points_gdf, labels, edges, n_clusters):
+    """Miles of road touched by each cluster, as reported by the app."""
+    miles = np.zeros(n_clusters)
+    for cluster_id in range(n_clusters):
+        edge_ids = points_gdf['edge_id'][labels == cluster_id].unique()
+        miles[cluster_id] = edges.loc[edges.index.isin(edge_ids), 'length_mi'].sum()
+    return miles
+
+
+def balance(miles, target):
+    """(max miles / target, coefficient of variation) of the cluster sizes."""
+    return miles.max() / target, miles.std() / miles.mean()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[15, 20],
+                        help="Grid side lengths / ring counts")
+    parser.add_argument('--spacing', type=float, default=0.1, help="Point spacing in miles")
+    parser.add_argument('--target', type=float, default=10.0, help="Target miles per cluster")
+    parser.add_argument('--tolerance', type=float, default=0.05,
+                        help="Allowed relative worsening of the max/target ratio")
+    args = parser.parse_args()
+
+    networks = []
+    for size in args.sizes:
+        networks.append((f"grid {size}x{size}", grid_network(size, cell_meters=400)[1]))
+        networks.append((f"radial {size} rings", radial_network(size, ring_meters=400)[1]))
+
+    failed = False
+    print(f"{'network':<18} {'points':>7} {'k':>4} {'impl':<9} {'time (s)':>9} "
+          f"{'max/target':>11} {'CV':>6}")
+    for name, edges in networks:
+        edges['length_mi'] = edges['length'] / METERS_PER_MILE
+        n_clusters = max(1, int(np.ceil(edges['length_mi'].sum() / args.target)))
+        points_gdf = generate_points_along_lines(edges, spacing_miles=args.spacing)
+
+        start = time.perf_counter()
+        legacy_labels = legacy_fit(points_gdf, n_clusters)
+        t_legacy = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _, clustered = create_cluster_polygons(points_gdf.copy(), n_clusters, edges)
+        t_new = time.perf_counter() - start
+
+        results = {
+            'legacy': (t_legacy, cluster_miles(points_gdf, legacy_labels, edges, n_clusters)),
+            'weighted': (t_new, cluster_miles(clustered, clustered['cluster'].to_numpy(),
+                                              edges, n_clusters)),
+        }
+        for impl, (elapsed, miles) in results.items():
+            ratio, cv = balance(miles, args.target)
+            print(f"{name:<18} {len(points_gdf):>7,} {n_clusters:>4} {impl:<9} "
+                  f"{elapsed:>9.2f} {ratio:>11.2f} {cv:>6.2f}")
+
+        legacy_ratio, _ = balance(results['legacy'][1], args.target)
+        new_ratio, _ = balance(results['weighted'][1], args.target)
+        if new_ratio > legacy_ratio * (1 + args.tolerance):
+            print(f"  REGRESSION: max/target {new_ratio:.2f} > {legacy_ratio:.2f}")
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Cold start of the app: time to first render in a fresh interpreter.
+
+Every run starts a new Python process, imports Streamlit's test harness
+(the server has Streamlit loaded already), then times the first script
+run of osm_extractor_app.py with default settings, and the imports a
+background worker pays for the pipeline modules. Reports the median of
+``--repeat`` runs and which heavy dependencies each one loaded.
+
+Usage:
+    python -m benchmarks.bench_cold_start [--repeat 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ("osmnx", "geopandas", "folium", "sklearn", "scipy", "networkx", "pyproj", "osmium")
+
+FIRST_RENDER = """
+from streamlit.testing.v1 import AppTest
+start = time.perf_counter()
+at = AppTest.from_file({app!r}, default_timeout=600)
+at.run()
+assert not at.exception, at.exception
+"""
+
+WORKER_IMPORTS = """
+start = time.perf_counter()
+import osm_extractor.pipeline, osm_extractor.jobs
+"""
+
+SCENARIOS = {
+    "app first render": FIRST_RENDER.format(app=os.path.join(ROOT, "osm_extractor_app.py")),
+    "pipeline import": WORKER_IMPORTS,
+}
+
+REPORT = """
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def run_once(body):
+    """Time ``body`` in a fresh interpreter; returns (seconds, heavy modules loaded)."""
+    code = "import json, sys, time\n" + body + REPORT.format(heavy=HEAVY_MODULES)
+    env = {**os.environ, "PYTHONPATH": ROOT, "OSM_EXTRACTOR_CACHE_DIR": os.path.join(ROOT, "network_cache")}
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    return result['seconds'], result['loaded']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=5, help="Fresh interpreters per scenario")
+    args = parser.parse_args()
+
+    print(f"{'scenario':<18} {'median (s)':>10} {'min (s)':>8}  heavy modules loaded")
+    for name, body in SCENARIOS.items():
+        runs = [run_once(body) for _ in range(args.repeat)]
+        seconds = [s for s, _ in runs]
+        print(f"{name:<18} {statistics.median(seconds):>10.2f} {min(seconds):>8.2f}  "
+              f"{', '.join(runs[-1][1]) or '-'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Memory of the compact edge store against the projected GeoDataFrame copy
+that clustering used to work on.
+
+Each measurement runs in a fresh process and reports the growth of its
+resident set size, which includes the GEOS memory behind Shapely geometries
+that tracemalloc cannot see. Linux only, as it reads /proc/self/statm.
+
+Usage:
+    python -m benchmarks.bench_edge_store [--sizes 100 300 700]
+"""
+import argparse
+import gc
+import multiprocessing
+import os
+import time
+
+from osm_extractor.edge_store import EdgeStore
+from osm_extractor.projection import local_crs
+from benchmarks.synthetic import grid_network
+
+
+def _rss_mb():
+    with open("/proc/self/statm") as f:
+        resident_pages = int(f.read().split()[1])
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+
+
+def _measure(n_side, build):
+    _, edges = grid_network(n_side)
+    # osmnx-style attribute columns that clustering never reads
+    edges['name'] = [f"Street {i % 997}" for i in range(len(edges))]
+    edges['osmid'] = [[i, i + 1] if i % 10 == 0 else i for i in range(len(edges))]
+    crs = local_crs(edges)
+    gc.collect()
+    before = _rss_mb()
+    start = time.perf_counter()
+    if build == "frame":
+        result = edges.to_crs(crs)
+        nbytes = result.memory_usage(deep=True).sum()
+    else:
+        result = EdgeStore.from_edges(edges, crs)
+        nbytes = result.nbytes
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    return len(edges), _rss_mb() - before, nbytes / 1024 ** 2, elapsed
+
+
+def measure(n_side, build):
+    """Run one measurement in a fresh spawned process."""
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        return pool.apply(_measure, (n_side, build))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 300, 700],
+                        help="Grid side lengths (edges ~= 2 * side^2)")
+    args = parser.parse_args()
+
+    print(f"{'edges':>9} {'representation':<16} {'RSS growth (MB)':>16} {'reported (MB)':>14} "
+          f"{'build (s)':>10}")
+    for n_side in args.sizes:
+        for build, label in (("frame", "projected frame"), ("store", "edge store")):
+            n_edges, rss, reported, elapsed = measure(n_side, build)
+            print(f"{n_edges:>9,} {label:<16} {rss:>16.1f} {reported:>14.1f} {elapsed:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark streamed exports against building each download in memory.
+
+Usage:
+    python -m benchmarks.bench_export [--side 150] [--chunk 50000]
+"""
+import argparse
+import io
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+import geopandas as gpd
+
+from osm_extractor.export import export_geojson, export_shapefile_zip, export_geopackage
+from benchmarks.synthetic import grid_network
+
+
+def legacy_geojson(gdf):
+    """Original download: one GeoJSON string."""
+    return gdf.to_json().encode('utf-8')
+
+
+def legacy_shapefile_zip(gdf, name):
+    """Original download: Shapefile parts zipped into a BytesIO."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        gdf.to_file(os.path.join(tmpdir, f"{name}.shp"), driver='ESRI Shapefile')
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            for ext in ['.shp', '.shx', '.dbf', '.prj', '.cpg']:
+                file_path = os.path.join(tmpdir, f"{name}{ext}")
+                if os.path.exists(file_path):
+                    zipf.write(file_path, f"{name}{ext}")
+        return zip_buffer.getvalue()
+
+
+def legacy_geopackage(gdf):
+    """Original download: GeoPackage read back into a bytes object."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        gpkg_path = os.path.join(tmpdir, "roads.gpkg")
+        gdf.to_file(gpkg_path, driver='GPKG', layer='roads')
+        with open(gpkg_path, 'rb') as f:
+            return f.read()
+
+
+def _measure(func, *args, **kwargs):
+    """Wall time and peak Python heap of one call."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def _read_back(data, suffix):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, f"export{suffix}")
+        with open(path, 'wb') as f:
+            f.write(data)
+        if suffix == '.zip':
+            return gpd.read_file(f"zip://{path}")
+        return gpd.read_file(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--side', type=int, default=150, help="Grid side length (edges ~= 2 * side^2)")
+    parser.add_argument('--chunk', type=int, default=50_000, help="Features per chunk")
+    args = parser.parse_args()
+
+    _, edges = grid_network(args.side)
+    edges = edges.reset_index()
+    print(f"{len(edges):,} edges\n")
+
+    cases = [
+        ('GeoJSON', '.geojson', legacy_geojson, lambda g: export_geojson(g, chunk_rows=args.chunk)),
+        ('Shapefile', '.zip', lambda g: legacy_shapefile_zip(g, 'roads'),
+         lambda g: export_shapefile_zip(g, 'roads', chunk_rows=args.chunk)),
+        ('GeoPackage', '.gpkg', legacy_geopackage,
+         lambda g: export_geopackage({'roads': g}, chunk_rows=args.chunk)),
+    ]
+    print(f"{'format':<11} {'in-memory (s)':>14} {'peak (MB)':>10} {'streamed (s)':>13} "
+          f"{'peak (MB)':>10} {'size (MB)':>10}")
+    for name, suffix, legacy, streamed in cases:
+        legacy_bytes, t_legacy, peak_legacy = _measure(legacy, edges)
+        spooled, t_streamed, peak_streamed = _measure(streamed, edges)
+        streamed_bytes = spooled.read()
+
+        # Both paths must export the same features
+        if name == 'GeoJSON':
+            assert json.loads(legacy_bytes) == json.loads(streamed_bytes)
+        else:
+            legacy_back, streamed_back = _read_back(legacy_bytes, suffix), _read_back(streamed_bytes, suffix)
+            assert len(legacy_back) == len(streamed_back) == len(edges)
+            assert legacy_back.geometry.geom_equals(streamed_back.geometry).all()
+
+        print(f"{name:<11} {t_legacy:>14.2f} {peak_legacy / 1024 ** 2:>10.1f} {t_streamed:>13.2f} "
+              f"{peak_streamed / 1024 ** 2:>10.1f} {len(streamed_bytes) / 1024 ** 2:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
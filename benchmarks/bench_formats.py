@@ -0,0 +1,86 @@
+"""
+Benchmark writing and reading roads in every export format.
+
+Usage:
+    python -m benchmarks.bench_formats [--side 150] [--pbf benchmarks/fixtures/grid.osm.pbf]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from osm_extractor.export import (export_geojson, export_shapefile_zip, export_geopackage,
+                                  export_geoparquet, export_flatgeobuf)
+from benchmarks.synthetic import grid_network
+
+FORMATS = [
+    ('GeoJSON', '.geojson', export_geojson),
+    ('Shapefile', '.zip', lambda gdf: export_shapefile_zip(gdf, 'roads')),
+    ('GeoPackage', '.gpkg', lambda gdf: export_geopackage({'roads': gdf})),
+    ('GeoParquet', '.parquet', export_geoparquet),
+    ('FlatGeobuf', '.fgb', export_flatgeobuf),
+]
+
+
+def read_export(path, bbox=None):
+    """Read an exported file back, optionally only the features in ``bbox``."""
+    if path.endswith('.parquet'):
+        return gpd.read_parquet(path, bbox=bbox)
+    if path.endswith('.zip'):
+        path = f"zip://{path}"
+    return gpd.read_file(path, bbox=bbox)
+
+
+def _time(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--side', type=int, default=150, help="Grid side length (edges ~= 2 * side^2)")
+    parser.add_argument('--pbf', default=None,
+                        help="Benchmark a network read from this PBF file instead of a synthetic grid")
+    args = parser.parse_args()
+
+    if args.pbf:
+        from osm_extractor.pbf_source import read_pbf_network
+        _, edges = read_pbf_network(args.pbf)
+    else:
+        _, edges = grid_network(args.side)
+    edges = edges.reset_index()
+
+    # A window covering ~1% of the extract, for spatially filtered reads
+    west, south, east, north = edges.total_bounds
+    cx, cy = (west + east) / 2, (south + north) / 2
+    dx, dy = (east - west) * 0.05, (north - south) * 0.05
+    window = (cx - dx, cy - dy, cx + dx, cy + dy)
+    expected_in_window = int(edges.intersects(shapely.box(*window)).sum())
+    print(f"{len(edges):,} edges, window of ~{expected_in_window:,}\n")
+
+    print(f"{'format':<11} {'write (s)':>10} {'size (MB)':>10} {'read (s)':>9} {'window read (s)':>16} "
+          f"{'window rows':>12}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, extension, exporter in FORMATS:
+            spooled, t_write = _time(exporter, edges)
+            path = os.path.join(tmpdir, f"roads{extension}")
+            with open(path, 'wb') as f:
+                f.write(spooled.read())
+
+            full, t_read = _time(read_export, path)
+            assert len(full) == len(edges)
+            assert np.isclose(full.geometry.length.sum(), edges.geometry.length.sum())
+            subset, t_window = _time(read_export, path, bbox=window)
+            assert len(subset) >= expected_in_window
+
+            print(f"{name:<11} {t_write:>10.2f} {os.path.getsize(path) / 1024 ** 2:>10.1f} "
+                  f"{t_read:>9.2f} {t_window:>16.3f} {len(subset):>12,}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark graph-contiguous clustering against the k-means path.
+
+For every network size this reports run time, mileage balance and how many
+clusters are split into more than one connected piece of road.
+
+Usage:
+    python -m benchmarks.bench_graph_clustering [--sizes 40 80 160] [--target 20]
+"""
+import argparse
+import time
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+
+from osm_extractor import METERS_PER_MILE
+from osm_extractor.balancing import edge_endpoints, mileage_balance
+from osm_extractor.clustering import create_cluster_polygons
+from osm_extractor.graph_partition import edge_adjacency
+from osm_extractor.sampling import generate_points_along_lines
+from benchmarks.synthetic import grid_network, radial_network
+
+
+def fragmented_clusters(adjacency, labels):
+    """Number of clusters whose edges form more than one connected piece."""
+    # Keep only adjacencies between edges of the same cluster
+    coo = adjacency.tocoo()
+    same = labels[coo.row] == labels[coo.col]
+    within = sp.csr_matrix((coo.data[same], (coo.row[same], coo.col[same])),
+                           shape=adjacency.shape)
+    _, piece = connected_components(within, directed=False)
+    pieces = np.unique(np.column_stack([labels, piece]), axis=0)
+    return int((np.bincount(pieces[:, 0]) > 1).sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[40, 80, 160],
+                        help="Grid side lengths (edges ~= 2 * side^2)")
+    parser.add_argument('--spacing', type=float, default=0.1, help="Point spacing in miles")
+    parser.add_argument('--target', type=float, default=20.0, help="Target miles per cluster")
+    parser.add_argument('--backends', nargs='+', default=['auto', 'graph'])
+    args = parser.parse_args()
+
+    networks = []
+    for size in args.sizes:
+        networks.append((f"grid {size}x{size}", grid_network(size, cell_meters=300)[1]))
+        networks.append((f"radial {size // 2} rings", radial_network(size // 2, ring_meters=300)[1]))
+
+    print(f"{'network':<18} {'edges':>8} {'k':>5} {'backend':<10} {'time (s)':>9} "
+          f"{'max/target':>11} {'CV':>6} {'split':>6}")
+    for name, edges in networks:
+        edges['length_mi'] = edges['length'] / METERS_PER_MILE
+        n_clusters = max(1, int(np.ceil(edges['length_mi'].sum() / args.target)))
+        points_gdf = generate_points_along_lines(edges, spacing_miles=args.spacing)
+        edge_u, edge_v = edge_endpoints(edges)
+        adjacency = edge_adjacency(edge_u, edge_v)
+
+        for backend in args.backends:
+            start = time.perf_counter()
+            cluster_gdf, clustered = create_cluster_polygons(
+                points_gdf.copy(), n_clusters, edges, backend=backend,
+            )
+            elapsed = time.perf_counter() - start
+
+            # Every point of an edge carries the edge's cluster
+            labels = np.full(len(edges), -1)
+            positions = edges.index.get_indexer(clustered['edge_id'])
+            labels[positions] = clustered['cluster'].to_numpy()
+            assigned = labels >= 0
+            miles = np.bincount(labels[assigned], weights=edges['length_mi'].to_numpy()[assigned])
+            balance = mileage_balance(miles, args.target)
+            split = fragmented_clusters(adjacency[assigned][:, assigned], labels[assigned])
+
+            used = cluster_gdf.attrs['clustering']['backend']
+            print(f"{name:<18} {len(edges):>8,} {n_clusters:>5} {used:<10} {elapsed:>9.2f} "
+                  f"{balance['max_over_target']:>11.2f} {balance['cv']:>6.2f} {split:>6}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Incremental update from an OSM change file against a full rebuild.
+
+Writes a synthetic grid .osm.pbf and a change file with scattered local
+edits (moved intersections, new cul-de-sacs, new connectors), then updates
+the extracted and clustered network both ways and reports edges and
+clusters updated with the time of each stage.
+
+Usage:
+    python -m benchmarks.bench_incremental [--side 150] [--edits 10] [--target 10]
+"""
+import argparse
+import os
+import tempfile
+
+import numpy as np
+import osmium
+
+from osm_extractor.incremental import (incremental_update, full_rebuild, run_summary, format_report,
+                                       compare_networks)
+from osm_extractor.instrumentation import StageRecorder
+from osm_extractor.pbf_source import read_pbf_network
+from osm_extractor.pipeline import add_length_miles, cluster_network
+from benchmarks.make_pbf_fixture import write_grid_pbf, _grid
+
+ORIGIN = (-118.4, 33.9)
+CELL_METERS = 150.0
+
+
+def write_local_changes(path, n_side, n_edits, seed=0):
+    """Change file with ``n_edits`` small edits at random interior intersections."""
+    rng = np.random.default_rng(seed)
+    lon0, lat0 = ORIGIN
+    ids, dlon, dlat = _grid(n_side, CELL_METERS, ORIGIN)
+    next_node = n_side * n_side + 1
+    next_way = 2 * n_side + 2
+
+    writer = osmium.SimpleWriter(path)
+    try:
+        for edit in range(n_edits):
+            row, col = (int(i) for i in rng.integers(1, n_side - 2, size=2))
+            kind = edit % 3
+            if kind == 0:
+                writer.add_node(osmium.osm.mutable.Node(
+                    id=int(ids[row, col]), version=2,
+                    location=(lon0 + (col + 0.1) * dlon, lat0 + (row + 0.1) * dlat),
+                ))
+                continue
+            if kind == 1:
+                writer.add_node(osmium.osm.mutable.Node(
+                    id=next_node, version=1, location=(lon0 + (col + 0.3) * dlon, lat0 + (row + 0.4) * dlat),
+                ))
+                refs, tags = [int(ids[row, col]), next_node], {'highway': 'residential', 'name': 'New Court'}
+                next_node += 1
+            else:
+                refs, tags = [int(ids[row, col]), int(ids[row + 1, col + 1])], {'highway': 'tertiary'}
+            writer.add_way(osmium.osm.mutable.Way(id=next_way, version=1, nodes=refs, tags=tags))
+            next_way += 1
+    finally:
+        writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--side', type=int, default=150, help="Grid intersections per side")
+    parser.add_argument('--edits', type=int, default=10, help="Local edits in the change file")
+    parser.add_argument('--target', type=float, default=10, help="Target miles per cluster")
+    parser.add_argument('--spacing', type=float, default=0.1, help="Point spacing in miles")
+    args = parser.parse_args()
+    options = dict(target_miles=args.target, point_spacing=args.spacing)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        base_pbf = os.path.join(tmpdir, "grid.osm.pbf")
+        osc = os.path.join(tmpdir, "week.osc")
+        write_grid_pbf(base_pbf, n_side=args.side, cell_meters=CELL_METERS, origin=ORIGIN)
+        write_local_changes(osc, args.side, args.edits)
+
+        nodes, edges = read_pbf_network(base_pbf)
+        add_length_miles(edges)
+        clusters, points, _ = cluster_network(edges, **options)
+        print(f"Base network: {len(edges):,} edges, {len(clusters)} clusters; {args.edits} edits")
+
+        recorder = StageRecorder(trace_memory=False, log_path=None)
+        (_, new_edges), new_clusters, new_points, update, _ = incremental_update(
+            nodes, edges, clusters, points, base_pbf, [osc], recorder=recorder, **options
+        )
+        full_recorder = StageRecorder(trace_memory=False, log_path=None)
+        full_edges, full_clusters, full_points = full_rebuild(
+            base_pbf, [osc], os.path.join(tmpdir, "updated.osm.pbf"), recorder=full_recorder, **options
+        )
+
+    incremental = run_summary(recorder, edges, points, new_edges, new_clusters, new_points,
+                              len(update['removed'].union(update['added'])))
+    full = run_summary(full_recorder, edges, points, full_edges, full_clusters, full_points, len(full_edges))
+    print(format_report(update, incremental, full))
+    print()
+    print(compare_networks(new_edges, full_edges))
+    print()
+    print(f"{'stage':<28} {'incremental (s)':>16} {'full (s)':>10}")
+    for table, column in ((recorder.table(), 0), (full_recorder.table(), 1)):
+        for record in table:
+            cells = [f"{record['wall_s']:.3f}" if i == column else "" for i in range(2)]
+            print(f"{record['stage']:<28} {cells[0]:>16} {cells[1]:>10}")
+
+
+if __name__ == '__main__':
+    main()
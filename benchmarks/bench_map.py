@@ -0,0 +1,61 @@
+"""
+Benchmark single-layer map rendering against per-edge folium PolyLines.
+
+Usage:
+    python -m benchmarks.bench_map [--sizes 50 100 225]
+"""
+import argparse
+import time
+
+import folium
+import numpy as np
+
+from osm_extractor.map_layers import network_layer, NetworkLayer
+from benchmarks.synthetic import grid_network
+
+
+def legacy_map(edges, sample_size=1000):
+    """Original preview: one PolyLine per row of a random edge sample."""
+    m = folium.Map(location=[0, 0], zoom_start=13)
+    for idx, row in edges.sample(min(sample_size, len(edges)), random_state=0).iterrows():
+        folium.PolyLine(
+            locations=[(coord[1], coord[0]) for coord in row.geometry.coords],
+            color='blue', weight=2, opacity=0.6
+        ).add_to(m)
+    return m.get_root().render()
+
+
+def layer_map(edges, edge_labels):
+    """Whole network as one embedded GeoJSON layer."""
+    m = folium.Map(location=[0, 0], zoom_start=13, prefer_canvas=True)
+    payload, _ = network_layer(edges, edge_labels)
+    NetworkLayer(payload).add_to(m)
+    return m.get_root().render()
+
+
+def _time(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 100, 225],
+                        help="Grid side lengths (edges ~= 2 * side^2)")
+    args = parser.parse_args()
+
+    print(f"{'edges':>8} {'sample 1k (s)':>14} {'sample 1k (MB)':>15} "
+          f"{'full layer (s)':>15} {'full layer (MB)':>16} {'us / edge':>10}")
+    for n_side in args.sizes:
+        _, edges = grid_network(n_side)
+        labels = np.arange(len(edges)) % 30
+        legacy_html, t_legacy = _time(legacy_map, edges)
+        layer_html, t_layer = _time(layer_map, edges, labels)
+        print(f"{len(edges):>8,} {t_legacy:>14.2f} {len(legacy_html) / 1024 ** 2:>15.2f} "
+              f"{t_layer:>15.2f} {len(layer_html) / 1024 ** 2:>16.2f} "
+              f"{t_layer / len(edges) * 1e6:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+Measure offline PBF extraction throughput in highway ways per second.
+
+Runs on the committed fixture by default. Pass --pbf for a real extract, or
+--side to generate a larger synthetic grid first.
+
+Usage:
+    python -m benchmarks.bench_pbf [--pbf path.osm.pbf | --side 200]
+"""
+import argparse
+import os
+import tempfile
+
+from osm_extractor.pbf_source import read_pbf_network
+from benchmarks.make_pbf_fixture import FIXTURE_PATH, write_grid_pbf
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--pbf', default=None, help="PBF file to read (default: fixture)")
+    parser.add_argument('--side', type=int, default=None,
+                        help="Generate a synthetic grid PBF with this many intersections per side")
+    parser.add_argument('--network-types', nargs='+', default=['drive', 'walk', 'bike', 'all'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pbf_path = args.pbf or FIXTURE_PATH
+        if args.side:
+            pbf_path = os.path.join(tmpdir, f"grid_{args.side}.osm.pbf")
+            write_grid_pbf(pbf_path, n_side=args.side)
+
+        print(f"{os.path.basename(pbf_path)}: {os.path.getsize(pbf_path):,} bytes")
+        print(f"{'network':<8} {'ways':>8} {'kept':>8} {'ways/s':>10} {'total (s)':>10} "
+              f"{'nodes':>8} {'edges':>8}")
+        for network_type in args.network_types:
+            nodes, edges = read_pbf_network(pbf_path, network_type)
+            stats = edges.attrs['pbf_stats']
+            print(f"{network_type:<8} {stats['highway_ways_scanned']:>8,} {stats['ways_kept']:>8,} "
+                  f"{stats['ways_per_second']:>10,.0f} {stats['seconds']:>10.2f} "
+                  f"{len(nodes):>8,} {len(edges):>8,}")
+
+
+if __name__ == '__main__':
+    main()
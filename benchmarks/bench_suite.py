@@ -0,0 +1,278 @@
+"""
+End-to-end benchmark suite: every pipeline stage on reproducible networks.
+
+Runs load -> sample -> cluster -> map layer -> export on synthetic grid and
+radial networks of a given number of edges (1k to 1M) and on every
+``.osm.pbf`` extract in ``benchmarks/fixtures/``, recording wall time, CPU
+time and peak memory per stage. Everything runs offline and is seeded, so
+two reports of the same tree differ only by machine noise.
+
+Frozen real-world extracts are plain ``.osm.pbf`` files dropped into
+``benchmarks/fixtures/`` (e.g. clipped from a Geofabrik download with
+``osmium extract -b west,south,east,north``); they are picked up by name.
+
+Save a report with ``--save``, and compare a later run against it with
+``--compare``: the suite exits non-zero if any stage got slower (or used
+more memory) than the baseline by more than ``--threshold``.
+
+Usage:
+    python -m benchmarks.bench_suite [--sizes 1k 10k 100k] [--save report.json]
+    python -m benchmarks.bench_suite --compare report.json [--threshold 0.25]
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from osm_extractor.instrumentation import StageRecorder
+from osm_extractor.map_layers import network_layer
+from osm_extractor.pipeline import add_length_miles, cluster_network, write_outputs, OUTPUT_FORMATS
+from benchmarks.synthetic import grid_network, radial_network
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+NETWORKS = ("grid", "radial")
+
+# Stages compared between reports; nested clustering stages are reported
+# but not checked, as they move together with 'cluster'
+CHECKED_STAGES = ("load", "edge_store", "sample", "cluster", "map_layer", "export")
+
+# Stages faster than this in the baseline are too noisy to compare
+MIN_COMPARE_SECONDS = 0.25
+
+# Memory growth below this is ignored, whatever the ratio
+MIN_COMPARE_MB = 1.0
+
+
+def parse_size(text):
+    """Edge count from '1000', '10k' or '1m'."""
+    text = text.lower()
+    scale = {'k': 1_000, 'm': 1_000_000}.get(text[-1], 1)
+    return int(float(text.rstrip('km')) * scale)
+
+
+def synthetic_case(network, n_edges):
+    """
+    Synthetic network with roughly ``n_edges`` edges.
+
+    A grid of side n has 2n(n-1) edges; a radial network with R rings and S
+    spokes has 2RS. Radial spokes grow with the size so ring segments stay
+    a plausible street length.
+    """
+    if network == "grid":
+        n_side = max(2, int(round(np.sqrt(n_edges / 2))) + 1)
+        return grid_network(n_side)[1]
+    n_spokes = max(16, int(np.sqrt(n_edges / 2)))
+    n_rings = max(1, int(round(n_edges / (2 * n_spokes))))
+    return radial_network(n_rings, n_spokes=n_spokes, ring_meters=200.0)[1]
+
+
+def list_cases(sizes, networks, fixtures=True):
+    """(name, loader) pairs; loaders return an edges GeoDataFrame."""
+    cases = [(f"{network}-{size}", lambda network=network, size=size: synthetic_case(network, parse_size(size)))
+             for size in sizes for network in networks]
+    if fixtures:
+        from osm_extractor.pbf_source import read_pbf_network
+        for path in sorted(glob.glob(os.path.join(FIXTURE_DIR, "*.osm.pbf"))):
+            name = os.path.basename(path)[:-len(".osm.pbf")]
+            cases.append((f"pbf-{name}", lambda path=path: read_pbf_network(path)[1]))
+    return cases
+
+
+def run_case(load, n_clusters, point_spacing, backend, output_format, trace_memory=False):
+    """
+    Run every pipeline stage once.
+
+    Returns:
+    - StageRecorder holding the stage records
+    - dict of network and result sizes
+    """
+    recorder = StageRecorder(trace_memory=trace_memory, log_path=None)
+    with recorder.stage('load'):
+        edges = add_length_miles(load())
+    target_miles = edges['length_mi'].sum() / n_clusters
+    cluster_gdf, points_gdf, _ = cluster_network(edges, target_miles=target_miles,
+                                                 point_spacing=point_spacing, backend=backend,
+                                                 recorder=recorder)
+
+    edge_labels = None
+    if cluster_gdf is not None:
+        edge_labels = np.full(len(edges), -1, dtype=np.int64)
+        edge_labels[edges.index.get_indexer(points_gdf['edge_id'])] = points_gdf['cluster'].to_numpy()
+    with recorder.stage('map_layer'):
+        network_layer(edges, edge_labels)
+
+    with tempfile.TemporaryDirectory() as tmpdir, recorder.stage('export'):
+        write_outputs(tmpdir, edges, cluster_gdf, output_format)
+
+    sizes = {'edges': len(edges), 'points': len(points_gdf),
+             'clusters': 0 if cluster_gdf is None else len(cluster_gdf)}
+    return recorder, sizes
+
+
+def best_of(runs, memory_run=None):
+    """
+    Per-stage minimum times over repeated runs of the same case.
+
+    Times come from untraced runs, because tracemalloc slows stages down
+    unevenly; peak memory comes from the separate traced ``memory_run``.
+    """
+    best = {}
+    for recorder in runs:
+        for record in recorder.records:
+            key = (record['stage'], record['depth'])
+            if key not in best:
+                best[key] = {'stage': record['stage'], 'depth': record['depth'],
+                             'wall_s': record['wall_s'], 'cpu_s': record['cpu_s'], 'peak_mb': None}
+            else:
+                best[key]['wall_s'] = min(best[key]['wall_s'], record['wall_s'])
+                best[key]['cpu_s'] = min(best[key]['cpu_s'], record['cpu_s'])
+    if memory_run is not None:
+        for record in memory_run.records:
+            if (record['stage'], record['depth']) in best:
+                best[record['stage'], record['depth']]['peak_mb'] = record['peak_mb']
+    return list(best.values())
+
+
+def environment():
+    """Machine and library versions, so reports from different hosts are not mixed up."""
+    import geopandas
+    import osmnx
+    import shapely
+    import sklearn
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': commit,
+        'host': platform.node(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'geopandas': geopandas.__version__,
+        'shapely': shapely.__version__,
+        'scikit-learn': sklearn.__version__,
+        'osmnx': osmnx.__version__,
+    }
+
+
+def compare(report, baseline, threshold):
+    """
+    Stages of ``report`` that regressed against ``baseline``.
+
+    Returns:
+    - list of (case, stage, metric, baseline value, new value)
+    """
+    base = {(r['case'], r['stage']): r for r in baseline['results'] if r['depth'] == 0}
+    regressions = []
+    for record in report['results']:
+        old = base.get((record['case'], record['stage']))
+        if record['depth'] != 0 or record['stage'] not in CHECKED_STAGES or old is None:
+            continue
+        if old['wall_s'] >= MIN_COMPARE_SECONDS and record['wall_s'] > old['wall_s'] * (1 + threshold):
+            regressions.append((record['case'], record['stage'], 'wall_s', old['wall_s'], record['wall_s']))
+        old_mb, new_mb = old.get('peak_mb'), record.get('peak_mb')
+        if (old_mb is not None and new_mb is not None and new_mb - old_mb >= MIN_COMPARE_MB
+                and new_mb > old_mb * (1 + threshold)):
+            regressions.append((record['case'], record['stage'], 'peak_mb', old_mb, new_mb))
+    return regressions
+
+
+def format_report(report, baseline=None):
+    """Stage table, with the change against ``baseline`` when given."""
+    base = {}
+    if baseline is not None:
+        base = {(r['case'], r['stage'], r['depth']): r for r in baseline['results']}
+    header = (f"{'case':<16} {'edges':>9} {'stage':<18} {'wall (s)':>9} {'cpu (s)':>9} {'peak (MB)':>10}"
+              + (f" {'vs base':>8}" if baseline is not None else ""))
+    lines = [header, "-" * len(header)]
+    for record in report['results']:
+        peak = f"{record['peak_mb']:>10.1f}" if record.get('peak_mb') is not None else f"{'-':>10}"
+        line = (f"{record['case']:<16} {record['edges']:>9,} {'  ' * record['depth'] + record['stage']:<18} "
+                f"{record['wall_s']:>9.3f} {record['cpu_s']:>9.3f} {peak}")
+        old = base.get((record['case'], record['stage'], record['depth']))
+        if old is not None and old['wall_s'] > 0:
+            line += f" {record['wall_s'] / old['wall_s'] - 1:>+8.0%}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', nargs='+', default=["1k", "10k", "100k"],
+                        help="Synthetic network sizes in edges, e.g. 1k 10k 100k 1m")
+    parser.add_argument('--networks', nargs='+', choices=NETWORKS, default=list(NETWORKS))
+    parser.add_argument('--no-fixtures', action='store_true', help="Skip the .osm.pbf fixtures")
+    parser.add_argument('--clusters', type=int, default=20, help="Clusters per network")
+    parser.add_argument('--spacing', type=float, default=0.1, help="Point spacing in miles")
+    parser.add_argument('--backend', default="auto", help="Clustering backend")
+    parser.add_argument('--format', default="GeoParquet", choices=OUTPUT_FORMATS, help="Export format")
+    parser.add_argument('--repeat', type=int, default=1,
+                        help="Runs per case; the fastest time of each stage is kept")
+    parser.add_argument('--no-memory', action='store_true',
+                        help="Skip the extra traced run per case that measures peak memory")
+    parser.add_argument('--save', default=None, help="Write the report to this JSON file")
+    parser.add_argument('--compare', default=None, help="Baseline report JSON to check against")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="Allowed relative slowdown or memory growth per stage")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    report = {
+        'environment': environment(),
+        'settings': {'clusters': args.clusters, 'spacing': args.spacing, 'backend': args.backend,
+                     'format': args.format, 'repeat': args.repeat, 'trace_memory': not args.no_memory},
+        'results': [],
+    }
+    for name, load in list_cases(args.sizes, args.networks, fixtures=not args.no_fixtures):
+        runs = []
+        for _ in range(args.repeat):
+            recorder, sizes = run_case(load, args.clusters, args.spacing, args.backend, args.format)
+            runs.append(recorder)
+        memory_run = None
+        if not args.no_memory:
+            memory_run, _ = run_case(load, args.clusters, args.spacing, args.backend, args.format,
+                                     trace_memory=True)
+        for record in best_of(runs, memory_run):
+            report['results'].append({'case': name, **sizes, **record})
+        print(f"  {name}: {sizes['edges']:,} edges, {sizes['points']:,} points, "
+              f"{sizes['clusters']} clusters", flush=True)
+
+    print()
+    print(format_report(report, baseline))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved report to {args.save}")
+
+    if baseline is not None:
+        if baseline.get('settings') != report['settings']:
+            print("\nWARNING: baseline was run with different settings: "
+                  f"{baseline.get('settings')}")
+        if baseline['environment'].get('host') != report['environment']['host']:
+            print(f"\nWARNING: baseline is from host {baseline['environment'].get('host')}")
+        regressions = compare(report, baseline, args.threshold)
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%} against {args.compare}")
+        for case, stage_name, metric, old, new in regressions:
+            print(f"  REGRESSION {case} {stage_name} {metric}: {old:.3f} -> {new:.3f}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Write a synthetic street grid as an .osm.pbf file.
+
+The committed fixture ``benchmarks/fixtures/grid.osm.pbf`` was made with the
+defaults. Larger files for throughput runs can be generated with --side.
+``--changes`` also writes an .osc change file against the grid
+(``benchmarks/fixtures/grid-changes.osc`` for the defaults).
+
+Usage:
+    python -m benchmarks.make_pbf_fixture [--side 12] [--output path.osm.pbf] [--changes path.osc]
+"""
+import argparse
+import os
+
+import numpy as np
+import osmium
+
+from benchmarks.synthetic import METERS_PER_DEGREE
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "grid.osm.pbf")
+CHANGES_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "grid-changes.osc")
+
+
+def _grid(n_side, cell_meters, origin):
+    """Node ids and the degree steps between grid rows and columns."""
+    lat0 = origin[1]
+    dlat = cell_meters / METERS_PER_DEGREE
+    dlon = cell_meters / (METERS_PER_DEGREE * np.cos(np.radians(lat0)))
+    return np.arange(n_side * n_side).reshape(n_side, n_side) + 1, dlon, dlat
+
+
+def write_grid_pbf(path, n_side=12, cell_meters=150.0, origin=(-118.4, 33.9)):
+    """
+    Write an ``n_side`` x ``n_side`` grid of streets to ``path``.
+
+    Rows are residential streets with every third one primary and one-way;
+    columns alternate between residential streets, footways and service
+    driveways, so the drive/walk/bike/all filters select different ways.
+    A building outline is added as a non-highway way.
+    """
+    lon0, lat0 = origin
+    ids, dlon, dlat = _grid(n_side, cell_meters, origin)
+
+    if os.path.exists(path):
+        os.remove(path)
+    writer = osmium.SimpleWriter(path)
+    try:
+        for row in range(n_side):
+            for col in range(n_side):
+                writer.add_node(osmium.osm.mutable.Node(
+                    id=int(ids[row, col]),
+                    location=(lon0 + col * dlon, lat0 + row * dlat),
+                ))
+
+        way_id = 1
+        for row in range(n_side):
+            tags = {'highway': 'residential', 'name': f'Row {row} Street'}
+            if row % 3 == 0:
+                tags.update({'highway': 'primary', 'oneway': 'yes', 'maxspeed': '35 mph'})
+            writer.add_way(osmium.osm.mutable.Way(id=way_id, nodes=ids[row].tolist(), tags=tags))
+            way_id += 1
+        for col in range(n_side):
+            kind = col % 4
+            if kind == 1:
+                tags = {'highway': 'footway'}
+            elif kind == 3:
+                tags = {'highway': 'service', 'service': 'driveway'}
+            else:
+                tags = {'highway': 'residential', 'name': f'Column {col} Avenue'}
+            writer.add_way(osmium.osm.mutable.Way(id=way_id, nodes=ids[:, col].tolist(), tags=tags))
+            way_id += 1
+
+        # A closed non-highway way that every network type must ignore
+        corner = ids[:2, :2]
+        writer.add_way(osmium.osm.mutable.Way(
+            id=way_id,
+            nodes=[int(corner[0, 0]), int(corner[0, 1]), int(corner[1, 1]),
+                   int(corner[1, 0]), int(corner[0, 0])],
+            tags={'building': 'yes'},
+        ))
+    finally:
+        writer.close()
+
+
+def write_grid_changes(path, n_side=12, cell_meters=150.0, origin=(-118.4, 33.9)):
+    """
+    Write an .osc change file against the grid of write_grid_pbf.
+
+    One change of each kind a weekly diff brings: a moved intersection, a
+    deleted street, a street retagged out of the drive network, a new
+    connector between existing intersections, and a new cul-de-sac
+    attached half-way along a block.
+    """
+    lon0, lat0 = origin
+    ids, dlon, dlat = _grid(n_side, cell_meters, origin)
+    new_node = n_side * n_side + 1
+    new_way = 2 * n_side + 2
+
+    if os.path.exists(path):
+        os.remove(path)
+    writer = osmium.SimpleWriter(path)
+    try:
+        # Move an intersection by a fifth of a block
+        row, col = n_side // 2, n_side // 2
+        writer.add_node(osmium.osm.mutable.Node(
+            id=int(ids[row, col]), version=2,
+            location=(lon0 + (col + 0.2) * dlon, lat0 + (row + 0.2) * dlat),
+        ))
+        # A cul-de-sac from the middle of a row block, where the row crosses a footway
+        row, col = n_side - 5, 1
+        for step in (1, 2):
+            writer.add_node(osmium.osm.mutable.Node(
+                id=new_node + step - 1, version=1,
+                location=(lon0 + col * dlon, lat0 + (row + 0.3 * step) * dlat),
+            ))
+        writer.add_way(osmium.osm.mutable.Way(
+            id=new_way, version=1, nodes=[int(ids[row, col]), new_node, new_node + 1],
+            tags={'highway': 'residential', 'name': 'New Court'},
+        ))
+        # A diagonal connector between two existing intersections
+        writer.add_way(osmium.osm.mutable.Way(
+            id=new_way + 1, version=1, nodes=[int(ids[2, 2]), int(ids[3, 4])],
+            tags={'highway': 'tertiary', 'name': 'Diagonal Road'},
+        ))
+        # A street turned into a footway, and a street removed
+        row = 4
+        writer.add_way(osmium.osm.mutable.Way(
+            id=row + 1, version=2, nodes=ids[row].tolist(),
+            tags={'highway': 'footway', 'name': f'Row {row} Street'},
+        ))
+        # Way ids: rows 1..n_side, then columns
+        writer.add_way(osmium.osm.mutable.Way(id=2 * n_side - 3, version=2, visible=False, nodes=[]))
+    finally:
+        writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--side', type=int, default=12, help="Intersections per side")
+    parser.add_argument('--output', default=FIXTURE_PATH)
+    parser.add_argument('--changes', nargs='?', const=CHANGES_PATH, default=None,
+                        help="Also write an .osc change file (default path: the fixture's)")
+    args = parser.parse_args()
+    write_grid_pbf(args.output, n_side=args.side)
+    print(f"Wrote {args.output} ({os.path.getsize(args.output):,} bytes)")
+    if args.changes:
+        write_grid_changes(args.changes, n_side=args.side)
+        print(f"Wrote {args.changes} ({os.path.getsize(args.changes):,} bytes)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Synthetic road networks for offline benchmarks.
+
+The networks mimic the ``edges`` frame returned by ``ox.graph_to_gdfs``:
+EPSG:4326 LineStrings indexed by ``(u, v, key)`` with a ``length`` column in
+meters and a ``highway`` class.
+"""
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+# Roughly meters per degree of latitude
+METERS_PER_DEGREE = 111_320.0
+
+
+def grid_network(n_side, cell_meters=200.0, origin=(-118.4, 33.9), seed=0):
+    """
+    Build a square street grid with ``n_side`` x ``n_side`` intersections.
+
+    Parameters:
+    - n_side: number of intersections along each side
+    - cell_meters: block length in meters
+    - origin: (lon, lat) of the south-west corner
+    - seed: random seed for the highway class assignment
+
+    Returns:
+    - (nodes, edges) GeoDataFrames in EPSG:4326
+    """
+    lon0, lat0 = origin
+    dlat = cell_meters / METERS_PER_DEGREE
+    dlon = cell_meters / (METERS_PER_DEGREE * np.cos(np.radians(lat0)))
+
+    ids = np.arange(n_side * n_side).reshape(n_side, n_side)
+    rows, cols = np.divmod(ids.ravel(), n_side)
+    xs = lon0 + cols * dlon
+    ys = lat0 + rows * dlat
+
+    # Horizontal then vertical segments between neighbouring intersections
+    u = np.concatenate([ids[:, :-1].ravel(), ids[:-1, :].ravel()])
+    v = np.concatenate([ids[:, 1:].ravel(), ids[1:, :].ravel()])
+
+    return _build_frames(xs, ys, u, v, seed)
+
+
+def radial_network(n_rings, n_spokes=16, ring_meters=300.0,
+                   origin=(-118.4, 33.9), seed=0):
+    """
+    Build a ring-and-spoke network around ``origin``.
+
+    Parameters:
+    - n_rings: number of concentric rings
+    - n_spokes: number of radial spokes
+    - ring_meters: distance between rings in meters
+    - origin: (lon, lat) of the center
+    - seed: random seed for the highway class assignment
+
+    Returns:
+    - (nodes, edges) GeoDataFrames in EPSG:4326
+    """
+    lon0, lat0 = origin
+    angles = np.linspace(0, 2 * np.pi, n_spokes, endpoint=False)
+    radii = np.arange(1, n_rings + 1) * ring_meters
+
+    ids = np.arange(n_rings * n_spokes).reshape(n_rings, n_spokes) + 1
+    r = np.repeat(radii, n_spokes)
+    a = np.tile(angles, n_rings)
+    xs = np.concatenate([[lon0], lon0 + r * np.cos(a) / (METERS_PER_DEGREE * np.cos(np.radians(lat0)))])
+    ys = np.concatenate([[lat0], lat0 + r * np.sin(a) / METERS_PER_DEGREE])
+
+    # Ring segments, spokes between rings, and spokes from the center
+    u = np.concatenate([ids.ravel(), ids[:-1].ravel(), np.zeros(n_spokes, dtype=int)])
+    v = np.concatenate([np.roll(ids, -1, axis=1).ravel(), ids[1:].ravel(), ids[0]])
+
+    return _build_frames(xs, ys, u, v, seed)
+
+
+def _build_frames(xs, ys, u, v, seed):
+    rng = np.random.default_rng(seed)
+    node_ids = np.arange(len(xs))
+
+    nodes = gpd.GeoDataFrame(
+        {'x': xs, 'y': ys},
+        geometry=shapely.points(xs, ys),
+        index=pd.Index(node_ids, name='osmid'),
+        crs='EPSG:4326',
+    )
+
+    coords = np.stack([
+        np.column_stack([xs[u], ys[u]]),
+        np.column_stack([xs[v], ys[v]]),
+    ], axis=1)
+    geoms = shapely.linestrings(coords)
+    highway = rng.choice(['residential', 'tertiary', 'secondary', 'primary'],
+                         size=len(u), p=[0.7, 0.15, 0.1, 0.05])
+
+    edges = gpd.GeoDataFrame(
+        {'osmid': np.arange(len(u)), 'highway': highway},
+        geometry=geoms,
+        index=pd.MultiIndex.from_arrays([u, v, np.zeros(len(u), dtype=int)],
+                                        names=['u', 'v', 'key']),
+        crs='EPSG:4326',
+    )
+    edges['length'] = edges.geometry.to_crs(edges.estimate_utm_crs()).length
+
+    return nodes, edges
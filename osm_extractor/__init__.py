@@ -0,0 +1,9 @@
+"""
+Road network analysis helpers used by the OSM Road Network Extractor app.
+
+The modules in this package are free of Streamlit calls so they can be
+imported from benchmarks and scripts as well as from the app.
+"""
+
+# 1 mile = 1609.34 meters
+METERS_PER_MILE = 1609.34
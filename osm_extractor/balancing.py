@@ -0,0 +1,333 @@
+"""
+Capacitated mileage balancing of edge clusters.
+
+K-means only balances clusters loosely. The pass in this module moves
+boundary edges (edges touching a node shared with another cluster) between
+adjacent clusters until every cluster is within a tolerance of the target
+mileage, or no improving move is left. An edge is never moved if that
+would split the rest of its cluster into disconnected pieces.
+"""
+import heapq
+from collections import defaultdict, deque
+
+import numpy as np
+import shapely
+
+# Default allowed overshoot of target miles per cluster (15%)
+BALANCE_TOLERANCE = 0.15
+
+
+def edge_endpoints(edges_gdf):
+    """
+    Return integer start/end node ids for every edge.
+
+    Uses the ``u``/``v`` levels of an osmnx edge index when present,
+    otherwise matches line endpoints by coordinate.
+    """
+    index = edges_gdf.index
+    if index.nlevels > 1 and 'u' in index.names and 'v' in index.names:
+        nodes = np.concatenate([index.get_level_values('u').to_numpy(),
+                                index.get_level_values('v').to_numpy()])
+        _, codes = np.unique(nodes, return_inverse=True)
+    else:
+        geoms = edges_gdf.geometry.to_numpy()
+        starts = shapely.get_coordinates(shapely.get_point(geoms, 0))
+        ends = shapely.get_coordinates(shapely.get_point(geoms, -1))
+        nodes = np.round(np.concatenate([starts, ends]), 7)
+        _, codes = np.unique(nodes, axis=0, return_inverse=True)
+
+    # Compact node ids 0..n_nodes-1
+    codes = codes.ravel()
+    return codes[:len(edges_gdf)], codes[len(edges_gdf):]
+
+
+def mileage_balance(cluster_miles, target_miles):
+    """
+    Summarize how evenly mileage is spread across clusters.
+
+    Returns a dict with the min/max cluster miles, the max cluster size as a
+    multiple of the target, and the coefficient of variation.
+    """
+    cluster_miles = np.asarray(cluster_miles, dtype=float)
+    if len(cluster_miles) == 0:
+        return {'min_miles': 0.0, 'max_miles': 0.0, 'max_over_target': 0.0, 'cv': 0.0}
+    mean = cluster_miles.mean()
+    return {
+        'min_miles': float(cluster_miles.min()),
+        'max_miles': float(cluster_miles.max()),
+        'max_over_target': float(cluster_miles.max() / target_miles) if target_miles else 0.0,
+        'cv': float(cluster_miles.std() / mean) if mean > 0 else 0.0,
+    }
+
+
+def balance_cluster_mileage(edge_u, edge_v, edge_miles, labels, target_miles,
+                            tolerance=BALANCE_TOLERANCE, max_moves=None):
+    """
+    Move boundary edges between adjacent clusters to enforce a mileage cap.
+
+    Each cluster should end up at or below ``target_miles * (1 + tolerance)``
+    and no lighter than ``(1 - tolerance)`` of the mean cluster mileage. Every
+    move shifts one edge from a heavier to a lighter neighbouring cluster, so
+    the sum of squared cluster miles strictly decreases and the pass ends.
+
+    For every pair of adjacent clusters ``(a, b)`` a heap holds a's edges
+    that touch b, shortest first. For a given neighbour the shortest such
+    edge is always the best one to move, so picking a move only looks at the
+    top of one heap per neighbouring cluster. A move pushes only the edges
+    that share an end node with the moved edge; entries that stop being valid
+    are dropped lazily when they reach the top of their heap.
+
+    Edges whose removal would disconnect the rest of their cluster (bridges
+    of the cluster's road graph) are skipped, so balancing never adds a
+    piece to a cluster: a contiguous cluster stays contiguous.
+
+    Parameters:
+    - edge_u, edge_v: integer end node ids per edge (see edge_endpoints)
+    - edge_miles: length of each edge in miles
+    - labels: cluster label per edge, -1 for edges not in any cluster
+    - target_miles: target miles per cluster
+    - tolerance: allowed relative deviation
+    - max_moves: safety cap on the number of moves (default 10 x edges)
+
+    Returns:
+    - new array of labels per edge
+    - number of edges moved
+    """
+    labels = np.asarray(labels).copy()
+    edge_miles = np.asarray(edge_miles, dtype=float)
+    assigned = labels >= 0
+    if not assigned.any():
+        return labels, 0
+
+    n_clusters = int(labels.max()) + 1
+    miles = np.bincount(labels[assigned], weights=edge_miles[assigned], minlength=n_clusters)
+    sizes = np.bincount(labels[assigned], minlength=n_clusters)
+    upper = target_miles * (1 + tolerance)
+    lower = miles.sum() / n_clusters * (1 - tolerance)
+    if max_moves is None:
+        max_moves = 10 * len(labels)
+
+    # Incidence lists: edges touching each node
+    n_nodes = int(max(edge_u.max(), edge_v.max())) + 1
+    endpoints = np.concatenate([edge_u, edge_v])
+    edge_of_end = np.concatenate([np.arange(len(edge_u)), np.arange(len(edge_v))])
+    order = np.argsort(endpoints, kind='stable')
+    splits = np.cumsum(np.bincount(endpoints, minlength=n_nodes))[:-1]
+    incident = np.split(edge_of_end[order], splits)
+
+    # Plain lists: the loops below look up single edges
+    label_of, u_of, v_of, length_of = labels.tolist(), edge_u.tolist(), edge_v.tolist(), edge_miles.tolist()
+    incident = [part.tolist() for part in incident]
+
+    # Per node: cluster -> number of incident edges in that cluster
+    node_clusters = [dict() for _ in range(n_nodes)]
+    for e in np.flatnonzero(assigned).tolist():
+        for node in (u_of[e], v_of[e]):
+            counts = node_clusters[node]
+            counts[label_of[e]] = counts.get(label_of[e], 0) + 1
+
+    # (a, b) -> heap of (miles, edge) for edges of a touching cluster b;
+    # neighbours[a] holds every cluster b that may have such a heap
+    candidates = defaultdict(list)
+    neighbours = [set() for _ in range(n_clusters)]
+
+    def add_candidate(e, a, b):
+        heapq.heappush(candidates[a, b], (length_of[e], e))
+        neighbours[a].add(b)
+        neighbours[b].add(a)
+
+    for e in np.flatnonzero(assigned).tolist():
+        a = label_of[e]
+        for b in set(node_clusters[u_of[e]]) | set(node_clusters[v_of[e]]):
+            if b != a:
+                candidates[a, b].append((length_of[e], e))
+                neighbours[a].add(b)
+    for heap in candidates.values():
+        heapq.heapify(heap)
+
+    def cluster_neighbours(f, a, e):
+        # Edges of cluster a sharing an end node with f, other than e
+        return [g for node in (u_of[f], v_of[f]) for g in incident[node] if g != e and label_of[g] == a]
+
+    def splits(e, a):
+        # True if cluster a without e falls apart. The rest of a touches e at
+        # its two end nodes; the edges at each end are connected through that
+        # node, so a splits only when the two ends are not connected without e.
+        # Searches from both ends in turn and stops when either runs out.
+        ends = [[g for g in incident[node] if g != e and label_of[g] == a] for node in (u_of[e], v_of[e])]
+        if not ends[0] or not ends[1] or u_of[e] == v_of[e]:
+            return False
+        seen = [set(ends[0]), set(ends[1])]
+        if seen[0] & seen[1]:
+            return False
+        queues = [deque(ends[0]), deque(ends[1])]
+        side = 0
+        while True:
+            if not queues[side]:
+                return True
+            for g in cluster_neighbours(queues[side].popleft(), a, e):
+                if g in seen[1 - side]:
+                    return False
+                if g not in seen[side]:
+                    seen[side].add(g)
+                    queues[side].append(g)
+            side = 1 - side
+
+    # Edges found to split their cluster, valid until that cluster changes
+    version = [0] * n_clusters
+    known_splits = {}
+
+    def shortest(a, b, limit):
+        # Shortest edge of a touching b that is shorter than ``limit`` and
+        # can leave a without splitting it; stale entries are dropped
+        heap = candidates.get((a, b))
+        held = []
+        found = None
+        while heap and heap[0][0] < limit:
+            length, e = heap[0]
+            if not (label_of[e] == a and (b in node_clusters[u_of[e]] or b in node_clusters[v_of[e]])):
+                heapq.heappop(heap)
+            elif known_splits.get(e) == (a, version[a]) or splits(e, a):
+                known_splits[e] = (a, version[a])
+                held.append(heapq.heappop(heap))
+            else:
+                found = (length, e)
+                break
+        for entry in held:
+            heapq.heappush(heap, entry)
+        return found
+
+    def first(a, b):
+        # Shortest edge of a touching b, split check aside; drops stale entries
+        heap = candidates.get((a, b))
+        while heap:
+            length, e = heap[0]
+            if label_of[e] == a and (b in node_clusters[u_of[e]] or b in node_clusters[v_of[e]]):
+                return length
+            heapq.heappop(heap)
+        return None
+
+    def pick(options, key_of):
+        # options: (key, giver, receiver, limit) from the shortest edge of each
+        # pair, a lower bound of the pair's real key. Split checks run in key
+        # order and stop at the first pair whose best movable edge still wins.
+        options = [(*option, -1) for option in options]
+        heapq.heapify(options)
+        while options:
+            key, giver, receiver, limit, e = heapq.heappop(options)
+            if e < 0:
+                top = shortest(giver, receiver, limit)
+                if top is None:
+                    continue
+                length, e = top
+                key = key_of(giver, receiver, length)
+                if options and options[0] < (key, giver, receiver, limit, e):
+                    heapq.heappush(options, (key, giver, receiver, limit, e))
+                    continue
+            return key, e, giver, receiver
+        return None
+
+    def forget(a, b):
+        # a and b no longer share a node (a touches b iff b touches a)
+        neighbours[a].discard(b)
+        neighbours[b].discard(a)
+
+    def push_key(giver, receiver, length):
+        new_miles = miles[receiver] + length
+        return (new_miles > upper, new_miles)
+
+    def pull_key(giver, receiver, length):
+        return (-miles[giver], length)
+
+    def best_push(a):
+        # Give one of a's boundary edges to its lightest neighbour
+        options = []
+        for b in list(neighbours[a]):
+            length = first(a, b)
+            if length is None:
+                forget(a, b)
+            elif length < miles[a] - miles[b]:
+                options.append((push_key(a, b, length), a, b, miles[a] - miles[b]))
+        return pick(options, push_key)
+
+    def best_pull(a):
+        # Take a boundary edge from a's heaviest neighbour
+        options = []
+        for b in list(neighbours[a]):
+            length = first(b, a)
+            if length is None:
+                forget(a, b)
+            elif sizes[b] > 1 and length < miles[b] - miles[a]:
+                options.append((pull_key(b, a, length), b, a, miles[b] - miles[a]))
+        return pick(options, pull_key)
+
+    def move(e, src, dst):
+        label_of[e] = dst
+        version[src] += 1
+        version[dst] += 1
+        miles[src] -= length_of[e]
+        miles[dst] += length_of[e]
+        sizes[src] -= 1
+        sizes[dst] += 1
+        for node in (u_of[e], v_of[e]):
+            counts = node_clusters[node]
+            counts[src] -= 1
+            if counts[src] == 0:
+                del counts[src]
+            reached = dst not in counts
+            counts[dst] = counts.get(dst, 0) + 1
+            # Edges at a node dst just reached now touch dst; only edges
+            # sharing an end node with e gain a neighbouring cluster
+            if reached:
+                for f in incident[node]:
+                    if label_of[f] >= 0 and label_of[f] != dst:
+                        add_candidate(f, label_of[f], dst)
+        for node in (u_of[e], v_of[e]):
+            for b in node_clusters[node]:
+                if b != dst:
+                    add_candidate(e, dst, b)
+
+    def excess(c):
+        return max(miles[c] - upper, lower - miles[c])
+
+    # Clusters by decreasing excess; entries left behind by a move or by a
+    # cluster getting stuck are skipped when they reach the top
+    queue = [(-excess(c), c) for c in range(n_clusters)]
+    heapq.heapify(queue)
+
+    # A cluster is 'stuck' when it has no improving move; moves elsewhere
+    # can free it again, so stuck flags are cleared after every pass that
+    # moved something
+    stuck = np.zeros(n_clusters, dtype=bool)
+    n_moves = 0
+    moves_at_pass_start = 0
+    while n_moves < max_moves:
+        while queue and (stuck[queue[0][1]] or -queue[0][0] != excess(queue[0][1])):
+            heapq.heappop(queue)
+        if not queue or -queue[0][0] <= 0:
+            if n_moves == moves_at_pass_start or not stuck.any():
+                break
+            stuck[:] = False
+            moves_at_pass_start = n_moves
+            queue = [(-excess(c), c) for c in range(n_clusters)]
+            heapq.heapify(queue)
+            continue
+        a = queue[0][1]
+
+        if miles[a] > upper:
+            candidate = best_push(a) if sizes[a] > 1 else None
+        else:
+            candidate = best_pull(a)
+
+        if candidate is None:
+            stuck[a] = True
+            continue
+
+        _, e, src, dst = candidate
+        move(e, src, dst)
+        stuck[src] = stuck[dst] = False
+        for c in (src, dst):
+            heapq.heappush(queue, (-excess(c), c))
+        n_moves += 1
+
+    return np.array(label_of, dtype=labels.dtype), n_moves
@@ -0,0 +1,270 @@
+"""
+Headless batch extraction from a manifest of places, bboxes and polygons.
+
+Usage:
+    python -m osm_extractor.batch manifest.json [--out outputs] [--workers 4]
+
+The manifest is a JSON list of jobs, or an object with a ``jobs`` list and
+``defaults`` applied to every job::
+
+    {
+      "defaults": {"network_type": "drive", "cluster": true, "target_miles": 50,
+                   "output_format": "GeoParquet"},
+      "jobs": [
+        {"name": "el-segundo", "place": "El Segundo, California, USA"},
+        {"name": "downtown", "bbox": {"north": 34.06, "south": 34.03,
+                                      "east": -118.23, "west": -118.27}},
+        {"name": "district-4", "polygon": "boundaries/district4.geojson",
+         "network_type": "walk"}
+      ]
+    }
+
+Job options: ``network_type``, ``pbf`` (local .osm.pbf path), ``tile_km``,
+``tile_workers``, ``cluster``, ``target_miles``, ``point_spacing``,
+``sample_budget``, ``backend``, ``balance_tolerance``, ``polygon_style``
+and ``output_format``. Relative paths are resolved against the manifest's
+directory. Outputs go to ``<out>/<name>/``.
+
+A ``polygon`` file with several polygon features is extracted feature by
+feature and clustered per feature; every road carries its ``feature_id``
+(the row number, or the value of the job's ``id_column``).
+
+Per-stage wall time, CPU time and peak memory of every job can be appended
+to a JSON-lines file with ``--perf-log`` (or ``OSM_EXTRACTOR_PERF_LOG``).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import geopandas as gpd
+
+from osm_extractor.balancing import BALANCE_TOLERANCE
+from osm_extractor.features import boundary_features, extract_features
+from osm_extractor.instrumentation import StageRecorder, DEFAULT_LOG_PATH
+from osm_extractor.network_cache import NetworkCache, DEFAULT_CACHE_DIR
+from osm_extractor.pipeline import (extract_network, add_length_miles, cluster_network,
+                                    write_outputs, OUTPUT_FORMATS)
+
+STAGES = ("extract", "edge_store", "sample", "cluster", "export")
+
+JOB_DEFAULTS = {
+    'network_type': "drive",
+    'pbf': None,
+    'tile_km': None,
+    'tile_workers': 1,
+    'cluster': False,
+    'target_miles': 50,
+    'point_spacing': 0.5,
+    'sample_budget': None,
+    'backend': "auto",
+    'balance_tolerance': BALANCE_TOLERANCE,
+    'polygon_style': "convex",
+    'output_format': "GeoJSON",
+    'id_column': None,
+}
+
+
+def load_manifest(path):
+    """
+    Read a manifest file into a list of fully specified job dicts.
+
+    Every job gets a unique ``name`` and exactly one of ``place``, ``bbox``
+    or ``polygon``; file paths are made absolute.
+    """
+    with open(path) as f:
+        manifest = json.load(f)
+    if isinstance(manifest, list):
+        manifest = {'jobs': manifest}
+    base_dir = os.path.dirname(os.path.abspath(path))
+    defaults = {**JOB_DEFAULTS, **manifest.get('defaults', {})}
+
+    jobs = []
+    for i, entry in enumerate(manifest['jobs']):
+        job = {**defaults, **entry}
+        queries = [key for key in ('place', 'bbox', 'polygon') if job.get(key) is not None]
+        if len(queries) != 1:
+            raise ValueError(f"Job {i} needs exactly one of place, bbox or polygon")
+        if job['output_format'] not in OUTPUT_FORMATS:
+            raise ValueError(f"Job {i}: unknown output_format '{job['output_format']}'")
+        for key in ('polygon', 'pbf'):
+            if job.get(key):
+                job[key] = os.path.join(base_dir, job[key])
+        name = job.get('name') or job.get('place') or f"job-{i}"
+        job['name'] = re.sub(r'[^\w.-]+', '_', name).strip('_')
+        jobs.append(job)
+
+    names = [job['name'] for job in jobs]
+    duplicates = {name for name in names if names.count(name) > 1}
+    if duplicates:
+        raise ValueError(f"Duplicate job names in manifest: {', '.join(sorted(duplicates))}")
+    return jobs
+
+
+def _read_boundary(path, id_column=None):
+    """Polygon features of a boundary file, in EPSG:4326 (see boundary_features)."""
+    return boundary_features(gpd.read_file(path), id_column)
+
+
+def run_job(job, out_dir, cache_dir=DEFAULT_CACHE_DIR, perf_log=DEFAULT_LOG_PATH, trace_memory=False):
+    """
+    Run extract -> points -> cluster -> export for one manifest job.
+
+    Runs in a worker process; never raises, so one failing job does not
+    stop the batch.
+
+    Parameters:
+    - job: job dict from load_manifest
+    - out_dir: directory receiving the job's sub-directory
+    - cache_dir: network cache directory
+    - perf_log: optional JSON-lines file for the job's stage records
+    - trace_memory: also record peak memory per stage
+
+    Returns:
+    - dict with the job name, status, per-stage seconds, detailed stage
+      records, counts, output files and any notes or error message
+    """
+    result = {'name': job['name'], 'status': "ok", 'timings': {}, 'notes': [], 'files': []}
+    recorder = StageRecorder(trace_memory=trace_memory, log_path=perf_log, job=job['name'],
+                             network_type=job['network_type'])
+    try:
+        query = {}
+        features = None
+        if job.get('place'):
+            query['place'] = job['place']
+        elif job.get('bbox'):
+            bbox = job['bbox']
+            query['bbox'] = ((bbox['north'], bbox['south'], bbox['east'], bbox['west'])
+                             if isinstance(bbox, dict) else tuple(bbox))
+        else:
+            features = _read_boundary(job['polygon'], job['id_column'])
+            if len(features) == 1:
+                query['polygon'] = features.geometry.iloc[0]
+                query['description'] = f"polygon: {os.path.basename(job['polygon'])} ({job['network_type']})"
+                features = None
+        with recorder.stage('extract'):
+            options = dict(pbf_path=job['pbf'], cache=NetworkCache(cache_dir), tile_km=job['tile_km'],
+                           max_workers=job['tile_workers'], recorder=recorder)
+            if features is None:
+                (nodes, edges), cached = extract_network(job['network_type'], **options, **query)
+            else:
+                (nodes, edges), cached = extract_features(features, job['network_type'], **options)
+            add_length_miles(edges)
+        result.update(cached=cached, nodes=len(nodes), edges=len(edges),
+                      miles=float(edges['length_mi'].sum()))
+
+        cluster_gdf = None
+        if job['cluster']:
+            cluster_gdf, _, notes = cluster_network(
+                edges, target_miles=job['target_miles'], point_spacing=job['point_spacing'],
+                backend=job['backend'], balance_tolerance=job['balance_tolerance'],
+                polygon_style=job['polygon_style'], sample_budget=job['sample_budget'], recorder=recorder
+            )
+            result['notes'].extend(notes)
+            result['clusters'] = 0 if cluster_gdf is None else len(cluster_gdf)
+
+        with recorder.stage('export'):
+            result['files'] = write_outputs(os.path.join(out_dir, job['name']), edges, cluster_gdf,
+                                            job['output_format'])
+    except Exception as error:
+        result['status'] = "failed"
+        result['error'] = f"{type(error).__name__}: {error}"
+        result['traceback'] = traceback.format_exc()
+    result['timings'] = recorder.totals(depth=0)
+    result['stages'] = recorder.table()
+    recorder.flush()
+    return result
+
+
+def run_batch(jobs, out_dir, workers=None, cache_dir=DEFAULT_CACHE_DIR, progress=None,
+              perf_log=DEFAULT_LOG_PATH, trace_memory=False):
+    """
+    Run manifest jobs in parallel worker processes.
+
+    Parameters:
+    - jobs: job dicts from load_manifest
+    - out_dir: directory receiving one sub-directory per job
+    - workers: number of worker processes (default: CPU count)
+    - cache_dir: network cache directory shared by the workers
+    - progress: optional callback(result) called as each job finishes
+    - perf_log, trace_memory: see run_job
+
+    Returns:
+    - list of run_job results, in manifest order
+    """
+    results = [None] * len(jobs)
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = {pool.submit(run_job, job, out_dir, cache_dir, perf_log, trace_memory): i for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            if progress:
+                progress(results[futures[future]])
+    return results
+
+
+def format_summary(results, wall_seconds):
+    """Per-job, per-stage timing table followed by stage totals."""
+    header = f"{'job':<24} {'status':<7} {'edges':>9} {'clusters':>9} " + \
+             " ".join(f"{stage + ' (s)':>14}" for stage in STAGES) + f" {'total (s)':>10}"
+    lines = [header, "-" * len(header)]
+    totals = dict.fromkeys(STAGES, 0.0)
+    for result in results:
+        timings = result['timings']
+        for stage in STAGES:
+            totals[stage] += timings.get(stage, 0.0)
+        cells = " ".join(f"{timings[stage]:>14.2f}" if stage in timings else f"{'-':>14}" for stage in STAGES)
+        lines.append(f"{result['name'][:24]:<24} {result['status']:<7} {result.get('edges', 0):>9,} "
+                     f"{result.get('clusters', '-'):>9} {cells} {sum(timings.values()):>10.2f}")
+    lines.append("-" * len(header))
+    lines.append(f"{'sum over jobs':<24} {'':<7} {'':>9} {'':>9} "
+                 + " ".join(f"{totals[stage]:>14.2f}" for stage in STAGES)
+                 + f" {sum(totals.values()):>10.2f}")
+    failed = sum(result['status'] != "ok" for result in results)
+    lines.append(f"{len(results)} jobs, {failed} failed, {wall_seconds:.1f}s wall clock")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('manifest', help="JSON manifest of jobs")
+    parser.add_argument('--out', default="outputs", help="Output directory (default: outputs)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Parallel worker processes (default: CPU count)")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="Network cache directory")
+    parser.add_argument('--summary-json', default=None,
+                        help="Also write the per-job results to this JSON file")
+    parser.add_argument('--perf-log', default=DEFAULT_LOG_PATH,
+                        help="Append per-stage timing records to this JSON-lines file")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="Record peak memory per stage (slower)")
+    args = parser.parse_args(argv)
+
+    jobs = load_manifest(args.manifest)
+    print(f"Running {len(jobs)} jobs from {args.manifest}")
+
+    def report(result):
+        status = "done" if result['status'] == "ok" else f"FAILED ({result['error']})"
+        print(f"  {result['name']}: {status}", flush=True)
+        for note in result['notes']:
+            print(f"    note: {note}")
+
+    start = time.perf_counter()
+    results = run_batch(jobs, args.out, workers=args.workers, cache_dir=args.cache_dir, progress=report,
+                        perf_log=args.perf_log, trace_memory=args.trace_memory)
+    print()
+    print(format_summary(results, time.perf_counter() - start))
+
+    if args.summary_json:
+        with open(args.summary_json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 1 if any(result['status'] != "ok" for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
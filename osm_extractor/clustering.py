@@ -0,0 +1,371 @@
+"""
+Clustering of sampled road points into mileage-balanced service areas.
+"""
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from osm_extractor.balancing import (
+    BALANCE_TOLERANCE,
+    balance_cluster_mileage,
+    mileage_balance,
+)
+from osm_extractor.edge_store import edge_store
+from osm_extractor.instrumentation import stage
+from osm_extractor.projection import projected_geometry
+
+# Above this many sample points the 'auto' backend switches from exact
+# KMeans to MiniBatchKMeans
+MINIBATCH_THRESHOLD = 100_000
+
+# Rows per mini-batch when fitting MiniBatchKMeans
+MINIBATCH_SIZE = 4096
+
+CLUSTERING_BACKENDS = ("auto", "kmeans", "minibatch", "graph")
+
+POLYGON_STYLES = ("convex", "concave", "road_buffer")
+
+# Buffer around cluster polygons, in meters
+HULL_BUFFER_METERS = 100
+
+# Concave hull tightness (0 = tightest, 1 = convex hull)
+CONCAVE_HULL_RATIO = 0.3
+
+
+def select_clustering_backend(n_points, backend="auto"):
+    """
+    Resolve the clustering backend for a sample of ``n_points`` points.
+
+    'auto' picks exact KMeans for small inputs and MiniBatchKMeans once the
+    sample exceeds MINIBATCH_THRESHOLD rows. The 'graph' backend is only
+    used when asked for explicitly.
+    """
+    if backend not in CLUSTERING_BACKENDS:
+        raise ValueError(f"Unknown clustering backend '{backend}'. "
+                         f"Choose one of: {', '.join(CLUSTERING_BACKENDS)}")
+    if backend == "auto":
+        return "minibatch" if n_points > MINIBATCH_THRESHOLD else "kmeans"
+    return backend
+
+
+def fit_cluster_labels(coords, sample_weights, n_clusters, backend="auto"):
+    """
+    Run weighted k-means on projected coordinates.
+
+    Parameters:
+    - coords: (N, 2) array of projected coordinates
+    - sample_weights: per-point weights (road miles)
+    - n_clusters: number of clusters
+    - backend: 'auto', 'kmeans' or 'minibatch'
+
+    Returns:
+    - array of cluster labels, one per point
+    - dict with the chosen backend, iteration count and inertia
+    """
+    # scikit-learn (and the scipy it loads) is imported on the first fit
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+
+    backend = select_clustering_backend(len(coords), backend)
+
+    if backend == "kmeans":
+        model = KMeans(n_clusters=n_clusters, random_state=42, n_init=50, max_iter=1000)
+    else:
+        # Fits incrementally over random mini-batches of the sample instead
+        # of running every restart over the full array
+        model = MiniBatchKMeans(
+            n_clusters=n_clusters,
+            random_state=42,
+            batch_size=MINIBATCH_SIZE,
+            init_size=min(len(coords), max(3 * MINIBATCH_SIZE, 3 * n_clusters)),
+            n_init=3,
+            max_iter=100,
+        )
+
+    labels = model.fit_predict(coords, sample_weight=sample_weights)
+
+    fit_info = {
+        'backend': backend,
+        'n_iter': int(model.n_iter_),
+        'inertia': float(model.inertia_),
+    }
+    return labels, fit_info
+
+
+def weighted_inertia(coords, sample_weights, labels):
+    """Weighted sum of squared distances of points to their cluster centroid."""
+    n_labels = int(labels.max()) + 1
+    total = np.bincount(labels, weights=sample_weights, minlength=n_labels)
+    total[total == 0] = 1
+    centroids = np.column_stack([
+        np.bincount(labels, weights=coords[:, dim] * sample_weights, minlength=n_labels) / total
+        for dim in range(coords.shape[1])
+    ])
+    return float((sample_weights * ((coords - centroids[labels]) ** 2).sum(axis=1)).sum())
+
+
+def edge_cluster_labels(edge_positions, point_labels, n_edges, weights=None):
+    """
+    Assign each edge the cluster holding most of its length: the
+    length-weighted majority of its sample points.
+
+    Parameters:
+    - edge_positions: positional index of the source edge for every point
+    - point_labels: cluster label for every point
+    - n_edges: total number of edges
+    - weights: length of edge every point stands for (default: equal
+      weights, a majority by point count)
+
+    Returns:
+    - array of cluster labels per edge, -1 for edges without points
+    """
+    n_labels = int(point_labels.max()) + 1
+    pairs = edge_positions.astype(np.int64) * n_labels + point_labels
+    pair_values, pair_index = np.unique(pairs, return_inverse=True)
+    pair_weights = np.bincount(pair_index, weights=weights, minlength=len(pair_values))
+    pair_edges, pair_labels = np.divmod(pair_values, n_labels)
+
+    # Sort by edge, then by descending weight, and keep the first per edge;
+    # ties go to the lowest cluster label
+    order = np.lexsort((-pair_weights, pair_edges))
+    pair_edges, pair_labels = pair_edges[order], pair_labels[order]
+    first = np.r_[True, pair_edges[1:] != pair_edges[:-1]]
+
+    labels = np.full(n_edges, -1, dtype=np.int64)
+    labels[pair_edges[first]] = pair_labels[first]
+    return labels
+
+
+def edge_assignment_table(store, edge_labels, edge_positions):
+    """
+    One row per clustered edge with its cluster, miles, sample point count
+    and highway class.
+
+    Parameters:
+    - store: EdgeStore of the road network
+    - edge_labels: cluster label per edge (-1 for unassigned edges)
+    - edge_positions: positional index of the source edge for every point
+
+    Returns:
+    - DataFrame indexed like the edges, unassigned edges dropped
+    """
+    table = pd.DataFrame({
+        'cluster': edge_labels,
+        'length_mi': store.length_mi,
+        'num_points': np.bincount(edge_positions, minlength=len(store)),
+        'highway': store.highway,
+    }, index=store.index)
+    return table[table['cluster'] >= 0]
+
+
+def cluster_statistics(assignments, n_clusters):
+    """
+    Per-cluster miles, edge count, point count and miles by highway class.
+
+    A single groupby over (cluster, highway) feeds both the totals and the
+    highway breakdown.
+
+    Returns:
+    - DataFrame with one row per cluster id in ``range(n_clusters)``
+    """
+    by_class = assignments.groupby(['cluster', 'highway'], observed=True).agg(
+        total_miles=('length_mi', 'sum'),
+        num_edges=('length_mi', 'size'),
+        num_points=('num_points', 'sum'),
+    )
+    totals = by_class.groupby(level='cluster').sum()
+    breakdown = by_class['total_miles'].unstack(fill_value=0.0).add_prefix('miles_')
+
+    stats = totals.join(breakdown).reindex(range(n_clusters), fill_value=0)
+    stats.index.name = 'cluster_id'
+    return stats.reset_index()
+
+
+def build_cluster_polygons(store, edge_labels, cluster_ids, style="convex",
+                           buffer_meters=HULL_BUFFER_METERS):
+    """
+    Build one polygon per cluster from the projected coordinates of its roads.
+
+    Edges are grouped by cluster label once and every polygon is built in a
+    single vectorized Shapely call, straight from the edge store's
+    coordinate buffer.
+
+    Parameters:
+    - store: EdgeStore of the road network
+    - edge_labels: cluster label per edge (-1 for unassigned edges)
+    - cluster_ids: sorted cluster labels to build polygons for
+    - style: 'convex' (convex hull of the road vertices), 'concave'
+      (concave hull of the road vertices) or 'road_buffer' (union of the
+      buffered roads)
+    - buffer_meters: buffer added around each polygon
+
+    Returns:
+    - array of polygons aligned with ``cluster_ids``
+    """
+    if style not in POLYGON_STYLES:
+        raise ValueError(f"Unknown polygon style '{style}'. Choose one of: {', '.join(POLYGON_STYLES)}")
+    if len(cluster_ids) == 0:
+        return np.empty(0, dtype=object)
+
+    member = np.flatnonzero(np.isin(edge_labels, cluster_ids))
+    positions = member[np.argsort(edge_labels[member], kind='stable')]
+    # Position of each edge's cluster within cluster_ids
+    group = np.searchsorted(cluster_ids, edge_labels[positions])
+
+    if style == "road_buffer":
+        roads = shapely.multilinestrings(store.geometries(positions), indices=group)
+        return shapely.buffer(roads, buffer_meters, quad_segs=4)
+
+    coords, coord_edge = store.vertices(positions)
+    vertices = shapely.multipoints(coords, indices=group[coord_edge])
+    if style == "concave":
+        hulls = shapely.concave_hull(vertices, ratio=CONCAVE_HULL_RATIO)
+    else:
+        hulls = shapely.convex_hull(vertices)
+
+    # Add small buffer to make it look nicer
+    return shapely.buffer(hulls, buffer_meters)
+
+
+def create_cluster_polygons(points_gdf, n_clusters, edges_gdf, backend="auto",
+                            target_miles=None, balance_tolerance=BALANCE_TOLERANCE,
+                            polygon_style="convex", recorder=None):
+    """
+    Create polygons around clustered points using a balanced approach.
+
+    Parameters:
+    - points_gdf: GeoDataFrame of points
+    - n_clusters: number of clusters
+    - edges_gdf: original edges for boundary
+    - backend: clustering backend, 'auto', 'kmeans', 'minibatch' or 'graph'
+      ('graph' grows connected regions over the road network topology;
+      balancing never splits them)
+    - target_miles: target miles per cluster; when given, boundary edges are
+      moved between neighbouring clusters to keep each cluster within
+      ``balance_tolerance`` of it
+    - balance_tolerance: allowed relative deviation from the target
+    - polygon_style: 'convex', 'concave' or 'road_buffer' (see
+      build_cluster_polygons)
+    - recorder: optional StageRecorder; the 'kmeans' or 'graph_partition',
+      'balance', 'hulls' and 'cluster_stats' stages are recorded on it
+
+    Returns:
+    - GeoDataFrame of cluster polygons, with run-level statistics and the
+      cluster of every edge (``edge_clusters``; edges without sample points
+      take the cluster of a connected labelled edge, see
+      graph_partition.spread_labels) in ``cluster_gdf.attrs['clustering']``
+    - points_gdf with a ``cluster`` column added
+    """
+    # Validate we have enough points
+    if len(points_gdf) == 0:
+        raise ValueError("No points generated. Try reducing the point spacing distance.")
+
+    if len(points_gdf) < n_clusters:
+        n_clusters = len(points_gdf)
+
+    # Cluster on the network's compact edge store, in its local metric CRS.
+    # The store is built once per network; points sampled in that CRS need
+    # no projection.
+    original_crs = edges_gdf.crs
+    store = edge_store(edges_gdf)
+    projected_crs = store.crs
+
+    # Perform k-means clustering on projected coordinates
+    coords = shapely.get_coordinates(projected_geometry(points_gdf, projected_crs).to_numpy())
+
+    # Create sample weights based on edge length (longer roads get more weight)
+    # This helps balance the mileage across clusters. Budget sampling gives
+    # each point the miles of its edge stretch instead.
+    budget_sampled = points_gdf.attrs.get('sampling', {}).get('sample_budget') is not None
+    sample_weights = points_gdf['weight_mi' if budget_sampled else 'edge_length_mi'].to_numpy(dtype=float)
+
+    # Adjust n_clusters if we have very few points
+    actual_clusters = min(n_clusters, len(points_gdf))
+
+    edge_positions = store.positions(points_gdf['edge_id'])
+    edge_u, edge_v, edge_miles = store.u, store.v, store.length_mi
+
+    fit_backend = select_clustering_backend(len(coords), backend)
+    with stage(recorder, 'graph_partition' if fit_backend == "graph" else 'kmeans'):
+        if fit_backend == "graph":
+            # Connected regions grown over the edge graph; points follow their edge
+            from osm_extractor.graph_partition import graph_cluster_labels
+            edge_xy = store.midpoints()
+            edge_labels, n_grown = graph_cluster_labels(edge_u, edge_v, edge_miles, edge_xy,
+                                                        actual_clusters)
+            fit_info = {
+                'backend': 'graph',
+                'n_iter': n_grown,
+                'inertia': weighted_inertia(coords, sample_weights, edge_labels[edge_positions]),
+            }
+        else:
+            # Weighted k-means: each point contributes in proportion to the length
+            # of the road it was sampled from, so labels map 1:1 back to the points
+            point_clusters, fit_info = fit_cluster_labels(coords, sample_weights, actual_clusters, backend)
+
+            # Every edge belongs to the cluster holding most of its length;
+            # edges too short to get a point join a cluster they connect to
+            from osm_extractor.graph_partition import edge_adjacency, spread_labels
+            stretch_miles = points_gdf['weight_mi'].to_numpy(dtype=float) if 'weight_mi' in points_gdf else None
+            edge_labels = edge_cluster_labels(edge_positions, point_clusters, len(store), stretch_miles)
+            edge_labels = spread_labels(edge_adjacency(edge_u, edge_v), edge_labels, store.midpoints())
+
+    # Check cluster balance and move boundary edges to enforce the target
+    with stage(recorder, 'balance'):
+        assigned = edge_labels >= 0
+        miles_before = np.bincount(edge_labels[assigned], weights=edge_miles[assigned],
+                                   minlength=actual_clusters)
+        balance_moves = 0
+        if target_miles:
+            edge_labels, balance_moves = balance_cluster_mileage(
+                edge_u, edge_v, edge_miles, edge_labels, target_miles, balance_tolerance
+            )
+        miles_after = np.bincount(edge_labels[assigned], weights=edge_miles[assigned],
+                                  minlength=actual_clusters)
+
+    # Points follow the (possibly rebalanced) cluster of their edge
+    point_clusters = edge_labels[edge_positions]
+    points_gdf['cluster'] = point_clusters
+
+    # Create polygons for each cluster based on the actual roads in that cluster.
+    # Clusters need at least 3 points and 3 road vertices to form a polygon.
+    with stage(recorder, 'hulls'):
+        assigned = edge_labels >= 0
+        points_per_cluster = np.bincount(point_clusters, minlength=actual_clusters)
+        coords_per_cluster = np.bincount(edge_labels[assigned],
+                                         weights=store.num_coordinates[assigned],
+                                         minlength=actual_clusters)
+        cluster_ids = np.flatnonzero((points_per_cluster >= 3) & (coords_per_cluster >= 3))
+        polygons = build_cluster_polygons(store, edge_labels, cluster_ids, polygon_style)
+
+    # Create GeoDataFrame in projected CRS
+    cluster_gdf = gpd.GeoDataFrame({
+        'cluster_id': cluster_ids,
+        'geometry': polygons
+    }, crs=projected_crs)
+
+    # Reproject back to the network's CRS
+    if original_crs and original_crs != projected_crs:
+        cluster_gdf = cluster_gdf.to_crs(original_crs)
+
+    # Calculate stats for each cluster from one edge -> cluster table
+    with stage(recorder, 'cluster_stats'):
+        assignments = edge_assignment_table(store, edge_labels, edge_positions)
+        stats_df = cluster_statistics(assignments, actual_clusters)
+        cluster_gdf = cluster_gdf.merge(stats_df[['cluster_id', 'num_points', 'num_edges', 'total_miles']],
+                                        on='cluster_id', how='left')
+
+    cluster_gdf.attrs['clustering'] = {
+        **fit_info,
+        'n_points': len(points_gdf),
+        'target_miles': target_miles,
+        'balance_tolerance': balance_tolerance,
+        'balance_moves': balance_moves,
+        'balance_before': mileage_balance(miles_before, target_miles),
+        'balance_after': mileage_balance(miles_after, target_miles),
+        'miles_before': miles_before,
+        'cluster_table': stats_df,
+        'edge_clusters': pd.Series(edge_labels, index=store.index, name='cluster_id'),
+    }
+
+    return cluster_gdf, points_gdf
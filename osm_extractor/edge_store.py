@@ -0,0 +1,196 @@
+"""
+Compact, array-backed road network for sampling and clustering.
+
+Sampling and clustering only need edge ids, end nodes, lengths, projected
+coordinates and the highway class, not the edges GeoDataFrame with its
+object columns (osmid and name lists, one Shapely object per edge). An
+EdgeStore keeps those as typed NumPy arrays, with every projected vertex in
+one flat (V, 2) coordinate buffer and per-edge offsets into it. The other
+attributes stay in the edges frame; results are joined back to it by edge
+position when they are exported.
+"""
+import numpy as np
+import pandas as pd
+import shapely
+from pyproj import Transformer
+
+from osm_extractor import METERS_PER_MILE
+from osm_extractor.balancing import edge_endpoints
+from osm_extractor.projection import cached_for_frame, local_crs
+
+
+def _ranges(starts, counts):
+    """Concatenated ``arange(start, start + count)`` for every pair."""
+    total = int(counts.sum())
+    group_starts = np.cumsum(counts) - counts
+    return np.arange(total) - np.repeat(group_starts - starts, counts)
+
+
+def highway_categories(edges_gdf):
+    """
+    Highway class per edge as a Categorical, 'unclassified' when missing.
+
+    osmnx keeps a list when a simplified edge spans several classes; those
+    edges count under their first class.
+    """
+    if 'highway' not in edges_gdf.columns:
+        return pd.Categorical(np.full(len(edges_gdf), 'unclassified'))
+    highway = pd.Series([value[0] if isinstance(value, list) else value
+                         for value in edges_gdf['highway']], dtype=object)
+    return pd.Categorical(highway.fillna('unclassified'))
+
+
+class EdgeStore:
+    """
+    Typed arrays describing the edges of one road network.
+
+    Attributes:
+    - index: the edges frame's index (shared, not copied)
+    - u, v: compact int32 (int64 for huge networks) end node ids, see
+      balancing.edge_endpoints
+    - length_mi: float64 road length in miles from the osmnx ``length``
+    - coords: (V, 2) float64 vertex coordinates in ``crs``
+    - offsets: int64 start of each edge's vertices in ``coords``, plus the
+      total as a final entry
+    - highway: Categorical highway class per edge
+    - crs: metric CRS of ``coords``
+    """
+
+    def __init__(self, index, u, v, length_mi, coords, offsets, highway, crs):
+        self.index = index
+        self.u = u
+        self.v = v
+        self.length_mi = length_mi
+        self.coords = coords
+        self.offsets = offsets
+        self.highway = highway
+        self.crs = crs
+        self._vertex_distance = None
+
+    @classmethod
+    def from_edges(cls, edges_gdf, crs=None):
+        """
+        Build a store from an edges GeoDataFrame.
+
+        Coordinates are transformed as one flat array into ``crs`` (default:
+        ``local_crs(edges_gdf)``); no per-edge geometries are created.
+        """
+        if crs is None:
+            crs = local_crs(edges_gdf)
+        geoms = edges_gdf.geometry.to_numpy()
+        coords = shapely.get_coordinates(geoms)
+        if edges_gdf.crs is not None and crs is not None and edges_gdf.crs != crs:
+            transformer = Transformer.from_crs(edges_gdf.crs, crs, always_xy=True)
+            coords = np.column_stack(transformer.transform(coords[:, 0], coords[:, 1]))
+        offsets = np.zeros(len(geoms) + 1, dtype=np.int64)
+        np.cumsum(shapely.get_num_coordinates(geoms), out=offsets[1:])
+
+        if 'length_mi' in edges_gdf.columns:
+            length_mi = edges_gdf['length_mi'].to_numpy(dtype=np.float64)
+        else:
+            length_mi = edges_gdf['length'].to_numpy(dtype=np.float64) / METERS_PER_MILE
+        u, v = edge_endpoints(edges_gdf)
+        node_dtype = np.int32 if len(u) and max(u.max(), v.max()) < np.iinfo(np.int32).max else np.int64
+        return cls(edges_gdf.index, u.astype(node_dtype), v.astype(node_dtype), length_mi,
+                   np.ascontiguousarray(coords, dtype=np.float64), offsets,
+                   highway_categories(edges_gdf), crs)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def nbytes(self):
+        """Bytes held by the store's arrays (the shared index excluded)."""
+        arrays = [self.u, self.v, self.length_mi, self.coords, self.offsets, self.highway.codes]
+        if self._vertex_distance is not None:
+            arrays.append(self._vertex_distance)
+        return sum(array.nbytes for array in arrays)
+
+    @property
+    def num_coordinates(self):
+        """Vertex count per edge."""
+        return np.diff(self.offsets)
+
+    @property
+    def vertex_distance(self):
+        """Distance in CRS units from each edge's first vertex to every vertex."""
+        if self._vertex_distance is None:
+            step = np.hypot(*np.diff(self.coords, axis=0).T)
+            distance = np.concatenate([[0.0], np.cumsum(step)])
+            # Restart the running total at the first vertex of every edge
+            starts = self.offsets[:-1]
+            self._vertex_distance = distance - np.repeat(distance[starts], self.num_coordinates)
+        return self._vertex_distance
+
+    def lengths(self):
+        """Measured length of every edge in CRS units (meters)."""
+        return self.vertex_distance[self.offsets[1:] - 1]
+
+    def positions(self, edge_ids):
+        """Positions of ``edge_ids`` in the store, -1 for unknown ids."""
+        return self.index.get_indexer(edge_ids)
+
+    def interpolate(self, positions, distances):
+        """
+        Coordinates at ``distances`` along the edges at ``positions``.
+
+        Distances are clipped to each edge's length.
+
+        Returns:
+        - (N, 2) coordinate array
+        """
+        starts = self.offsets[positions]
+        ends = self.offsets[positions + 1]
+        within = self.vertex_distance
+        distances = np.clip(distances, 0.0, within[ends - 1])
+
+        # Segment holding each distance: the last vertex of its edge at or
+        # before the distance, excluding the edge's final vertex
+        lengths = self.lengths()
+        base = np.concatenate([[0.0], np.cumsum(lengths)])
+        along = within + np.repeat(base[:-1], self.num_coordinates)
+        segment = np.searchsorted(along, base[positions] + distances, side='right') - 1
+        segment = np.clip(segment, starts, np.maximum(ends - 2, starts))
+
+        step = within[np.minimum(segment + 1, ends - 1)] - within[segment]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = np.where(step > 0, (distances - within[segment]) / step, 0.0)
+        t = np.clip(t, 0.0, 1.0)[:, None]
+        a = self.coords[segment]
+        b = self.coords[np.minimum(segment + 1, ends - 1)]
+        return a + t * (b - a)
+
+    def midpoints(self):
+        """Coordinates halfway along every edge."""
+        return self.interpolate(np.arange(len(self)), self.lengths() / 2)
+
+    def vertices(self, positions):
+        """
+        Vertex coordinates of the edges at ``positions``.
+
+        Returns:
+        - (V, 2) coordinate array
+        - index into ``positions`` of each vertex
+        """
+        counts = self.num_coordinates[positions]
+        coords = self.coords[_ranges(self.offsets[positions], counts)]
+        return coords, np.repeat(np.arange(len(positions)), counts)
+
+    def geometries(self, positions=None):
+        """LineStrings in ``crs`` for the edges at ``positions`` (default: all)."""
+        if positions is None:
+            positions = np.arange(len(self))
+        coords, owner = self.vertices(positions)
+        return shapely.linestrings(coords, indices=owner)
+
+
+def edge_store(edges_gdf, crs=None):
+    """
+    The EdgeStore of ``edges_gdf`` in ``crs`` (default: ``local_crs``).
+
+    Built once per frame and reused while its geometry column is unchanged.
+    """
+    if crs is None:
+        crs = local_crs(edges_gdf)
+    return cached_for_frame(edges_gdf, ('edge_store', str(crs)),
+                            lambda: EdgeStore.from_edges(edges_gdf, crs))
@@ -0,0 +1,448 @@
+"""
+Extraction and clustering of multi-feature boundary layers.
+
+District layers hold dozens of polygons. Each feature gets its own network,
+tagged with a ``feature_id`` column, its own clusters and its own output
+package. Features that overlap or touch are fetched together when one
+larger request is cheaper than several small ones; the remaining fetches
+run in parallel worker processes, as do the per-feature clusterings.
+
+The cost of a fetch is modelled as a fixed per-request overhead plus the
+area of its bounding box, which is what PBF reads and tiled extraction
+scan. Merging two touching squares costs one overhead less; merging two
+arms of an L-shaped district pays for the empty corner of the box.
+"""
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from osm_extractor.balancing import mileage_balance
+from osm_extractor.export import SPOOL_MAX_BYTES
+from osm_extractor.instrumentation import stage
+from osm_extractor.pipeline import extract_network, cluster_network, network_key, write_outputs, with_cluster_ids
+from osm_extractor.projection import local_crs
+
+# Fixed cost of one fetch, as the area in km² it is worth
+FETCH_OVERHEAD_KM2 = 25.0
+
+# Features closer than this are adjacent and may share a fetch
+ADJACENT_METERS = 50.0
+
+# Below this many edges, per-feature clustering runs in-process: starting
+# worker processes costs more than it saves
+PARALLEL_CLUSTER_MIN_EDGES = 20_000
+
+
+def boundary_features(boundary, id_column=None):
+    """
+    Polygon features of an uploaded boundary layer, ready for extraction.
+
+    Parameters:
+    - boundary: GeoDataFrame read from the upload
+    - id_column: column holding the feature ids (default: row numbers)
+
+    Returns:
+    - GeoDataFrame in EPSG:4326 with a unique ``feature_id`` column; empty
+      and non-polygonal features are dropped
+    """
+    if boundary.crs is not None:
+        boundary = boundary.to_crs(epsg=4326)
+    polygonal = boundary.geometry.notna() & ~boundary.geometry.is_empty & \
+        boundary.geom_type.isin(['Polygon', 'MultiPolygon'])
+    features = boundary[polygonal].copy()
+    if len(features) == 0:
+        raise ValueError("The boundary file contains no polygon features")
+
+    if id_column is None:
+        features['feature_id'] = np.flatnonzero(polygonal.to_numpy())
+    else:
+        features['feature_id'] = features[id_column].astype(str)
+        duplicates = features['feature_id'][features['feature_id'].duplicated()].unique()
+        if len(duplicates):
+            raise ValueError(f"Feature ids in '{id_column}' are not unique: {', '.join(duplicates[:5])}")
+    return features.reset_index(drop=True)
+
+
+def features_key(features, network_type, pbf_path=None):
+    """Key of a multi-feature extraction: every feature's network key and id."""
+    return tuple((network_key(network_type, polygon=polygon, pbf_path=pbf_path), str(feature_id))
+                 for polygon, feature_id in zip(features.geometry, features['feature_id']))
+
+
+def _fetch_cost(bounds, overhead_km2):
+    west, south, east, north = bounds
+    return overhead_km2 + (east - west) * (north - south) / 1e6
+
+
+def plan_fetches(features, overhead_km2=FETCH_OVERHEAD_KM2, adjacent_meters=ADJACENT_METERS):
+    """
+    Group features into fetches.
+
+    Overlapping or adjacent features are merged greedily, largest saving
+    first, while one fetch of the merged bounding box costs less than
+    fetching the groups separately.
+
+    Returns:
+    - list of fetches, each a sorted list of feature positions
+    """
+    geoms = features.geometry.to_crs(local_crs(features)).to_numpy()
+    bounds = {i: shapely.bounds(geom) for i, geom in enumerate(geoms)}
+    parent = list(range(len(geoms)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def saving(a, b):
+        merged = np.concatenate([np.minimum(bounds[a][:2], bounds[b][:2]),
+                                 np.maximum(bounds[a][2:], bounds[b][2:])])
+        return (_fetch_cost(bounds[a], overhead_km2) + _fetch_cost(bounds[b], overhead_km2)
+                - _fetch_cost(merged, overhead_km2)), merged
+
+    left, right = shapely.STRtree(geoms).query(geoms, predicate='dwithin', distance=adjacent_meters)
+    pairs = [(a, b) for a, b in zip(left.tolist(), right.tolist()) if a < b]
+    pairs.sort(key=lambda pair: -saving(*pair)[0])
+    for a, b in pairs:
+        a, b = find(a), find(b)
+        if a == b:
+            continue
+        gain, merged = saving(a, b)
+        if gain >= 0:
+            parent[b] = a
+            bounds[a] = merged
+
+    groups = {}
+    for i in range(len(geoms)):
+        groups.setdefault(find(i), []).append(i)
+    return sorted(groups.values())
+
+
+def _extract_region(region, network_type, pbf_path=None, tile_km=None, max_workers=None):
+    """Network of one fetch, or None when it has no roads; runs in a worker process."""
+    from osm_extractor.tiling import InsufficientResponseError
+
+    try:
+        (nodes, edges), _ = extract_network(network_type, polygon=region, pbf_path=pbf_path,
+                                            tile_km=tile_km, max_workers=max_workers)
+        return nodes, edges
+    except (ValueError, InsufficientResponseError):
+        return None
+
+
+def feature_positions(lines, polygons):
+    """
+    Feature of each edge: the first polygon containing its midpoint, or the
+    nearest polygon for edges whose midpoint lies outside all of them.
+
+    Returns:
+    - array of positions in ``polygons``
+    """
+    midpoints = shapely.line_interpolate_point(lines, 0.5, normalized=True)
+    tree = shapely.STRtree(polygons)
+    point_idx, polygon_idx = tree.query(midpoints, predicate='within')
+    positions = np.full(len(lines), -1, dtype=np.int64)
+    order = np.lexsort((polygon_idx, point_idx))
+    first_points, first = np.unique(point_idx[order], return_index=True)
+    positions[first_points] = polygon_idx[order][first]
+
+    outside = np.flatnonzero(positions < 0)
+    if len(outside):
+        positions[outside] = tree.nearest(midpoints[outside])
+    return positions
+
+
+def assign_features(results, fetches, features):
+    """
+    Combine per-fetch networks into one network with a ``feature_id`` column.
+
+    Each edge belongs to one feature (see feature_positions). Edges fetched
+    more than once, where fetches overlap, are kept for the first feature.
+
+    Returns:
+    - (nodes, edges) GeoDataFrames
+    """
+    node_frames, edge_frames = [], []
+    for members, result in zip(fetches, results):
+        if result is None:
+            continue
+        nodes, edges = result
+        members = np.asarray(members)
+        position = members[feature_positions(edges.geometry.to_numpy(),
+                                              features.geometry.to_numpy()[members])]
+        edges['feature_id'] = features['feature_id'].to_numpy()[position]
+        edges['_feature_position'] = position
+        node_frames.append(nodes)
+        edge_frames.append(edges)
+    if not edge_frames:
+        raise ValueError("No roads found in any feature of this boundary")
+
+    nodes = pd.concat(node_frames)
+    nodes = nodes[~nodes.index.duplicated(keep='first')]
+    edges = pd.concat(edge_frames)
+    order = np.argsort(edges['_feature_position'].to_numpy(), kind='stable')
+    keep = np.ones(len(edges), dtype=bool)
+    keep[order[edges.index[order].duplicated(keep='first')]] = False
+    edges = edges[keep].drop(columns='_feature_position')
+    return nodes, edges
+
+
+def extract_features(features, network_type="drive", pbf_path=None, cache=None, tile_km=None,
+                     max_workers=None, progress=None, recorder=None):
+    """
+    Extract the network of every feature of a boundary layer.
+
+    Parameters:
+    - features: GeoDataFrame from boundary_features
+    - network_type: 'drive', 'walk', 'bike' or 'all'
+    - pbf_path: read from a local PBF file instead of Overpass
+    - cache: optional NetworkCache; every fetch is cached individually
+    - tile_km: extract each fetch tile by tile (fetches then run one after
+      another, each tiled in parallel)
+    - max_workers: number of worker processes (default: CPU count)
+    - progress: optional callback(done_fetches, total_fetches)
+    - recorder: optional StageRecorder for the 'plan_fetches',
+      'cache_lookup', 'feature_extract' and 'assign_features' stages
+
+    Returns:
+    - (nodes, edges) GeoDataFrames, with fetch counts and timing in
+      ``edges.attrs['features']``
+    - True if every fetch came from the cache
+    """
+    start = time.perf_counter()
+    with stage(recorder, 'plan_fetches'):
+        fetches = plan_fetches(features)
+        geoms = features.geometry.to_numpy()
+        regions = [geoms[members[0]] if len(members) == 1 else shapely.union_all(geoms[members])
+                   for members in fetches]
+        keys = [network_key(network_type, polygon=region, pbf_path=pbf_path) for region in regions]
+
+    results = [None] * len(fetches)
+    pending = []
+    with stage(recorder, 'cache_lookup'):
+        for i, key in enumerate(keys):
+            cached = cache.get(key) if cache is not None else None
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.append(i)
+
+    done = len(fetches) - len(pending)
+    if progress:
+        progress(done, len(fetches))
+
+    def finish(i, result):
+        nonlocal done
+        results[i] = result
+        if cache is not None and result is not None:
+            ids = ", ".join(str(features['feature_id'].iloc[j]) for j in fetches[i])
+            cache.put(keys[i], *result, description=f"features: {ids} ({network_type})")
+        done += 1
+        if progress:
+            progress(done, len(fetches))
+
+    with stage(recorder, 'feature_extract'):
+        if tile_km or len(pending) == 1 or max_workers == 1:
+            for i in pending:
+                finish(i, _extract_region(regions[i], network_type, pbf_path, tile_km, max_workers))
+        elif pending:
+            # Spawned workers are safe to start from Streamlit's script threads
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+                futures = {pool.submit(_extract_region, regions[i], network_type, pbf_path): i
+                           for i in pending}
+                for future in as_completed(futures):
+                    finish(futures[future], future.result())
+
+    with stage(recorder, 'assign_features'):
+        nodes, edges = assign_features(results, fetches, features)
+
+    extracted = set(edges['feature_id'])
+    edges.attrs['features'] = {
+        'features': len(features),
+        'fetches': len(fetches),
+        'merged_features': sum(len(members) for members in fetches if len(members) > 1),
+        'cached_fetches': len(fetches) - len(pending),
+        'empty_features': [feature_id for feature_id in features['feature_id'] if feature_id not in extracted],
+        'seconds': time.perf_counter() - start,
+    }
+    return (nodes, edges), not pending
+
+
+def _offset_clusters(cluster_gdf, points_gdf, edges, feature_id, offset):
+    """
+    Shift one feature's cluster ids by ``offset`` and tag them with its id.
+
+    Returns:
+    - cluster_gdf and cluster table, or None for both without clusters
+    - cluster id of each of the feature's ``edges`` (-1 when unclustered)
+    """
+    if 'cluster' in points_gdf:
+        labels = points_gdf['cluster'].to_numpy()
+        points_gdf['cluster'] = np.where(labels >= 0, labels + offset, labels)
+    else:
+        points_gdf['cluster'] = -1
+    points_gdf['feature_id'] = feature_id
+    if cluster_gdf is None:
+        return None, None, pd.Series(-1, index=edges.index, name='cluster_id')
+    labels = cluster_gdf.attrs['clustering']['edge_clusters'].reindex(edges.index, fill_value=-1)
+    edge_clusters = labels.where(labels < 0, labels + offset)
+    cluster_gdf['cluster_id'] += offset
+    cluster_gdf.insert(0, 'feature_id', feature_id)
+    table = cluster_gdf.attrs['clustering']['cluster_table'].copy()
+    table['cluster_id'] += offset
+    table.insert(0, 'feature_id', feature_id)
+    return cluster_gdf, table, edge_clusters
+
+
+def cluster_features(edges, target_miles=50, point_spacing=0.5, sample_budget=None, max_workers=None,
+                     recorder=None, **params):
+    """
+    Cluster every feature of a multi-feature network on its own.
+
+    Features are clustered in parallel worker processes once the network
+    has at least PARALLEL_CLUSTER_MIN_EDGES edges. Cluster ids are unique
+    across features, so combined and per-feature outputs agree, and
+    clusters carry a ``feature_id`` column. A sample budget is split across
+    features in proportion to their miles, at least one sample each.
+
+    Parameters:
+    - edges: road edges with ``length_mi`` and ``feature_id`` columns
+    - target_miles, point_spacing, sample_budget, params: see pipeline.cluster_network
+    - max_workers: number of worker processes (default: CPU count)
+    - recorder: optional StageRecorder for the 'feature_cluster' stage
+
+    Returns:
+    - cluster_gdf, or None when no feature had enough points to cluster;
+      per-feature summaries are in ``cluster_gdf.attrs['clustering']['features']``
+    - points_gdf, in the network's local metric CRS
+    - list of notes for the user, prefixed with their feature id
+    """
+    feature_ids = pd.unique(edges['feature_id'])
+    labels = edges['feature_id'].to_numpy()
+    # Without the feature_id column each subset is clustered as one network
+    subsets = [edges[labels == feature_id].drop(columns='feature_id') for feature_id in feature_ids]
+    options = [dict(target_miles=target_miles, point_spacing=point_spacing, **params) for _ in subsets]
+    if sample_budget is not None:
+        miles = np.array([subset['length_mi'].sum() for subset in subsets])
+        shares = miles / miles.sum() if miles.sum() > 0 else np.full(len(subsets), 1 / len(subsets))
+        for feature_options, share in zip(options, shares):
+            feature_options['sample_budget'] = max(1, int(sample_budget * share))
+
+    results = [None] * len(subsets)
+    with stage(recorder, 'feature_cluster'):
+        if len(subsets) == 1 or max_workers == 1 or len(edges) < PARALLEL_CLUSTER_MIN_EDGES:
+            results = [cluster_network(subset, **opts) for subset, opts in zip(subsets, options)]
+        else:
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+                futures = {pool.submit(cluster_network, subset, **opts): i
+                           for i, (subset, opts) in enumerate(zip(subsets, options))}
+                for future in as_completed(futures):
+                    results[futures[future]] = future.result()
+
+    crs = local_crs(edges)
+    clusters, tables, points, notes, fits, summaries, edge_clusters = [], [], [], [], [], [], []
+    offset = 0
+    for feature_id, subset, (cluster_gdf, points_gdf, feature_notes) in zip(feature_ids, subsets, results):
+        notes.extend(f"{feature_id}: {note}" for note in feature_notes)
+        if points_gdf.crs != crs:
+            points_gdf = points_gdf.to_crs(crs)
+        n_clusters = 0 if cluster_gdf is None else len(cluster_gdf.attrs['clustering']['cluster_table'])
+        cluster_gdf, table, labels = _offset_clusters(cluster_gdf, points_gdf, subset, feature_id, offset)
+        offset += n_clusters
+        points.append(points_gdf)
+        edge_clusters.append(labels)
+        summary = {'feature_id': feature_id, 'edges': len(subset), 'miles': subset['length_mi'].sum(),
+                   'clusters': 0}
+        if cluster_gdf is not None:
+            fit = cluster_gdf.attrs['clustering']
+            clusters.append(cluster_gdf)
+            tables.append(table)
+            fits.append(fit)
+            summary.update(clusters=len(cluster_gdf), max_miles=fit['balance_after']['max_miles'],
+                           max_over_target=fit['balance_after']['max_over_target'],
+                           spacing_mi=fit['sampling']['spacing_miles'])
+        summaries.append(summary)
+
+    points_gdf = pd.concat(points, ignore_index=True)
+    if not clusters:
+        return None, points_gdf, notes
+
+    cluster_gdf = pd.concat(clusters, ignore_index=True)
+    cluster_table = pd.concat(tables, ignore_index=True)
+    miles_before = np.concatenate([fit['miles_before'] for fit in fits])
+    cluster_gdf.attrs['clustering'] = {
+        'backend': ", ".join(sorted({fit['backend'] for fit in fits})),
+        'n_iter': max(fit['n_iter'] for fit in fits),
+        'inertia': sum(fit['inertia'] for fit in fits),
+        'n_points': len(points_gdf),
+        'target_miles': target_miles,
+        'balance_tolerance': fits[0]['balance_tolerance'],
+        'balance_moves': sum(fit['balance_moves'] for fit in fits),
+        'balance_before': mileage_balance(miles_before, target_miles),
+        'balance_after': mileage_balance(cluster_table['total_miles'], target_miles),
+        'miles_before': miles_before,
+        'cluster_table': cluster_table,
+        'edge_clusters': pd.concat(edge_clusters),
+        'sampling': {'spacing_miles': point_spacing if sample_budget is None else None,
+                     'sample_budget': sample_budget},
+        'features': pd.DataFrame(summaries),
+    }
+    return cluster_gdf, points_gdf, notes
+
+
+def _package_names(feature_ids):
+    """File-system safe, unique directory name per feature id."""
+    names = {}
+    for feature_id in feature_ids:
+        name = re.sub(r'[^\w.-]+', '_', str(feature_id)).strip('_') or "feature"
+        while name in names.values():
+            name += "_"
+        names[feature_id] = name
+    return names
+
+
+def export_feature_packages(edges, cluster_gdf=None, output_format="GeoJSON"):
+    """
+    ZIP archive with one directory of roads (and clusters) per feature.
+
+    Every directory holds the same files write_outputs writes for a single
+    network, in ``output_format``. Clusters without a ``feature_id`` (the
+    network was clustered as a whole) go with the feature holding most of
+    their roads.
+
+    Returns:
+    - spooled binary file with the ZIP archive, positioned at the start
+    """
+    if cluster_gdf is not None and 'feature_id' not in cluster_gdf:
+        roads = with_cluster_ids(edges, cluster_gdf)
+        roads = roads[roads['cluster_id'] >= 0]
+        features = roads.groupby('cluster_id')['feature_id'].agg(lambda ids: ids.mode().iloc[0])
+        cluster_gdf = cluster_gdf.assign(feature_id=cluster_gdf['cluster_id'].map(features))
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, mode='w+b')
+    feature_ids = pd.unique(edges['feature_id'])
+    names = _package_names(feature_ids)
+    with tempfile.TemporaryDirectory() as tmpdir, zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        labels = edges['feature_id'].to_numpy()
+        for feature_id in feature_ids:
+            feature_clusters = None
+            if cluster_gdf is not None:
+                feature_clusters = cluster_gdf[cluster_gdf['feature_id'] == feature_id]
+                if len(feature_clusters) == 0:
+                    feature_clusters = None
+            out_dir = os.path.join(tmpdir, names[feature_id])
+            for path in write_outputs(out_dir, edges[labels == feature_id], feature_clusters, output_format):
+                zipf.write(path, f"{names[feature_id]}/{os.path.basename(path)}")
+                os.remove(path)
+    out.seek(0)
+    return out
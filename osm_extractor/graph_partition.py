@@ -0,0 +1,174 @@
+"""
+Graph-contiguous partitioning of the road network.
+
+Instead of clustering sample points by Euclidean distance, edges are grown
+into regions over the network topology, so every cluster is a connected
+set of roads and never jumps across a river or freeway without a link.
+"""
+import heapq
+from collections import deque
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+from sklearn.cluster import MiniBatchKMeans
+
+
+def edge_adjacency(edge_u, edge_v):
+    """
+    Build the edge-to-edge adjacency of the network as a CSR matrix.
+
+    Two edges are adjacent when they share an end node. The topology comes
+    from the ``u``/``v`` node ids of the osmnx graph (see
+    ``balancing.edge_endpoints``).
+    """
+    n_edges = len(edge_u)
+    n_nodes = int(max(edge_u.max(), edge_v.max())) + 1
+    rows = np.concatenate([np.arange(n_edges), np.arange(n_edges)])
+    cols = np.concatenate([edge_u, edge_v])
+    incidence = sp.csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)),
+                              shape=(n_edges, n_nodes))
+    adjacency = (incidence @ incidence.T).tocsr()
+    adjacency.setdiag(0)
+    adjacency.eliminate_zeros()
+    return adjacency
+
+
+def _allocate_seeds(component_miles, n_clusters):
+    """Split n_clusters across components in proportion to their miles."""
+    share = component_miles / component_miles.sum() * n_clusters
+    counts = np.floor(share).astype(int)
+    # Hand out the remainder by largest fractional part
+    remainder = n_clusters - counts.sum()
+    if remainder > 0:
+        counts[np.argsort(share - counts)[::-1][:remainder]] += 1
+    return counts
+
+
+def grow_regions(adjacency, edge_miles, seeds):
+    """
+    Grow one region per seed edge over the edge adjacency.
+
+    The lightest region (by miles) always takes the next unassigned edge on
+    its breadth-first frontier, so regions stay connected and grow to
+    similar mileage. Each edge is assigned once and each assignment costs
+    O(degree + log k), so the pass is near-linear in the number of edges.
+
+    Parameters:
+    - adjacency: CSR edge adjacency (see edge_adjacency)
+    - edge_miles: length of each edge in miles
+    - seeds: positional index of the seed edge for each region
+
+    Returns:
+    - array of region labels per edge, -1 where no region reached the edge
+    """
+    indptr, indices = adjacency.indptr, adjacency.indices
+    labels = np.full(adjacency.shape[0], -1, dtype=np.int64)
+    miles = np.zeros(len(seeds))
+    frontiers = [deque() for _ in seeds]
+
+    for region, seed in enumerate(seeds):
+        labels[seed] = region
+        miles[region] = edge_miles[seed]
+        frontiers[region].extend(indices[indptr[seed]:indptr[seed + 1]])
+
+    heap = [(miles[region], region) for region in range(len(seeds))]
+    heapq.heapify(heap)
+    while heap:
+        _, region = heapq.heappop(heap)
+        frontier = frontiers[region]
+        while frontier and labels[frontier[0]] >= 0:
+            frontier.popleft()
+        if not frontier:
+            # Region is enclosed by other regions; it stops growing
+            continue
+
+        e = frontier.popleft()
+        labels[e] = region
+        miles[region] += edge_miles[e]
+        neighbours = indices[indptr[e]:indptr[e + 1]]
+        frontier.extend(neighbours[labels[neighbours] < 0])
+        heapq.heappush(heap, (miles[region], region))
+
+    return labels
+
+
+def spread_labels(adjacency, labels, edge_xy):
+    """
+    Label every unlabelled edge from the labelled edges around it.
+
+    A breadth-first search over the edge adjacency, started from every
+    labelled edge at once, gives each unlabelled edge the label of the
+    first labelled edge that reaches it, so it joins a cluster it is
+    connected to. Edges in components without any label take the label of
+    the nearest labelled edge.
+
+    Parameters:
+    - adjacency: CSR edge adjacency (see edge_adjacency)
+    - labels: label per edge, -1 for unlabelled edges
+    - edge_xy: (E, 2) projected midpoint of every edge
+
+    Returns:
+    - new array of labels per edge, -1 only if no edge was labelled
+    """
+    labels = np.array(labels, dtype=np.int64)
+    indptr, indices = adjacency.indptr, adjacency.indices
+    queue = deque(np.flatnonzero(labels >= 0).tolist())
+    while queue:
+        e = queue.popleft()
+        neighbours = indices[indptr[e]:indptr[e + 1]]
+        reached = neighbours[labels[neighbours] < 0]
+        labels[reached] = labels[e]
+        queue.extend(reached.tolist())
+
+    unlabelled = labels < 0
+    if unlabelled.any() and (~unlabelled).any():
+        _, nearest = cKDTree(edge_xy[~unlabelled]).query(edge_xy[unlabelled])
+        labels[unlabelled] = labels[~unlabelled][nearest]
+    return labels
+
+
+def graph_cluster_labels(edge_u, edge_v, edge_miles, edge_xy, n_clusters):
+    """
+    Partition edges into ``n_clusters`` connected, length-balanced regions.
+
+    Seeds are spread over each connected component in proportion to its
+    mileage, placed at the edges closest to a length-weighted MiniBatch
+    k-means of edge midpoints, and grown with grow_regions. Components too
+    small to get a seed of their own join the nearest region.
+
+    Parameters:
+    - edge_u, edge_v: integer end node ids per edge
+    - edge_miles: length of each edge in miles
+    - edge_xy: (E, 2) projected midpoint of every edge
+    - n_clusters: number of regions
+
+    Returns:
+    - array of cluster labels per edge
+    - number of edges grown
+    """
+    edge_miles = np.asarray(edge_miles, dtype=float)
+    adjacency = edge_adjacency(edge_u, edge_v)
+    n_components, component = connected_components(adjacency, directed=False)
+    component_miles = np.bincount(component, weights=edge_miles, minlength=n_components)
+    seeds_per_component = _allocate_seeds(component_miles, min(n_clusters, len(edge_miles)))
+
+    seeds = []
+    for comp in np.flatnonzero(seeds_per_component):
+        members = np.flatnonzero(component == comp)
+        k = min(int(seeds_per_component[comp]), len(members))
+        if k == 1:
+            centers = np.average(edge_xy[members], axis=0, weights=edge_miles[members] + 1e-9)[None, :]
+        else:
+            centers = MiniBatchKMeans(n_clusters=k, random_state=42, n_init=3).fit(
+                edge_xy[members], sample_weight=edge_miles[members] + 1e-9
+            ).cluster_centers_
+        _, nearest = cKDTree(edge_xy[members]).query(centers)
+        seeds.extend(np.unique(members[nearest]))
+
+    labels = grow_regions(adjacency, edge_miles, np.asarray(seeds))
+    n_grown = int((labels >= 0).sum())
+
+    # Edges in seedless components join the region of the nearest grown edge
+    return spread_labels(adjacency, labels, edge_xy), n_grown
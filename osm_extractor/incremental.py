@@ -0,0 +1,801 @@
+"""
+Incremental updates of a cached road network from OSM change files.
+
+Re-extracting the same service areas every week rebuilds the whole network
+although only a handful of ways changed. Here the ways touched by one or
+more ``.osc`` change files are rebuilt and spliced into the cached
+``nodes``/``edges`` extract, and only the clusters holding changed edges are
+re-clustered; every other cluster keeps its id, polygon and statistics.
+
+A way is touched when the change files create, modify or delete it, change
+one of its nodes, or change a way it shares a node with (junctions can
+appear or disappear there). osmnx simplification can merge several ways into
+one edge, so every way sharing an edge with a touched way is rebuilt too.
+Ways and node locations the change files do not carry come from the
+``.osm.pbf`` the extract was read from, so incremental updates work for
+extracts made with ``--pbf`` / pbf_source. Pass every change file since
+that base file, oldest first, or chain updates with ``--output-pbf``.
+
+Every run saves its clustering next to the network cache, keyed by network
+and clustering settings, and the next run re-clusters from it. Runs chained
+with ``--output-pbf`` therefore keep the cluster ids of the last export.
+A run without a saved clustering clusters its base network first and
+reports that time as 'base clustering'.
+
+Usage:
+    python -m osm_extractor.incremental base.osm.pbf --osc week1.osc [week2.osc ...]
+        (--bbox NORTH SOUTH EAST WEST | --polygon boundary.geojson) [--compare]
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import sys
+import tempfile
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import osmnx as ox
+import shapely
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from osm_extractor.balancing import BALANCE_TOLERANCE, mileage_balance
+from osm_extractor.clustering import create_cluster_polygons
+from osm_extractor.edge_store import edge_store
+from osm_extractor.features import boundary_features
+from osm_extractor.instrumentation import StageRecorder, DEFAULT_LOG_PATH, stage
+from osm_extractor.memo import edges_fingerprint
+from osm_extractor.network_cache import NetworkCache, DEFAULT_CACHE_DIR, bbox_key, polygon_key, pbf_source
+from osm_extractor.pbf_source import (graph_from_ways, network_filter, read_nodes, read_pbf_network,
+                                      useful_way_tags, way_matches, bbox_polygon, osmium)
+from osm_extractor.pipeline import (extract_network, add_length_miles, cluster_count, cluster_network,
+                                    write_outputs, OUTPUT_FORMATS)
+from osm_extractor.sampling import generate_points_along_lines
+
+# Node attribute marking nodes that must stay edge endpoints while the
+# rebuilt ways are simplified
+_ENDPOINT_ATTR = "_kept_endpoint"
+
+# Subdirectory of the network cache holding the clustering of each run
+CLUSTERINGS_DIR = "clusterings"
+
+
+class ChangeSet:
+    """
+    Net effect of a sequence of OSM change files.
+
+    Attributes:
+    - nodes: node id -> (lon, lat), or None for deleted nodes
+    - node_tags: node id -> tag dict, for created or modified nodes
+    - ways: way id -> (node refs, tag dict), or None for deleted ways
+    - files: the change files read, in order
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.node_tags = {}
+        self.ways = {}
+        self.files = []
+
+    def __len__(self):
+        return len(self.nodes) + len(self.ways)
+
+
+def read_change_files(osc_paths):
+    """
+    Read ``.osc`` change files into one ChangeSet.
+
+    Files are applied in the given order, so later versions of an object
+    replace earlier ones. Relations are ignored; road networks only use
+    nodes and ways.
+    """
+    if osmium is None:
+        raise ImportError("Incremental updates require pyosmium: pip install osmium")
+    useful_node_tags = set(ox.settings.useful_tags_node)
+    changes = ChangeSet()
+    for path in osc_paths:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Change file not found: {path}")
+        for obj in osmium.FileProcessor(path, osmium.osm.NODE | osmium.osm.WAY):
+            if obj.is_node():
+                if obj.deleted:
+                    changes.nodes[obj.id] = None
+                    changes.node_tags.pop(obj.id, None)
+                else:
+                    changes.nodes[obj.id] = (obj.location.lon, obj.location.lat)
+                    changes.node_tags[obj.id] = {tag.k: tag.v for tag in obj.tags if tag.k in useful_node_tags}
+            elif obj.deleted:
+                changes.ways[obj.id] = None
+            else:
+                changes.ways[obj.id] = ([node.ref for node in obj.nodes], {tag.k: tag.v for tag in obj.tags})
+        changes.files.append(path)
+    return changes
+
+
+def apply_change_files(base_pbf, osc_paths, output_pbf):
+    """
+    Write ``base_pbf`` with the change files applied to ``output_pbf``.
+
+    This is the input of a full rebuild, and the base of the next
+    incremental update.
+    """
+    if osmium is None:
+        raise ImportError("Incremental updates require pyosmium: pip install osmium")
+    merger = osmium.MergeInputReader()
+    for path in osc_paths:
+        merger.add_file(path)
+    if os.path.exists(output_pbf):
+        os.remove(output_pbf)
+    reader = osmium.io.Reader(base_pbf)
+    writer = osmium.io.Writer(output_pbf)
+    try:
+        merger.apply_to_reader(reader, writer)
+    finally:
+        writer.close()
+        reader.close()
+    return output_pbf
+
+
+def changes_source(base_pbf, osc_paths):
+    """Cache ``source`` tag of a base PBF with change files applied."""
+    return "+".join([pbf_source(base_pbf)] + [pbf_source(path) for path in osc_paths])
+
+
+def _edge_ways(edges):
+    """(edge position, way id) pairs from the ``osmid`` column, which holds an id or a list of ids."""
+    ways = [value if isinstance(value, list) else [value] for value in edges['osmid']]
+    counts = np.fromiter(map(len, ways), dtype=np.int64, count=len(ways))
+    way_ids = np.fromiter(chain.from_iterable(ways), dtype=np.int64, count=int(counts.sum()))
+    return np.repeat(np.arange(len(edges)), counts), way_ids
+
+
+def _edge_nodes(edges):
+    """OSM node ids at the start and end of every edge."""
+    return edges.index.get_level_values('u').to_numpy(), edges.index.get_level_values('v').to_numpy()
+
+
+def _simplify_keeping(G, endpoints):
+    """Simplify ``G`` without merging edges through any node in ``endpoints``."""
+    endpoints = [node_id for node_id in endpoints if node_id in G.nodes]
+    for node_id in endpoints:
+        G.nodes[node_id][_ENDPOINT_ATTR] = True
+    try:
+        G = ox.simplify_graph(G, node_attrs_include=[_ENDPOINT_ATTR])
+    except TypeError:  # osmnx < 2.0
+        # A self-loop makes a node an endpoint in every osmnx version;
+        # the marker loops are removed again after simplifying
+        G.add_edges_from((node_id, node_id, {_ENDPOINT_ATTR: True}) for node_id in endpoints)
+        G = ox.simplify_graph(G)
+        G.remove_edges_from([(u, v, key) for u, v, key, marker
+                             in G.edges(keys=True, data=_ENDPOINT_ATTR) if marker])
+    for _, data in G.nodes(data=True):
+        data.pop(_ENDPOINT_ATTR, None)
+    return G
+
+
+def _largest_component(edges):
+    """Mask of the edges in the largest weakly connected component."""
+    u, v = _edge_nodes(edges)
+    node_ids, codes = np.unique(np.concatenate([u, v]), return_inverse=True)
+    n_edges = len(edges)
+    graph = coo_matrix((np.ones(n_edges), (codes[:n_edges], codes[n_edges:])),
+                       shape=(len(node_ids), len(node_ids)))
+    _, component = connected_components(graph, directed=True, connection='weak')
+    largest = np.bincount(component).argmax()
+    return component[codes[:n_edges]] == largest
+
+
+def street_counts(edges):
+    """
+    Undirected street segments per node, counted like osmnx's
+    ``count_streets_per_node``: reciprocal edges count once, parallel edges
+    separately and self-loops twice.
+    """
+    u, v = _edge_nodes(edges)
+    low, high = np.minimum(u, v), np.maximum(u, v)
+    keys = np.where(low == high, 0, edges.index.get_level_values('key').to_numpy())
+    segments = pd.DataFrame({'low': low, 'high': high, 'key': keys}).drop_duplicates()
+    return pd.concat([segments['low'], segments['high']]).value_counts()
+
+
+def _unique_keys(kept_index, new_edges):
+    """Renumber the keys of new edges that collide with kept parallel edges."""
+    taken = set(kept_index)
+    index = list(new_edges.index)
+    for i, (u, v, key) in enumerate(index):
+        while (u, v, key) in taken:
+            key += 1
+        taken.add((u, v, key))
+        index[i] = (u, v, key)
+    new_edges.index = pd.MultiIndex.from_tuples(index, names=new_edges.index.names)
+    return new_edges
+
+
+def _same_geometry(old_edges, new_edges):
+    """Mask over ``new_edges``: same id, geometry and length as in ``old_edges``."""
+    positions = old_edges.index.get_indexer(new_edges.index)
+    same = positions >= 0
+    if same.any():
+        old = old_edges.iloc[positions[same]]
+        new = new_edges[same]
+        same[same] = (shapely.equals_exact(old.geometry.to_numpy(), new.geometry.to_numpy(), tolerance=0)
+                      & np.isclose(old['length'].to_numpy(dtype=float), new['length'].to_numpy(dtype=float)))
+    return same
+
+
+def update_network(nodes, edges, changes, base_pbf, network_type="drive", polygon=None,
+                   retain_all=False, recorder=None):
+    """
+    Apply a ChangeSet to a network previously read from ``base_pbf``.
+
+    Only the touched ways (and the ways sharing edges with them) are read
+    and built; they are simplified with every endpoint of the remaining
+    edges kept as an endpoint, so they join the untouched edges where they
+    did before. Pieces that were disconnected from the network in the
+    cached extract are not brought back by a change that reconnects them.
+
+    Parameters:
+    - nodes, edges: the cached extract, as returned by read_pbf_network
+    - changes: ChangeSet from read_change_files
+    - base_pbf: the .osm.pbf the extract was read from
+    - network_type, polygon, retain_all: options of the original extraction
+    - recorder: optional StageRecorder for the 'scan_base', 'rebuild' and
+      'splice' stages
+
+    Returns:
+    - (nodes, edges) of the updated network
+    - dict describing the update: 'removed' and 'added' edge ids (edges
+      gone or changed, and edges new or changed), counts of changed nodes
+      and ways, rebuilt ways and edges
+    """
+    if osmium is None:
+        raise ImportError("Incremental updates require pyosmium: pip install osmium")
+    rules = network_filter(network_type)
+    useful_tags = useful_way_tags(rules)
+    changed_nodes = set(changes.nodes)
+    edge_positions, edge_way_ids = _edge_ways(edges)
+    extract_ways = set(edge_way_ids.tolist())
+
+    # Nodes whose ways must be rebuilt: changed nodes, and the nodes changed
+    # ways join (before and after the change), where junctions may appear
+    # or disappear
+    touched_nodes = changed_nodes | {ref for way in changes.ways.values() if way is not None for ref in way[0]}
+
+    # Highway ways of the extract, and base ways using a touched node
+    with stage(recorder, 'scan_base'):
+        base_ways = {}
+        processor = osmium.FileProcessor(base_pbf, osmium.osm.WAY).with_filter(osmium.filter.KeyFilter('highway'))
+        for way in processor:
+            refs = [node.ref for node in way.nodes]
+            if way.id in changes.ways:
+                touched_nodes.update(refs)
+            elif way.id in extract_ways or not touched_nodes.isdisjoint(refs):
+                tags = {tag.k: tag.v for tag in way.tags}
+                if way_matches(tags, rules):
+                    base_ways[way.id] = (refs, {k: v for k, v in tags.items() if k in useful_tags})
+        touched = set(changes.ways) | {way_id for way_id, (refs, _) in base_ways.items()
+                                       if not touched_nodes.isdisjoint(refs)}
+
+    with stage(recorder, 'rebuild'):
+        # Simplified edges can span several ways: rebuild whole edges
+        rebuild = set(touched)
+        while True:
+            hit = np.isin(edge_way_ids, np.fromiter(rebuild, dtype=np.int64, count=len(rebuild)))
+            removed_positions = np.unique(edge_positions[hit])
+            spanned = set(edge_way_ids[np.isin(edge_positions, removed_positions)].tolist())
+            if spanned <= rebuild:
+                break
+            rebuild |= spanned
+
+        ways = []
+        for way_id in sorted(rebuild):
+            if way_id in changes.ways:
+                change = changes.ways[way_id]
+                if change is None or not way_matches(change[1], rules):
+                    continue
+                refs, tags = change[0], {k: v for k, v in change[1].items() if k in useful_tags}
+            elif way_id in base_ways:
+                refs, tags = base_ways[way_id]
+            else:
+                continue
+            ways.append((way_id, refs, tags))
+
+        # Node locations: changed nodes from the change files, the rest from the base
+        needed = {ref for _, refs, _ in ways for ref in refs}
+        node_xy = {ref: changes.nodes[ref] for ref in needed & changed_nodes if changes.nodes[ref] is not None}
+        node_tags = {ref: changes.node_tags[ref] for ref in node_xy if changes.node_tags.get(ref)}
+        base_xy, base_tags = read_nodes(base_pbf, needed - changed_nodes)
+        node_xy.update(base_xy)
+        node_tags.update(base_tags)
+        ways = [way for way in ways if all(ref in node_xy for ref in way[1])]
+        if polygon is not None and ways:
+            shapely.prepare(polygon)
+            ways = [way for way in ways
+                    if shapely.contains_xy(polygon, *np.array([node_xy[ref] for ref in way[1]]).T).any()]
+
+        kept = edges.iloc[np.setdiff1d(np.arange(len(edges)), removed_positions)]
+        new_nodes = nodes.iloc[:0]
+        new_edges = edges.iloc[:0]
+        if ways:
+            G = graph_from_ways(ways, node_xy, node_tags, network_type, simplify=False)
+            # Nodes where kept edges end stay endpoints, as in the full network
+            kept_u, kept_v = _edge_nodes(kept)
+            G = _simplify_keeping(G, set(kept_u.tolist()) | set(kept_v.tolist()))
+            if polygon is not None:
+                try:
+                    G = ox.truncate.truncate_graph_polygon(G, polygon, truncate_by_edge=False)
+                except ValueError:  # no rebuilt endpoint inside the area
+                    G = G.subgraph([]).copy()
+            if G.number_of_edges():
+                new_nodes, new_edges = ox.graph_to_gdfs(G)
+                new_edges = _unique_keys(kept.index, new_edges)
+
+    with stage(recorder, 'splice'):
+        updated = pd.concat([kept, new_edges])
+        is_new = np.r_[np.zeros(len(kept), dtype=bool), np.ones(len(new_edges), dtype=bool)]
+        if not retain_all and len(updated):
+            connected = _largest_component(updated)
+            updated, is_new = updated[connected], is_new[connected]
+
+        u, v = _edge_nodes(updated)
+        used = pd.Index(np.unique(np.concatenate([u, v])))
+        updated_nodes = pd.concat([nodes.drop(new_nodes.index, errors='ignore'), new_nodes])
+        updated_nodes = updated_nodes[updated_nodes.index.isin(used)].copy()
+        if 'street_count' in updated_nodes.columns:
+            updated_nodes['street_count'] = street_counts(updated).reindex(updated_nodes.index).to_numpy()
+
+        # Rebuilt edges identical to before do not count as changes
+        rebuilt = updated[is_new]
+        unchanged = _same_geometry(edges, rebuilt)
+        added = rebuilt.index[~unchanged]
+        removed = edges.index.difference(updated.index).union(
+            edges.index.intersection(added), sort=False)
+
+    update = {
+        'removed': removed,
+        'added': added,
+        'changed_nodes': len(changes.nodes),
+        'changed_ways': len(changes.ways),
+        'ways_touched': len(touched),
+        'ways_rebuilt': len(ways),
+        'edges_rebuilt': len(rebuilt),
+        'edges_removed': len(removed),
+        'edges_added': len(added),
+        'edges': len(updated),
+    }
+    return (updated_nodes, updated), update
+
+
+def edge_labels_from_points(edges, points_gdf):
+    """Cluster of every edge in ``edges`` from clustered points, -1 for edges without points."""
+    labels = np.full(len(edges), -1, dtype=np.int64)
+    positions = edges.index.get_indexer(points_gdf['edge_id'])
+    found = positions >= 0
+    labels[positions[found]] = points_gdf['cluster'].to_numpy()[found]
+    return labels
+
+
+def _match_clusters(overlap, old_ids, next_id):
+    """
+    Give every new cluster the id of the old cluster it overlaps most.
+
+    ``overlap`` holds shared miles, new clusters by old clusters. Ids are
+    handed out greedily by descending overlap; new clusters left over take
+    the remaining old ids, then fresh ids from ``next_id``.
+    """
+    mapping = {}
+    used = set()
+    for flat in np.argsort(-overlap, axis=None, kind='stable'):
+        new, old = np.unravel_index(flat, overlap.shape)
+        if overlap[new, old] <= 0:
+            break
+        if new not in mapping and old not in used:
+            mapping[new] = old_ids[old]
+            used.add(old)
+    spare = [old_ids[old] for old in range(len(old_ids)) if old not in used]
+    spare.extend(range(next_id, next_id + overlap.shape[0]))
+    for new in range(overlap.shape[0]):
+        if new not in mapping:
+            mapping[new] = spare.pop(0)
+    return mapping
+
+
+def recluster(edges, update, cluster_gdf, points_gdf, target_miles=50, point_spacing=0.5, backend="auto",
+              balance_tolerance=BALANCE_TOLERANCE, polygon_style="convex", sample_budget=None, recorder=None):
+    """
+    Re-cluster only the clusters holding edges changed by an update.
+
+    The changed clusters, plus the clusters next to added edges, are pooled
+    with the added edges and clustered again, into at least as many
+    clusters as were pooled. The new
+    clusters take over the ids of the old clusters they overlap most; all
+    other clusters keep their ids, polygons, points and statistics.
+
+    Parameters:
+    - edges: updated edges with a ``length_mi`` column
+    - update: dict from update_network
+    - cluster_gdf, points_gdf: cluster_network result for the network
+      before the update
+    - target_miles, point_spacing, backend, balance_tolerance,
+      polygon_style, sample_budget: the clustering parameters of that
+      result; the pooled edges get the share of the sample budget of
+      their miles
+    - recorder: optional StageRecorder for the 'edge_store', 'sample' and
+      'cluster' stages of the pooled edges
+
+    Returns:
+    - cluster_gdf, points_gdf, notes, like cluster_network, with the
+      re-clustered, new and retired cluster ids in
+      ``cluster_gdf.attrs['clustering']['incremental']``
+    """
+    labels = edge_labels_from_points(edges, points_gdf)
+    added = edges.index.get_indexer(update['added'])
+    labels[added] = -1
+
+    # Clusters that lost or changed edges, and clusters touching added edges
+    removed_points = update['removed'].get_indexer(points_gdf['edge_id']) >= 0
+    dirty = set(points_gdf['cluster'].to_numpy()[removed_points].tolist())
+    u, v = _edge_nodes(edges)
+    added_nodes = np.concatenate([u[added], v[added]])
+    next_to_added = np.isin(u, added_nodes) | np.isin(v, added_nodes)
+    dirty |= set(labels[next_to_added & (labels >= 0)].tolist())
+
+    old_ids = np.array(sorted(dirty), dtype=np.int64)
+    pooled = np.isin(labels, old_ids)
+    pooled[added] = True
+    unchanged_points = ~removed_points & ~np.isin(points_gdf['cluster'].to_numpy(), old_ids)
+    old_info = cluster_gdf.attrs['clustering']
+
+    if not pooled.any():
+        cluster_gdf = cluster_gdf.copy()
+        cluster_gdf.attrs['clustering'] = {
+            **old_info,
+            'edge_clusters': pd.Series(labels, index=edges.index, name='cluster_id'),
+            'incremental': {'reclustered': [], 'new': [], 'retired': []},
+        }
+        return cluster_gdf, points_gdf[unchanged_points], []
+
+    # As cluster_network, but with at least as many clusters as were pooled
+    # so that no id is retired just because the pooled clusters ran short
+    sub_edges = edges[pooled]
+    n_clusters = max(len(old_ids), cluster_count(sub_edges['length_mi'].sum(), target_miles))
+    with stage(recorder, 'edge_store'):
+        store = edge_store(sub_edges)
+    sub_budget = None
+    if sample_budget is not None:
+        share = sub_edges['length_mi'].sum() / max(edges['length_mi'].sum(), 1e-9)
+        sub_budget = max(1, int(sample_budget * share))
+    with stage(recorder, 'sample'):
+        sub_points = generate_points_along_lines(sub_edges, spacing_miles=point_spacing, crs=store.crs,
+                                                 sample_budget=sub_budget)
+    if len(sub_points) < 2:
+        raise ValueError("Too few sample points to re-cluster the changed area; run a full rebuild")
+    notes = []
+    if len(sub_points) < n_clusters:
+        notes.append(f"Only {len(sub_points)} points generated in the changed area, but {n_clusters} "
+                     f"clusters requested. Adjusting to {len(sub_points)} clusters.")
+    with stage(recorder, 'cluster'):
+        sub_clusters, sub_points = create_cluster_polygons(
+            sub_points, n_clusters, sub_edges, backend=backend, target_miles=target_miles,
+            balance_tolerance=balance_tolerance, polygon_style=polygon_style, recorder=recorder
+        )
+
+    # Match the new clusters to the old ones by shared miles on unchanged
+    # edges. Balancing can leave clusters without edges; those are dropped
+    # rather than given an id.
+    sub_info = sub_clusters.attrs['clustering']
+    sub_table = sub_info['cluster_table']
+    sub_table = sub_table[sub_table['num_edges'] > 0].copy()
+    live = sub_table['cluster_id'].to_numpy()
+    sub_labels = edge_labels_from_points(sub_edges, sub_points)
+    old_labels = labels[pooled]
+    miles = sub_edges['length_mi'].to_numpy()
+    both = (sub_labels >= 0) & (old_labels >= 0)
+    overlap = np.zeros((len(sub_info['cluster_table']), len(old_ids)))
+    np.add.at(overlap, (sub_labels[both], np.searchsorted(old_ids, old_labels[both])), miles[both])
+    matched = _match_clusters(overlap[live], old_ids, int(old_info['cluster_table']['cluster_id'].max()) + 1)
+    mapping = {int(live[row]): cluster_id for row, cluster_id in matched.items()}
+    to_id = np.vectorize(mapping.get, otypes=[np.int64])
+
+    sub_points['cluster'] = to_id(sub_points['cluster'].to_numpy())
+    sub_clusters['cluster_id'] = to_id(sub_clusters['cluster_id'].to_numpy())
+    if points_gdf.crs is not None and sub_points.crs != points_gdf.crs:
+        sub_points = sub_points.to_crs(points_gdf.crs)
+    points_gdf = pd.concat([points_gdf[unchanged_points], sub_points], ignore_index=True)
+
+    keep = ~cluster_gdf['cluster_id'].isin(old_ids)
+    merged = pd.concat([cluster_gdf[keep], sub_clusters], ignore_index=True)
+    merged = merged.sort_values('cluster_id', ignore_index=True)
+
+    sub_table['cluster_id'] = to_id(live)
+    old_table = old_info['cluster_table']
+    table = pd.concat([old_table[~old_table['cluster_id'].isin(old_ids)], sub_table], ignore_index=True)
+    table = table.fillna(0.0).sort_values('cluster_id', ignore_index=True)
+
+    new_ids = sorted(set(mapping.values()))
+    merged.attrs['clustering'] = {
+        **sub_info,
+        'n_points': len(points_gdf),
+        'balance_before': old_info['balance_after'],
+        'balance_after': mileage_balance(table['total_miles'], target_miles),
+        'cluster_table': table,
+        'edge_clusters': pd.Series(edge_labels_from_points(edges, points_gdf), index=edges.index,
+                                   name='cluster_id'),
+        'incremental': {
+            'reclustered': [int(i) for i in old_ids if i in set(new_ids)],
+            'new': [int(i) for i in new_ids if i not in set(old_ids.tolist())],
+            'retired': [int(i) for i in old_ids if i not in set(new_ids)],
+        },
+    }
+    return merged, points_gdf, notes
+
+
+def incremental_update(nodes, edges, cluster_gdf, points_gdf, base_pbf, osc_paths, network_type="drive",
+                       polygon=None, recorder=None, **cluster_options):
+    """
+    Read change files, update the network and re-cluster the changed
+    clusters, recorded as the 'network_update' and 'recluster' stages.
+
+    Parameters:
+    - nodes, edges, cluster_gdf, points_gdf: cached extract and its
+      cluster_network result
+    - base_pbf, osc_paths: base .osm.pbf and change files, oldest first
+    - network_type, polygon: options of the original extraction
+    - recorder: optional StageRecorder
+    - cluster_options: cluster_network parameters of the clustering
+
+    Returns:
+    - (nodes, edges), cluster_gdf, points_gdf of the updated network
+    - update dict from update_network
+    - notes from re-clustering
+    """
+    with stage(recorder, 'network_update'):
+        with stage(recorder, 'read_changes'):
+            changes = read_change_files(osc_paths)
+        (nodes, edges), update = update_network(nodes, edges, changes, base_pbf, network_type,
+                                                polygon=polygon, recorder=recorder)
+        add_length_miles(edges)
+    with stage(recorder, 'recluster'):
+        cluster_gdf, points_gdf, notes = recluster(edges, update, cluster_gdf, points_gdf,
+                                                   recorder=recorder, **cluster_options)
+    return (nodes, edges), cluster_gdf, points_gdf, update, notes
+
+
+def full_rebuild(base_pbf, osc_paths, updated_pbf, network_type="drive", polygon=None, recorder=None,
+                 **cluster_options):
+    """
+    Apply the change files to ``base_pbf`` as ``updated_pbf`` and rebuild
+    network and clusters from scratch, with the same stages as
+    incremental_update.
+
+    Returns:
+    - edges, cluster_gdf, points_gdf
+    """
+    with stage(recorder, 'network_update'):
+        with stage(recorder, 'apply_changes'):
+            apply_change_files(base_pbf, osc_paths, updated_pbf)
+        with stage(recorder, 'pbf_read'):
+            _, edges = read_pbf_network(updated_pbf, network_type, polygon=polygon)
+        add_length_miles(edges)
+    with stage(recorder, 'recluster'):
+        cluster_gdf, points_gdf, _ = cluster_network(edges, recorder=recorder, **cluster_options)
+    return edges, cluster_gdf, points_gdf
+
+
+def clustering_path(cache_dir, network_key, cluster_options):
+    """File of the saved clustering of a cached network with ``cluster_options``."""
+    options = json.dumps(cluster_options, sort_keys=True, default=str)
+    digest = hashlib.sha1(f"{network_key}|{options}".encode()).hexdigest()[:32]
+    return os.path.join(cache_dir, CLUSTERINGS_DIR, f"{digest}.pkl")
+
+
+def save_clustering(path, edges, cluster_gdf, points_gdf):
+    """Save a clustering of ``edges`` so the next run re-clusters from it."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump({'fingerprint': edges_fingerprint(edges), 'clusters': cluster_gdf, 'points': points_gdf}, f)
+    os.replace(tmp_path, path)
+
+
+def load_clustering(path, edges):
+    """
+    Clustering saved for ``edges`` by save_clustering.
+
+    Returns:
+    - (cluster_gdf, points_gdf), or None when nothing was saved for this
+      exact network
+    """
+    try:
+        with open(path, "rb") as f:
+            saved = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    if saved['fingerprint'] != edges_fingerprint(edges):
+        return None
+    return saved['clusters'], saved['points']
+
+
+def clusters_changed(edges_before, labels_before, edges_after, labels_after):
+    """
+    Number of clusters after an update whose set of edges matches no
+    cluster from before, whatever their ids.
+    """
+    def members(edges, labels):
+        table = pd.DataFrame({'edge': edges.index.to_flat_index(), 'cluster': labels})
+        return table[table['cluster'] >= 0].groupby('cluster')['edge'].agg(frozenset)
+
+    before = set(members(edges_before, labels_before))
+    return sum(edge_set not in before for edge_set in members(edges_after, labels_after))
+
+
+def run_summary(recorder, edges_before, points_before, edges, cluster_gdf, points_gdf, edges_updated):
+    """Counts and stage seconds of one run, a column of format_report."""
+    timings = recorder.totals(depth=0)
+    return {
+        'edges': len(edges),
+        'edges_updated': edges_updated,
+        'clusters': len(cluster_gdf),
+        'clusters_updated': clusters_changed(edges_before, edge_labels_from_points(edges_before, points_before),
+                                             edges, edge_labels_from_points(edges, points_gdf)),
+        'base_cluster_s': timings.get('base_cluster'),
+        'network_s': timings.get('network_update'),
+        'cluster_s': timings.get('recluster'),
+        'total_s': sum(timings.values()),
+    }
+
+
+def format_report(update, incremental, full=None):
+    """Side-by-side counts and stage timings of an incremental update and a full rebuild."""
+    columns = [("incremental", incremental)] + ([("full rebuild", full)] if full else [])
+    rows = [("edges in network", "edges", "{:,}"),
+            ("edges updated", "edges_updated", "{:,}"),
+            ("clusters", "clusters", "{:,}"),
+            ("clusters updated", "clusters_updated", "{:,}"),
+            ("base clustering (s)", "base_cluster_s", "{:.2f}"),
+            ("network update (s)", "network_s", "{:.2f}"),
+            ("clustering (s)", "cluster_s", "{:.2f}"),
+            ("total (s)", "total_s", "{:.2f}")]
+    lines = [f"Change files: {update['changed_nodes']:,} nodes and {update['changed_ways']:,} ways changed; "
+             f"{update['ways_touched']:,} ways touched, {update['ways_rebuilt']:,} rebuilt into "
+             f"{update['edges_rebuilt']:,} edges ({update['edges_removed']:,} removed or changed, "
+             f"{update['edges_added']:,} added or changed)",
+             "",
+             f"{'':<22}" + "".join(f"{name:>15}" for name, _ in columns),
+             "-" * (22 + 15 * len(columns))]
+    for label, key, fmt in rows:
+        cells = "".join(f"{fmt.format(values[key]) if values.get(key) is not None else '-':>15}"
+                        for _, values in columns)
+        lines.append(f"{label:<22}{cells}")
+    return "\n".join(lines)
+
+
+def compare_networks(edges, full_edges):
+    """One line comparing the incrementally updated network with a full rebuild."""
+    same = int(_same_geometry(edges, full_edges).sum())
+    return (f"Incremental network vs full rebuild: {same:,} of {len(full_edges):,} edges identical, "
+            f"{len(edges) - same:,} incremental edges differ")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('pbf', help="Base .osm.pbf the cached extract was read from")
+    parser.add_argument('--osc', nargs='+', required=True, help="Change files, oldest first")
+    query = parser.add_mutually_exclusive_group(required=True)
+    query.add_argument('--bbox', type=float, nargs=4, metavar=('NORTH', 'SOUTH', 'EAST', 'WEST'))
+    query.add_argument('--polygon', help="Boundary file with a single polygon feature")
+    parser.add_argument('--network-type', default="drive", choices=["drive", "walk", "bike", "all"])
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="Network cache directory")
+    parser.add_argument('--target-miles', type=float, default=50)
+    parser.add_argument('--point-spacing', type=float, default=0.5)
+    parser.add_argument('--sample-budget', type=int, default=None,
+                        help="Sample at most this many points, spacing chosen to fit (overrides --point-spacing)")
+    parser.add_argument('--backend', default="auto")
+    parser.add_argument('--balance-tolerance', type=float, default=BALANCE_TOLERANCE)
+    parser.add_argument('--polygon-style', default="convex")
+    parser.add_argument('--output-pbf', default=None,
+                        help="Also write the base PBF with the changes applied (base of the next update)")
+    parser.add_argument('--compare', action='store_true',
+                        help="Also run a full rebuild from the updated PBF and compare")
+    parser.add_argument('--out', default=None, help="Write the updated roads and clusters here")
+    parser.add_argument('--format', default="GeoJSON", choices=OUTPUT_FORMATS)
+    parser.add_argument('--perf-log', default=DEFAULT_LOG_PATH,
+                        help="Append per-stage timing records to this JSON-lines file")
+    args = parser.parse_args(argv)
+
+    if args.bbox:
+        polygon = bbox_polygon(*args.bbox)
+        query = {'bbox': tuple(args.bbox)}
+    else:
+        features = boundary_features(gpd.read_file(args.polygon))
+        if len(features) > 1:
+            parser.error(f"{args.polygon} has {len(features)} polygon features; incremental updates "
+                         f"take a single boundary (dissolve the features or split the file)")
+        polygon = features.geometry.iloc[0]
+        query = {'polygon': polygon}
+    cluster_options = dict(target_miles=args.target_miles, point_spacing=args.point_spacing,
+                           backend=args.backend, balance_tolerance=args.balance_tolerance,
+                           polygon_style=args.polygon_style, sample_budget=args.sample_budget)
+    cache = NetworkCache(args.cache_dir)
+
+    def network_cache_key(pbf_source_tag):
+        return (bbox_key(*args.bbox, args.network_type, pbf_source_tag) if args.bbox
+                else polygon_key(polygon, args.network_type, pbf_source_tag))
+
+    # The cached base extract and the clustering the previous run saved for
+    # it, so cluster ids carry over from the last export. Without one the
+    # base network is clustered here, timed as part of this run.
+    (nodes, edges), cached = extract_network(args.network_type, pbf_path=args.pbf, cache=cache, **query)
+    add_length_miles(edges)
+    print(f"Base network: {len(edges):,} edges ({'cached' if cached else 'extracted and cached'})")
+    recorder = StageRecorder(trace_memory=False, log_path=args.perf_log, mode="incremental",
+                             network_type=args.network_type)
+    base_path = clustering_path(args.cache_dir, network_cache_key(pbf_source(args.pbf)), cluster_options)
+    saved = load_clustering(base_path, edges)
+    if saved is not None:
+        base_clusters, base_points = saved
+        print("Base clustering: loaded from the previous run")
+    else:
+        with stage(recorder, 'base_cluster'):
+            base_clusters, base_points, _ = cluster_network(edges, **cluster_options)
+        if base_clusters is None:
+            print("Base network is too small to cluster", file=sys.stderr)
+            return 1
+        save_clustering(base_path, edges, base_clusters, base_points)
+        print("Base clustering: none saved for this network and settings; clustered from scratch")
+
+    (new_nodes, new_edges), clusters, points, update, notes = incremental_update(
+        nodes, edges, base_clusters, base_points, args.pbf, args.osc, args.network_type,
+        polygon=polygon, recorder=recorder, **cluster_options
+    )
+    recorder.flush()
+    incremental = run_summary(recorder, edges, base_points, new_edges, clusters, points,
+                              len(update['removed'].union(update['added'])))
+
+    # Cache the updated network and its clustering under its base file and
+    # change files
+    cache_key = network_cache_key(changes_source(args.pbf, args.osc))
+    cache.put(cache_key, new_nodes, new_edges,
+              description=f"{os.path.basename(args.pbf)} + {len(args.osc)} change files ({args.network_type})")
+    save_clustering(clustering_path(args.cache_dir, cache_key, cluster_options), new_edges, clusters, points)
+
+    full = None
+    if args.compare:
+        full_recorder = StageRecorder(trace_memory=False, log_path=args.perf_log, mode="full",
+                                      network_type=args.network_type)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            updated_pbf = args.output_pbf or os.path.join(tmpdir, "updated.osm.pbf")
+            full_edges, full_clusters, full_points = full_rebuild(
+                args.pbf, args.osc, updated_pbf, args.network_type, polygon=polygon,
+                recorder=full_recorder, **cluster_options
+            )
+        full_recorder.flush()
+        full = run_summary(full_recorder, edges, base_points, full_edges, full_clusters, full_points,
+                           len(full_edges))
+    elif args.output_pbf:
+        apply_change_files(args.pbf, args.osc, args.output_pbf)
+    if args.output_pbf:
+        # The next run, with the updated PBF as its base, starts from these
+        output_key = network_cache_key(pbf_source(args.output_pbf))
+        cache.put(output_key, new_nodes, new_edges,
+                  description=f"{os.path.basename(args.output_pbf)} ({args.network_type})")
+        save_clustering(clustering_path(args.cache_dir, output_key, cluster_options), new_edges, clusters, points)
+
+    print(format_report(update, incremental, full))
+    if full:
+        print()
+        print(compare_networks(new_edges, full_edges))
+    for note in notes:
+        print(f"note: {note}")
+    if args.out:
+        for path in write_outputs(args.out, new_edges, clusters, args.format):
+            print(f"wrote {path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+Per-stage timing and memory instrumentation.
+
+A StageRecorder is passed down the pipeline the same way progress
+callbacks are. Each ``with recorder.stage(name):`` block records wall time,
+CPU time and peak memory. Stages can nest, e.g. 'kmeans' and 'hulls' inside
+'cluster'. Functions accept ``recorder=None`` and use the module-level
+``stage`` helper, which does nothing without a recorder.
+
+Peak memory comes from tracemalloc. It covers Python objects and NumPy
+arrays but not memory held inside GEOS or GDAL. Tracing is process-wide,
+so stages running concurrently in other threads show up in each other's
+peaks; it is started by the first traced stage and stopped when the last
+one ends, whichever thread they run in.
+"""
+import json
+import os
+import socket
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager, nullcontext
+
+# Append stage records as JSON lines to this file when set
+DEFAULT_LOG_PATH = os.environ.get("OSM_EXTRACTOR_PERF_LOG") or None
+
+# Traced stages open across all threads, and whether they started tracemalloc
+_tracing_lock = threading.Lock()
+_tracing = {'stages': 0, 'started': False}
+
+
+def _acquire_tracing():
+    with _tracing_lock:
+        if _tracing['stages'] == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing['started'] = True
+        _tracing['stages'] += 1
+
+
+def _release_tracing():
+    with _tracing_lock:
+        _tracing['stages'] -= 1
+        if _tracing['stages'] == 0 and _tracing['started']:
+            tracemalloc.stop()
+            _tracing['started'] = False
+
+
+def stage(recorder, name):
+    """``recorder.stage(name)``, or a no-op context when recorder is None."""
+    return recorder.stage(name) if recorder is not None else nullcontext()
+
+
+class StageRecorder:
+    """
+    Collects wall time, CPU time and peak memory of named pipeline stages.
+
+    Parameters:
+    - trace_memory: measure peak memory with tracemalloc (slows
+      allocation-heavy stages somewhat)
+    - log_path: optional JSON-lines file that ``flush`` appends to
+    - context: fields added to every logged record (query, network size...)
+    """
+
+    def __init__(self, trace_memory=True, log_path=DEFAULT_LOG_PATH, **context):
+        self.trace_memory = trace_memory
+        self.log_path = log_path
+        self.context = context
+        self.run_id = uuid.uuid4().hex[:12]
+        self.records = []
+        self._open = []  # per open stage: [start traced bytes, highest peak seen]
+        self._running = []  # per open stage: (record, wall clock start)
+        self._logged = set()
+
+    @contextmanager
+    def stage(self, name):
+        """Record one stage; the block's exceptions propagate unchanged."""
+        if self.trace_memory:
+            _acquire_tracing()
+            current, peak = tracemalloc.get_traced_memory()
+            # Keep the enclosing stage's peak before resetting for this one
+            if self._open:
+                self._open[-1][1] = max(self._open[-1][1], peak)
+            tracemalloc.reset_peak()
+            self._open.append([current, current])
+        else:
+            self._open.append(None)
+        record = {'stage': name, 'depth': len(self._open) - 1}
+        self.records.append(record)
+
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        self._running.append((record, wall_start))
+        try:
+            yield record
+        finally:
+            self._running.pop()
+            # 'wall_s' marks the record finished for readers in other threads, so set it last
+            record['cpu_s'] = time.process_time() - cpu_start
+            record['wall_s'] = time.perf_counter() - wall_start
+            mark = self._open.pop()
+            if mark is not None:
+                peak = max(mark[1], tracemalloc.get_traced_memory()[1])
+                record['peak_mb'] = (peak - mark[0]) / 1024 ** 2
+                tracemalloc.reset_peak()
+                if self._open:
+                    self._open[-1][1] = max(self._open[-1][1], peak)
+                _release_tracing()
+
+    def running(self):
+        """``(stage, seconds so far)`` of the stages still open, outermost first."""
+        now = time.perf_counter()
+        return [(record['stage'], now - start) for record, start in list(self._running)]
+
+    def totals(self, depth=None):
+        """Wall seconds per stage name, summed, optionally for one nesting depth."""
+        totals = {}
+        for record in self.records:
+            if 'wall_s' in record and (depth is None or record['depth'] == depth):
+                totals[record['stage']] = totals.get(record['stage'], 0.0) + record['wall_s']
+        return totals
+
+    def table(self):
+        """Finished stage records in start order, as dicts for a DataFrame."""
+        return [{'stage': '  ' * r['depth'] + r['stage'], 'wall_s': r['wall_s'], 'cpu_s': r['cpu_s'],
+                 'peak_mb': r.get('peak_mb')}
+                for r in self.records if 'wall_s' in r]
+
+    def flush(self):
+        """Append records not yet logged to ``log_path`` as JSON lines."""
+        pending = [r for r in self.records if 'wall_s' in r and id(r) not in self._logged]
+        if not self.log_path or not pending:
+            return
+        base = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'run_id': self.run_id,
+                'host': socket.gethostname(), **self.context}
+        with open(self.log_path, 'a') as f:
+            for record in pending:
+                f.write(json.dumps({**base, **record}, default=str) + "\n")
+        self._logged.update(id(r) for r in pending)
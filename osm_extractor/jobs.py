@@ -0,0 +1,193 @@
+"""
+Background job queue shared by every session of the app.
+
+Extraction and clustering of a large area take minutes. Run inside the
+Streamlit script they tie up the session, and concurrent users asking for
+the same area each start their own download. Here they run in a small pool
+of worker threads while the page polls for the result.
+
+Jobs are keyed by what they compute: submitting a job whose key matches
+one that is queued, running or recently finished returns that job, so
+repeated clicks and concurrent requests for the same area share one
+computation. Each job records its stages on its own StageRecorder, which
+pages read to show progress.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from osm_extractor.features import extract_features
+from osm_extractor.instrumentation import StageRecorder
+from osm_extractor.pipeline import extract_network, cluster_network
+
+DEFAULT_WORKERS = int(os.environ.get("OSM_EXTRACTOR_JOB_WORKERS", "2"))
+
+# Finished jobs stay available to polling pages and repeated requests this long
+FINISHED_TTL_SECONDS = float(os.environ.get("OSM_EXTRACTOR_JOB_TTL", "600"))
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+
+class Job:
+    """
+    One background computation.
+
+    Attributes:
+    - id: unique job id, safe to keep in session state
+    - key: deduplication key
+    - label: what is computed, for display
+    - status: 'queued', 'running', 'done' or 'failed'
+    - recorder: StageRecorder the job's stages are recorded on
+    - progress: (done, total) steps of the running stage, or None
+    - requests: how many submissions this job serves
+    - result: return value once done
+    - error: the exception once failed
+    """
+
+    def __init__(self, key, label, trace_memory=False):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.label = label
+        self.status = "queued"
+        self.recorder = StageRecorder(trace_memory=trace_memory, job=label)
+        self.progress = None
+        self.requests = 1
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._finished = threading.Event()
+
+    @property
+    def done(self):
+        """True once the job succeeded or failed."""
+        return self._finished.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the job finishes or ``timeout`` seconds pass; True if finished."""
+        return self._finished.wait(timeout)
+
+    def set_progress(self, done, total):
+        """Progress callback for stages made of countable steps (e.g. tiles)."""
+        self.progress = (done, total)
+
+    def elapsed(self):
+        """Seconds since the job started running (0 while queued)."""
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+
+class JobQueue:
+    """
+    Keyed job queue over a pool of worker threads.
+
+    Parameters:
+    - max_workers: worker threads; jobs beyond that wait in the queue
+    - finished_ttl: seconds finished jobs are kept for pollers and reuse
+    """
+
+    def __init__(self, max_workers=DEFAULT_WORKERS, finished_ttl=FINISHED_TTL_SECONDS):
+        self.finished_ttl = finished_ttl
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="osm-job")
+        self._lock = threading.Lock()
+        self._jobs = {}  # id -> Job
+        self._by_key = {}  # key -> latest Job for that key
+
+    def submit(self, key, fn, *args, label=None, trace_memory=False, **kwargs):
+        """
+        Run ``fn(job, *args, **kwargs)`` in the background, or join the
+        queued, running or recently finished job with the same ``key``.
+        Stages are traced for memory when ``trace_memory`` is set.
+
+        Failed jobs are not reused, so submitting again retries.
+
+        Returns:
+        - the Job
+        """
+        with self._lock:
+            self._expire()
+            job = self._by_key.get(key)
+            if job is not None and job.status != "failed":
+                job.requests += 1
+                return job
+            job = Job(key, label or str(key), trace_memory=trace_memory)
+            self._jobs[job.id] = job
+            self._by_key[key] = job
+        self._pool.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        """The job with ``job_id``, or None once it expired."""
+        with self._lock:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        """Job counts by status."""
+        with self._lock:
+            self._expire()
+            counts = dict.fromkeys(JOB_STATUSES, 0)
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.status = "done"
+        except Exception as error:
+            job.error = error
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            job.progress = None
+            job.recorder.flush()
+            job._finished.set()
+
+    def _expire(self):
+        # Caller holds the lock
+        cutoff = time.time() - self.finished_ttl
+        for job_id, job in list(self._jobs.items()):
+            if job.finished_at is not None and job.finished_at < cutoff:
+                del self._jobs[job_id]
+                if self._by_key.get(job.key) is job:
+                    del self._by_key[job.key]
+
+
+def extraction_job(job, network_type, **query):
+    """
+    Job function extracting a network; ``query`` is passed to extract_network.
+
+    Returns:
+    - (nodes, edges) GeoDataFrames
+    - True if the network came from the cache
+    """
+    return extract_network(network_type, progress=job.set_progress, recorder=job.recorder, **query)
+
+
+def feature_extraction_job(job, features, network_type, **options):
+    """
+    Job function extracting every feature of a boundary layer; ``options``
+    are passed to extract_features.
+
+    Returns:
+    - (nodes, edges) GeoDataFrames, edges tagged with ``feature_id``
+    - True if every fetch came from the cache
+    """
+    return extract_features(features, network_type, progress=job.set_progress, recorder=job.recorder, **options)
+
+
+def clustering_job(job, edges, **params):
+    """
+    Job function clustering a network; ``params`` are passed to cluster_network.
+
+    Returns:
+    - cluster_gdf, points_gdf, notes
+    """
+    return cluster_network(edges, recorder=job.recorder, **params)
@@ -0,0 +1,161 @@
+"""
+Single-layer map rendering of road networks and clusters.
+
+Adding one ``folium.PolyLine`` per edge is slow to build and heavy to ship
+to the browser, so the preview used to show only a random sample. Here the
+whole network is serialized once as one GeoJSON FeatureCollection with
+simplified, rounded geometry, and clusters are colored through a style
+property on each feature instead of one layer per cluster.
+"""
+import json
+import time
+
+import numpy as np
+import shapely
+from branca.element import MacroElement
+from jinja2 import Template
+
+# Approximate meters per degree of latitude, for simplification tolerances
+METERS_PER_DEGREE = 111_320.0
+
+# Default simplification tolerance; well below a pixel at street zoom levels
+SIMPLIFY_METERS = 5.0
+
+# Coordinate grid for the payload (1e-5 degrees is about 1 m)
+COORDINATE_PRECISION = 1e-5
+
+NETWORK_COLOR = '#3366cc'
+UNASSIGNED_COLOR = '#888888'
+CLUSTER_COLORS = [
+    '#e6194b', '#3cb44b', '#4363d8', '#f58231', '#911eb4', '#42d4f4',
+    '#f032e6', '#9a6324', '#469990', '#800000', '#808000', '#000075',
+    '#bfef45', '#dcbeff', '#fabed4', '#ffd8b1', '#aaffc3', '#a9a9a9',
+]
+
+
+def cluster_color(cluster_id):
+    """Palette color for a cluster id, gray for unassigned (-1)."""
+    if cluster_id < 0:
+        return UNASSIGNED_COLOR
+    return CLUSTER_COLORS[int(cluster_id) % len(CLUSTER_COLORS)]
+
+
+def _simplify(geoms, simplify_meters):
+    geoms = np.asarray(geoms)
+    if simplify_meters:
+        geoms = shapely.simplify(geoms, simplify_meters / METERS_PER_DEGREE, preserve_topology=False)
+    return shapely.set_precision(geoms, COORDINATE_PRECISION)
+
+
+def feature_collection(geoms, properties, simplify_meters=SIMPLIFY_METERS):
+    """
+    Serialize geometries and per-feature properties as one GeoJSON string.
+
+    Geometry is written by GEOS in a single vectorized call, so the cost is
+    a string join rather than a Python object per coordinate.
+
+    Parameters:
+    - geoms: array of EPSG:4326 geometries
+    - properties: dict of column name -> array or list, one value per geometry
+    - simplify_meters: simplification tolerance (0 keeps every vertex)
+
+    Returns:
+    - FeatureCollection as a JSON string
+    """
+    geometry_json = shapely.to_geojson(_simplify(geoms, simplify_meters))
+    columns = list(properties)
+    rows = zip(*(np.asarray(properties[c]).tolist() if isinstance(properties[c], np.ndarray)
+                 else properties[c] for c in columns))
+    features = (
+        '{"type":"Feature","properties":%s,"geometry":%s}'
+        % (json.dumps(dict(zip(columns, row)), separators=(',', ':')), geometry)
+        for row, geometry in zip(rows, geometry_json)
+        if geometry is not None
+    )
+    return '{"type":"FeatureCollection","features":[%s]}' % ','.join(features)
+
+
+def network_layer(edges_gdf, edge_labels=None, simplify_meters=SIMPLIFY_METERS):
+    """
+    Build the GeoJSON payload for the full road network.
+
+    Each feature carries its stroke color in a ``color`` property, read
+    client-side by NetworkLayer.
+
+    Parameters:
+    - edges_gdf: GeoDataFrame of road edges
+    - edge_labels: optional cluster label per edge; colors each road by
+      its cluster
+    - simplify_meters: simplification tolerance
+
+    Returns:
+    - FeatureCollection JSON string
+    - dict with 'features', 'bytes' and 'seconds' spent serializing
+    """
+    start = time.perf_counter()
+    if edges_gdf.crs is not None and edges_gdf.crs.to_epsg() != 4326:
+        edges_gdf = edges_gdf.to_crs(epsg=4326)
+
+    if edge_labels is None:
+        properties = {'color': [NETWORK_COLOR] * len(edges_gdf)}
+    else:
+        edge_labels = np.asarray(edge_labels, dtype=np.int64)
+        properties = {'cluster': edge_labels,
+                      'color': [cluster_color(label) for label in edge_labels.tolist()]}
+
+    payload = feature_collection(edges_gdf.geometry.to_numpy(), properties, simplify_meters)
+    return payload, {
+        'features': len(edges_gdf),
+        'bytes': len(payload),
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def cluster_layer(cluster_gdf, simplify_meters=SIMPLIFY_METERS):
+    """
+    GeoJSON payload for cluster polygons, colored like network_layer.
+
+    Path options go in a ``style`` property, which ``folium.GeoJson``
+    applies client-side when no ``style_function`` is given.
+    """
+    cluster_gdf = cluster_gdf.to_crs(epsg=4326)
+    cluster_ids = cluster_gdf['cluster_id'].to_numpy()
+    colors = [cluster_color(c) for c in cluster_ids.tolist()]
+    properties = {
+        'cluster_id': cluster_ids,
+        'total_miles': np.round(cluster_gdf['total_miles'].to_numpy(dtype=float), 1),
+        'style': [{'color': c, 'fillColor': c, 'weight': 2, 'fillOpacity': 0.2} for c in colors],
+    }
+    return feature_collection(cluster_gdf.geometry.to_numpy(), properties, simplify_meters)
+
+
+class NetworkLayer(MacroElement):
+    """
+    Leaflet GeoJSON layer that embeds a prebuilt payload verbatim.
+
+    ``folium.GeoJson`` parses its input and serializes it again while
+    rendering, which dominates the cost for large networks. This element
+    writes the string from network_layer straight into the page and styles
+    each road from its ``color`` property. Add it to a map created with
+    ``prefer_canvas=True`` so Leaflet draws one canvas instead of one SVG
+    path per road.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = L.geoJson({{ this.payload }}, {
+            style: function(feature) {
+                return {color: feature.properties.color, weight: {{ this.weight }}, opacity: {{ this.opacity }}};
+            },
+            interactive: false
+        }).addTo({{ this._parent.get_name() }});
+        {% endmacro %}
+    """)
+
+    def __init__(self, payload, weight=2, opacity=0.7):
+        super().__init__()
+        self._name = 'NetworkLayer'
+        # Keep a '</script>' inside the data from closing the script tag
+        self.payload = payload.replace('</', '<\\/')
+        self.weight = weight
+        self.opacity = opacity
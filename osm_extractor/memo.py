@@ -0,0 +1,89 @@
+"""
+In-memory memoization of clustering results.
+
+Streamlit reruns the whole script on every widget change. Points and
+clusters depend only on the road network and the clustering parameters, so
+results are kept in a small LRU keyed on a content hash of the edges plus
+those parameters. Several parameter combinations live side by side, which
+makes switching back and forth between them instant.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import shapely
+
+# Clustering runs kept per memo
+DEFAULT_MAX_ENTRIES = 8
+
+
+def edges_fingerprint(edges):
+    """
+    Content hash of a road network: edge ids, lengths, geometry and, for
+    multi-feature networks, the feature of each edge.
+
+    Derived columns such as ``length_mi`` do not change the fingerprint.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(pd.util.hash_pandas_object(edges.index.to_frame(index=False), index=False).to_numpy().tobytes())
+    digest.update(np.ascontiguousarray(edges['length'].to_numpy(dtype=float)).tobytes())
+    geoms = edges.geometry.to_numpy()
+    digest.update(shapely.get_num_coordinates(geoms).tobytes())
+    digest.update(shapely.get_coordinates(geoms).tobytes())
+    if 'feature_id' in edges:
+        digest.update(pd.util.hash_pandas_object(edges['feature_id'], index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class ClusterMemo:
+    """
+    Bounded LRU of clustering results.
+
+    Keys are ``(edges fingerprint, parameters)`` and values whatever the
+    caller stores, typically ``(cluster_gdf, points_gdf, notes)``.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(fingerprint, **params):
+        """Hashable memo key for a network fingerprint and parameters."""
+        return (fingerprint, tuple(sorted(params.items())))
+
+    def get(self, key):
+        """Return the stored value for ``key`` and mark it recently used, or None."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+    def put(self, key, value):
+        """Store ``value`` under ``key``, evicting the least recently used entry if full."""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def entries(self, fingerprint=None):
+        """``(params, value)`` pairs, most recent first, optionally for one network only."""
+        with self._lock:
+            return [(dict(params), value) for (fp, params), value in reversed(self._entries.items())
+                    if fingerprint is None or fp == fingerprint]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,229 @@
+"""
+Persistent on-disk cache of processed road networks.
+
+osmnx only caches raw Overpass responses, so graph building, simplification
+and ``graph_to_gdfs`` run again for every request. This cache stores the
+resulting ``nodes`` and ``edges`` GeoDataFrames as GeoParquet, keyed by the
+normalized query and network type, with a total size cap and least recently
+used eviction.
+
+Several processes (batch workers, app sessions) may share one cache
+directory: every index update re-reads ``index.json`` under a lock file
+and writes it back before the lock is released, so no process overwrites
+entries another one added.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of one process are serialised
+    fcntl = None
+
+import geopandas as gpd
+import shapely
+
+DEFAULT_CACHE_DIR = os.environ.get("OSM_EXTRACTOR_CACHE_DIR", "network_cache")
+DEFAULT_MAX_BYTES = int(float(os.environ.get("OSM_EXTRACTOR_CACHE_MAX_MB", "2048")) * 1024 ** 2)
+
+# Bounding boxes are rounded to this many degrees (~11 m) before hashing
+BBOX_TOLERANCE = 1e-4
+
+_INDEX_FILE = "index.json"
+_LOCK_FILE = "index.lock"
+
+
+def _digest(*parts):
+    return hashlib.sha256("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:32]
+
+
+def place_key(place_name, network_type, source="overpass"):
+    """Cache key for a place-name query (case and whitespace insensitive)."""
+    normalized = " ".join(place_name.lower().split())
+    return _digest("place", normalized, network_type, source)
+
+
+def bbox_key(north, south, east, west, network_type, source="overpass", tolerance=BBOX_TOLERANCE):
+    """Cache key for a bounding box query, rounded to ``tolerance`` degrees."""
+    rounded = [round(round(c / tolerance) * tolerance, 7) for c in (north, south, east, west)]
+    return _digest("bbox", *rounded, network_type, source)
+
+
+def _polygon_digest(polygon):
+    normalized = shapely.normalize(shapely.set_precision(polygon, 1e-7))
+    return hashlib.sha256(shapely.to_wkb(normalized)).hexdigest()
+
+
+def polygon_key(polygon, network_type, source="overpass"):
+    """Cache key for a polygon query, from a hash of its normalized WKB."""
+    return _digest("polygon", _polygon_digest(polygon), network_type, source)
+
+
+def tile_key(tile, network_type, source="overpass"):
+    """
+    Cache key for one tile of a tiled extraction.
+
+    Tiles are stored unsimplified and untruncated, so they must never be
+    returned for an ordinary polygon query of the same shape.
+    """
+    return _digest("tile", _polygon_digest(tile), network_type, source)
+
+
+def pbf_source(pbf_path):
+    """Cache ``source`` tag for a local PBF file, changing whenever the file does."""
+    return f"pbf:{os.path.abspath(pbf_path)}:{os.path.getmtime(pbf_path)}"
+
+
+def encode_object_columns(gdf):
+    """
+    JSON-encode object columns so they round-trip through Parquet.
+
+    osmnx attributes such as ``osmid`` or ``highway`` mix scalars and lists
+    within one column, which Arrow cannot store directly.
+    """
+    encoded = gdf.copy()
+    columns = [c for c in encoded.columns
+               if c != encoded.geometry.name and encoded[c].dtype == object]
+    for column in columns:
+        encoded[column] = [
+            None if value is None or (isinstance(value, float) and value != value)
+            else json.dumps(value, default=str)
+            for value in encoded[column]
+        ]
+    return encoded, columns
+
+
+def decode_object_columns(gdf, columns):
+    """Parse the JSON columns written by encode_object_columns in place."""
+    for column in columns:
+        # All-null columns come back from Parquet as NaN rather than None
+        gdf[column] = [json.loads(value) if isinstance(value, str) else None for value in gdf[column]]
+    return gdf
+
+
+class NetworkCache:
+    """
+    Size-capped LRU cache of ``(nodes, edges)`` GeoDataFrames on disk.
+
+    Entries and hit/miss counters are kept in an ``index.json`` next to the
+    Parquet files so they survive app restarts. The index is re-read on
+    every access, so instances in different processes stay consistent.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _index_path(self):
+        return os.path.join(self.cache_dir, _INDEX_FILE)
+
+    def _load_index(self):
+        try:
+            with open(self._index_path()) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        index.setdefault("entries", {})
+        index.setdefault("hits", 0)
+        index.setdefault("misses", 0)
+        return index
+
+    def _save_index(self, index):
+        # Per-process temporary name: batch workers share one cache directory
+        tmp_path = f"{self._index_path()}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self._index_path())
+
+    @contextmanager
+    def _locked_index(self, save=True):
+        """Current index, held under the thread lock and the cache's lock file."""
+        with self._lock, open(os.path.join(self.cache_dir, _LOCK_FILE), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            index = self._load_index()
+            yield index
+            if save:
+                self._save_index(index)
+
+    def _paths(self, key):
+        return (os.path.join(self.cache_dir, f"{key}.nodes.parquet"),
+                os.path.join(self.cache_dir, f"{key}.edges.parquet"))
+
+    def get(self, key):
+        """Return cached ``(nodes, edges)`` for ``key``, or None on a miss."""
+        with self._locked_index() as index:
+            entry = index["entries"].get(key)
+            nodes_path, edges_path = self._paths(key)
+            if entry is None or not (os.path.exists(nodes_path) and os.path.exists(edges_path)):
+                index["entries"].pop(key, None)
+                index["misses"] += 1
+                return None
+
+            nodes = decode_object_columns(gpd.read_parquet(nodes_path), entry["node_json_columns"])
+            edges = decode_object_columns(gpd.read_parquet(edges_path), entry["edge_json_columns"])
+            entry["last_access"] = time.time()
+            index["hits"] += 1
+            return nodes, edges
+
+    def put(self, key, nodes, edges, description=""):
+        """Store ``(nodes, edges)`` under ``key`` and evict old entries if over the cap."""
+        nodes_encoded, node_json_columns = encode_object_columns(nodes)
+        edges_encoded, edge_json_columns = encode_object_columns(edges)
+        nodes_path, edges_path = self._paths(key)
+
+        # Write under temporary names so readers never see partial files
+        tmp_suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        for gdf, path in ((nodes_encoded, nodes_path), (edges_encoded, edges_path)):
+            gdf.to_parquet(path + tmp_suffix, compression="zstd")
+
+        with self._locked_index() as index:
+            for path in (nodes_path, edges_path):
+                os.replace(path + tmp_suffix, path)
+            index["entries"][key] = {
+                "description": description,
+                "size": os.path.getsize(nodes_path) + os.path.getsize(edges_path),
+                "last_access": time.time(),
+                "node_json_columns": node_json_columns,
+                "edge_json_columns": edge_json_columns,
+            }
+            self._evict(index)
+
+    def _evict(self, index):
+        entries = index["entries"]
+        total = sum(entry["size"] for entry in entries.values())
+        for key in sorted(entries, key=lambda k: entries[k]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            total -= entries.pop(key)["size"]
+            for path in self._paths(key):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def clear(self):
+        """Remove every cached network and reset the counters."""
+        with self._locked_index() as index:
+            for key in list(index["entries"]):
+                for path in self._paths(key):
+                    if os.path.exists(path):
+                        os.remove(path)
+            index.clear()
+            index.update(entries={}, hits=0, misses=0)
+
+    def stats(self):
+        """Hit/miss counters and current size of the cache."""
+        with self._locked_index(save=False) as index:
+            entries = index["entries"]
+            return {
+                "hits": index["hits"],
+                "misses": index["misses"],
+                "entries": len(entries),
+                "size_bytes": sum(entry["size"] for entry in entries.values()),
+                "max_bytes": self.max_bytes,
+            }
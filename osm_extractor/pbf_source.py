@@ -0,0 +1,253 @@
+"""
+Offline road network extraction from a local ``.osm.pbf`` extract.
+
+The file is streamed twice with pyosmium. Highway ways are filtered with
+the same tag rules osmnx sends to Overpass for each ``network_type``.
+Without a clip polygon the first pass reads those ways and the second the
+nodes they reference. With a clip polygon the first pass keeps only the
+nodes inside the polygon's bounding box and the ways that reference them,
+so memory grows with the clip area rather than the file; the second pass
+fetches the outside nodes of ways crossing the boundary. The kept ways
+are written to a temporary OSM XML file and built with
+``ox.graph_from_xml``, so one-way handling, simplification and edge
+lengths match the Overpass path exactly.
+"""
+import os
+import re
+import tempfile
+import time
+
+import numpy as np
+import osmnx as ox
+import shapely
+from shapely.geometry import box
+
+try:
+    from osmnx._overpass import _get_network_filter
+except ImportError:  # osmnx < 2.0
+    from osmnx.downloader import _get_osm_filter as _get_network_filter
+
+try:
+    import osmium
+except ImportError:  # optional dependency, only needed for PBF extraction
+    osmium = None
+
+_FILTER_PATTERN = re.compile(r'\["(?P<key>[^"]+)"(?:(?P<op>!?~)"(?P<value>[^"]*)")?\]')
+
+
+def network_filter(network_type):
+    """
+    Translate osmnx's Overpass filter for ``network_type`` into tag rules.
+
+    Returns a list of ``(key, op, regex)`` tuples where ``op`` is None (the
+    key must be present), '~' (value must match) or '!~' (value must not
+    match, or the key is absent), mirroring Overpass semantics.
+    """
+    rules = []
+    for match in _FILTER_PATTERN.finditer(_get_network_filter(network_type)):
+        value = match.group('value')
+        rules.append((match.group('key'), match.group('op'), re.compile(value) if value is not None else None))
+    return rules
+
+
+def way_matches(tags, rules):
+    """True if a way's tag dict passes every rule from network_filter."""
+    for key, op, regex in rules:
+        value = tags.get(key)
+        if op is None:
+            if value is None:
+                return False
+        elif op == '~':
+            if value is None or not regex.search(value):
+                return False
+        elif value is not None and regex.search(value):
+            return False
+    return True
+
+
+def useful_way_tags(rules):
+    """Way tags osmnx keeps as edge attributes, plus the keys the filter tests."""
+    return set(ox.settings.useful_tags_way) | {key for key, _, _ in rules}
+
+
+def bbox_polygon(north, south, east, west):
+    """Clip polygon for a bounding box query."""
+    return box(west, south, east, north)
+
+
+def read_nodes(pbf_path, node_ids):
+    """
+    Locations and osmnx-relevant tags of the nodes ``node_ids``.
+
+    Returns:
+    - dict of node id -> (lon, lat)
+    - dict of node id -> tag dict, for nodes with useful tags only
+    """
+    useful_node_tags = set(ox.settings.useful_tags_node)
+    node_xy = {}
+    node_tags = {}
+    processor = osmium.FileProcessor(pbf_path, osmium.osm.NODE).with_filter(osmium.filter.IdFilter(node_ids))
+    for node in processor:
+        node_xy[node.id] = (node.location.lon, node.location.lat)
+        tags = {tag.k: tag.v for tag in node.tags if tag.k in useful_node_tags}
+        if tags:
+            node_tags[node.id] = tags
+    return node_xy, node_tags
+
+
+def graph_from_ways(ways, node_xy, node_tags, network_type="drive", simplify=True):
+    """
+    Build an osmnx graph from filtered ways.
+
+    The ways are handed to osmnx through a temporary OSM XML file, so the
+    graph is built exactly as for an Overpass response.
+
+    Parameters:
+    - ways: list of (way id, node refs, tag dict)
+    - node_xy, node_tags: see read_nodes; every referenced node needs a location
+    - network_type: decides whether one-way tags are honoured
+    - simplify: merge interstitial nodes into single edges
+
+    Returns:
+    - MultiDiGraph with every connected piece retained
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        xml_path = os.path.join(tmpdir, "network.osm")
+        writer = osmium.SimpleWriter(xml_path)
+        try:
+            for node_id in sorted({ref for _, refs, _ in ways for ref in refs}):
+                writer.add_node(osmium.osm.mutable.Node(
+                    id=node_id, location=node_xy[node_id], tags=node_tags.get(node_id, {})
+                ))
+            for way_id, refs, tags in ways:
+                writer.add_way(osmium.osm.mutable.Way(id=way_id, nodes=refs, tags=tags))
+        finally:
+            writer.close()
+
+        bidirectional = network_type in ox.settings.bidirectional_network_types
+        return ox.graph_from_xml(xml_path, bidirectional=bidirectional, simplify=simplify, retain_all=True)
+
+
+def _read_ways(pbf_path, rules, useful_tags):
+    """Every highway way of the file that passes the network_type filter."""
+    ways = []
+    highway_ways = 0
+    processor = osmium.FileProcessor(pbf_path, osmium.osm.WAY).with_filter(osmium.filter.KeyFilter('highway'))
+    for way in processor:
+        highway_ways += 1
+        tags = {tag.k: tag.v for tag in way.tags}
+        if way_matches(tags, rules):
+            ways.append((way.id, [node.ref for node in way.nodes],
+                         {k: v for k, v in tags.items() if k in useful_tags}))
+    return ways, highway_ways
+
+
+def _read_clipped(pbf_path, polygon, rules, useful_tags):
+    """
+    Filtered highway ways with at least one node inside ``polygon``, and the
+    locations and tags of every node they reference.
+
+    One pass over the nodes and highway ways keeps only nodes inside the
+    polygon's bounding box and ways referencing one of them; a second pass
+    reads the outside nodes of the kept ways. Nodes must precede ways in
+    the file, as in every sorted OSM extract.
+    """
+    west, south, east, north = polygon.bounds
+    useful_node_tags = set(ox.settings.useful_tags_node)
+    node_xy = {}
+    node_tags = {}
+    ways = []
+    highway_ways = 0
+    processor = osmium.FileProcessor(pbf_path, osmium.osm.NODE | osmium.osm.WAY) \
+        .with_filter(osmium.filter.KeyFilter('highway').enable_for(osmium.osm.WAY))
+    for obj in processor:
+        if obj.is_node():
+            lon, lat = obj.location.lon, obj.location.lat
+            if west <= lon <= east and south <= lat <= north:
+                node_xy[obj.id] = (lon, lat)
+                if obj.tags:
+                    tags = {tag.k: tag.v for tag in obj.tags if tag.k in useful_node_tags}
+                    if tags:
+                        node_tags[obj.id] = tags
+            continue
+        highway_ways += 1
+        refs = [node.ref for node in obj.nodes]
+        if not any(ref in node_xy for ref in refs):
+            continue
+        tags = {tag.k: tag.v for tag in obj.tags}
+        if way_matches(tags, rules):
+            ways.append((obj.id, refs, {k: v for k, v in tags.items() if k in useful_tags}))
+
+    # Keep ways with at least one node inside the clip polygon
+    ids = np.fromiter(node_xy.keys(), dtype=np.int64, count=len(node_xy))
+    xy = np.array(list(node_xy.values()), dtype=float).reshape(-1, 2)
+    shapely.prepare(polygon)
+    inside = set(ids[shapely.contains_xy(polygon, xy[:, 0], xy[:, 1])].tolist())
+    ways = [way for way in ways if any(ref in inside for ref in way[1])]
+
+    referenced = {ref for _, refs, _ in ways for ref in refs}
+    node_xy = {ref: node_xy[ref] for ref in referenced if ref in node_xy}
+    node_tags = {ref: node_tags[ref] for ref in referenced if ref in node_tags}
+    outside = referenced - node_xy.keys()
+    if outside:
+        outside_xy, outside_tags = read_nodes(pbf_path, outside)
+        node_xy.update(outside_xy)
+        node_tags.update(outside_tags)
+    return ways, highway_ways, node_xy, node_tags
+
+
+def read_pbf_network(pbf_path, network_type="drive", polygon=None, retain_all=False,
+                     truncate_by_edge=False, simplify=True):
+    """
+    Extract a road network from a local PBF file.
+
+    Parameters:
+    - pbf_path: path to an .osm.pbf (or .osm) extract
+    - network_type: 'drive', 'walk', 'bike' or 'all'
+    - polygon: optional EPSG:4326 clip polygon (place boundary, bbox or upload)
+    - retain_all: keep disconnected pieces instead of the largest component
+    - truncate_by_edge: keep edges that cross the polygon boundary
+    - simplify: merge interstitial nodes into single edges, as osmnx does
+
+    Returns:
+    - (nodes, edges) GeoDataFrames as produced by ``ox.graph_to_gdfs``,
+      with scan statistics in ``edges.attrs['pbf_stats']``
+    """
+    if osmium is None:
+        raise ImportError("PBF extraction requires pyosmium: pip install osmium")
+    if not os.path.exists(pbf_path):
+        raise FileNotFoundError(f"PBF file not found: {pbf_path}")
+
+    rules = network_filter(network_type)
+    useful_tags = useful_way_tags(rules)
+    start = time.perf_counter()
+
+    if polygon is None:
+        ways, highway_ways = _read_ways(pbf_path, rules, useful_tags)
+        ways_seconds = time.perf_counter() - start
+        node_xy, node_tags = read_nodes(pbf_path, {ref for _, refs, _ in ways for ref in refs})
+    else:
+        ways, highway_ways, node_xy, node_tags = _read_clipped(pbf_path, polygon, rules, useful_tags)
+        ways_seconds = time.perf_counter() - start
+    ways = [way for way in ways if all(ref in node_xy for ref in way[1])]
+    if not ways:
+        raise ValueError(f"No '{network_type}' roads found in {os.path.basename(pbf_path)} for this area")
+
+    G = graph_from_ways(ways, node_xy, node_tags, network_type, simplify=simplify)
+
+    if polygon is not None:
+        G = ox.truncate.truncate_graph_polygon(G, polygon, truncate_by_edge=truncate_by_edge)
+    if not retain_all:
+        try:
+            G = ox.truncate.largest_component(G, strongly=False)
+        except AttributeError:  # osmnx < 2.0
+            G = ox.utils_graph.get_largest_component(G, strongly=False)
+
+    nodes, edges = ox.graph_to_gdfs(G)
+    edges.attrs['pbf_stats'] = {
+        'highway_ways_scanned': highway_ways,
+        'ways_kept': len(ways),
+        'ways_per_second': highway_ways / ways_seconds if ways_seconds > 0 else float('inf'),
+        'seconds': time.perf_counter() - start,
+    }
+    return nodes, edges
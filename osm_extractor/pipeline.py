@@ -0,0 +1,278 @@
+"""
+Extract -> sample -> cluster -> export pipeline shared by every front end.
+
+Nothing here touches Streamlit: the app and the batch CLI call the same
+functions and decide themselves how to report progress, notes and errors.
+"""
+import os
+
+import numpy as np
+
+from osm_extractor import METERS_PER_MILE
+from osm_extractor.balancing import BALANCE_TOLERANCE
+from osm_extractor.clustering import create_cluster_polygons
+from osm_extractor.edge_store import edge_store
+from osm_extractor.export import export_shapefile_zip, export_geopackage, SINGLE_LAYER_FORMATS
+from osm_extractor.instrumentation import stage
+from osm_extractor.memo import edges_fingerprint
+from osm_extractor.network_cache import place_key, bbox_key, polygon_key, pbf_source
+from osm_extractor.sampling import generate_points_along_lines
+
+OUTPUT_FORMATS = ("GeoJSON", "Shapefile", "GeoPackage", "GeoParquet", "FlatGeobuf")
+
+
+class PlaceNotFoundError(ValueError):
+    """Raised when a place name cannot be geocoded."""
+
+
+def network_key(network_type, place=None, bbox=None, polygon=None, pbf_path=None):
+    """
+    Network cache key of a query: the normalized place name, bounding box or
+    polygon, the network type and the data source. Requests with equal keys
+    get the same network.
+
+    Raises ValueError unless exactly one valid query is given.
+    """
+    if sum(query is not None for query in (place, bbox, polygon)) != 1:
+        raise ValueError("Give exactly one of place, bbox or polygon")
+
+    source = pbf_source(pbf_path) if pbf_path else "overpass"
+    if place is not None:
+        return place_key(place, network_type, source)
+    if bbox is not None:
+        north, south, east, west = bbox
+        if north <= south:
+            raise ValueError("North latitude must be greater than South latitude")
+        if east <= west:
+            raise ValueError("East longitude must be greater than West longitude")
+        return bbox_key(north, south, east, west, network_type, source)
+    return polygon_key(polygon, network_type, source)
+
+
+def extract_network(network_type="drive", place=None, bbox=None, polygon=None,
+                    pbf_path=None, cache=None, tile_km=None, max_workers=None,
+                    progress=None, description=None, recorder=None):
+    """
+    Extract the road network for a place name, bounding box or polygon.
+
+    Exactly one of ``place``, ``bbox`` or ``polygon`` is given. The network
+    cache is checked first; on a miss the network is read from ``pbf_path``
+    if set, otherwise downloaded from Overpass, tile by tile when
+    ``tile_km`` is set (bounding boxes and polygons only).
+
+    Parameters:
+    - network_type: 'drive', 'walk', 'bike' or 'all'
+    - place: place name to geocode
+    - bbox: (north, south, east, west) in degrees
+    - polygon: EPSG:4326 boundary polygon
+    - pbf_path: optional local .osm.pbf extract
+    - cache: optional NetworkCache
+    - tile_km, max_workers, progress: tiled extraction options
+    - description: cache entry description (defaults to the query)
+    - recorder: optional StageRecorder for the 'cache_lookup', 'geocode',
+      download/read, 'graph_to_gdfs' and 'cache_write' stages
+
+    Returns:
+    - (nodes, edges) GeoDataFrames
+    - True if the network came from the cache
+    """
+    key = network_key(network_type, place=place, bbox=bbox, polygon=polygon, pbf_path=pbf_path)
+    cache_source = pbf_source(pbf_path) if pbf_path else "overpass"
+    if place is not None:
+        description = description or f"place: {place} ({network_type})"
+    elif bbox is not None:
+        description = description or f"bbox: {', '.join(str(c) for c in bbox)} ({network_type})"
+    else:
+        description = description or f"polygon ({network_type})"
+
+    if cache is not None:
+        with stage(recorder, 'cache_lookup'):
+            cached = cache.get(key)
+        if cached is not None:
+            return cached, True
+
+    # osmnx and the extraction modules load on the first cache miss rather
+    # than with the pipeline, so clustering and cached networks start fast
+    import osmnx as ox
+    from osm_extractor.pbf_source import read_pbf_network, bbox_polygon
+    from osm_extractor.tiling import extract_tiled
+
+    if bbox is not None:
+        polygon = bbox_polygon(*bbox)
+    if place is not None:
+        with stage(recorder, 'geocode'):
+            try:
+                polygon = ox.geocode_to_gdf(place).geometry.iloc[0]
+            except Exception as error:
+                raise PlaceNotFoundError(f"Could not find '{place}'") from error
+        tile_km = None  # place boundaries are extracted in one piece
+
+    if tile_km:
+        with stage(recorder, 'tiled_extract'):
+            nodes, edges = extract_tiled(polygon, network_type, tile_km=tile_km, max_workers=max_workers,
+                                         cache=cache, cache_source=cache_source,
+                                         pbf_path=pbf_path, progress=progress)
+    elif pbf_path:
+        with stage(recorder, 'pbf_read'):
+            nodes, edges = read_pbf_network(pbf_path, network_type, polygon=polygon)
+    else:
+        with stage(recorder, 'overpass_download'):
+            G = ox.graph_from_polygon(polygon, network_type=network_type)
+        with stage(recorder, 'graph_to_gdfs'):
+            nodes, edges = ox.graph_to_gdfs(G)
+
+    if cache is not None:
+        with stage(recorder, 'cache_write'):
+            cache.put(key, nodes, edges, description=description)
+    return (nodes, edges), False
+
+
+def add_length_miles(edges):
+    """Add a ``length_mi`` column from the osmnx ``length`` in meters."""
+    edges['length_mi'] = edges['length'] / METERS_PER_MILE
+    return edges
+
+
+def cluster_count(total_miles, target_miles):
+    """Number of clusters needed for ``target_miles`` per cluster."""
+    return max(1, int(np.ceil(total_miles / target_miles)))
+
+
+def cluster_network(edges, target_miles=50, point_spacing=0.5, backend="auto",
+                    balance_tolerance=BALANCE_TOLERANCE, polygon_style="convex", sample_budget=None,
+                    memo=None, recorder=None):
+    """
+    Sample points along the roads and group them into mileage-balanced clusters.
+
+    Networks with a ``feature_id`` column are clustered feature by feature
+    (see features.cluster_features), even when only one feature has roads.
+
+    Parameters:
+    - edges: road edges with a ``length_mi`` column (see add_length_miles)
+    - target_miles: target centerline miles per cluster
+    - point_spacing: sample spacing in miles
+    - backend, balance_tolerance, polygon_style: see create_cluster_polygons
+    - sample_budget: sample at most this many points instead, with the
+      spacing chosen to fit and at least one point on every edge, so every
+      edge is clustered (see sampling.generate_points_along_lines)
+    - memo: optional ClusterMemo; a run with the same network and
+      parameters is returned from it without recomputing
+    - recorder: optional StageRecorder for the 'memo_lookup', 'edge_store',
+      'sample' and 'cluster' stages (with the clustering sub-stages nested
+      in 'cluster')
+
+    Returns:
+    - cluster_gdf, or None when there are too few points to cluster; the
+      spacing used is in ``cluster_gdf.attrs['clustering']['sampling']``
+    - points_gdf, in the network's local metric CRS (see projection.local_crs)
+    - list of notes for the user (e.g. why fewer clusters were made)
+    """
+    if memo is not None:
+        with stage(recorder, 'memo_lookup'):
+            key = memo.key(edges_fingerprint(edges), target_miles=target_miles, point_spacing=point_spacing,
+                           backend=backend, balance_tolerance=balance_tolerance, polygon_style=polygon_style,
+                           sample_budget=sample_budget)
+            result = memo.get(key)
+        if result is None:
+            result = cluster_network(edges, target_miles, point_spacing, backend, balance_tolerance,
+                                     polygon_style, sample_budget, recorder=recorder)
+            memo.put(key, result)
+        return result
+
+    if 'feature_id' in edges:
+        from osm_extractor.features import cluster_features
+        return cluster_features(edges, target_miles=target_miles, point_spacing=point_spacing, backend=backend,
+                                balance_tolerance=balance_tolerance, polygon_style=polygon_style,
+                                sample_budget=sample_budget, recorder=recorder)
+
+    notes = []
+    n_clusters = cluster_count(edges['length_mi'].sum(), target_miles)
+
+    # Build the compact projected edge store once; sampling and clustering
+    # both run on it
+    with stage(recorder, 'edge_store'):
+        store = edge_store(edges)
+
+    with stage(recorder, 'sample'):
+        points_gdf = generate_points_along_lines(edges, spacing_miles=point_spacing, crs=store.crs,
+                                                 sample_budget=sample_budget)
+    sampling = points_gdf.attrs['sampling']
+
+    if sample_budget is not None and len(points_gdf) > sample_budget:
+        notes.append(f"The sample budget of {sample_budget:,} is below the {len(edges):,} edges of this "
+                     f"network; sampled one point per edge instead.")
+    if len(points_gdf) == 0:
+        notes.append(f"No points generated with {point_spacing} mile spacing. Network may be too small "
+                     f"or spacing too large. Try reducing point spacing.")
+    elif len(points_gdf) < n_clusters:
+        notes.append(f"Only {len(points_gdf)} points generated, but {n_clusters} clusters requested. "
+                     f"Adjusting to {len(points_gdf)} clusters.")
+        n_clusters = len(points_gdf)
+
+    if len(points_gdf) < 2:  # Need at least 2 points to cluster
+        notes.append("Not enough points for clustering. Continuing without clusters.")
+        return None, points_gdf, notes
+
+    with stage(recorder, 'cluster'):
+        cluster_gdf, points_gdf = create_cluster_polygons(
+            points_gdf, n_clusters, edges,
+            backend=backend,
+            target_miles=target_miles,
+            balance_tolerance=balance_tolerance,
+            polygon_style=polygon_style,
+            recorder=recorder
+        )
+    cluster_gdf.attrs['clustering']['sampling'] = sampling
+    return cluster_gdf, points_gdf, notes
+
+
+def with_cluster_ids(edges, cluster_gdf):
+    """
+    Copy of ``edges`` with the ``cluster_id`` of every road, taken from the
+    edge assignment of a cluster_network result (-1 for unclustered roads),
+    so consumers need no spatial join against the cluster polygons.
+    """
+    edges = edges.copy(deep=False)
+    edge_clusters = cluster_gdf.attrs['clustering']['edge_clusters']
+    edges['cluster_id'] = edge_clusters.reindex(edges.index, fill_value=-1).to_numpy(dtype=np.int64)
+    return edges
+
+
+def write_outputs(out_dir, edges, cluster_gdf=None, output_format="GeoJSON"):
+    """
+    Write roads (and clusters) to ``out_dir`` in ``output_format``.
+
+    Uses the same streaming exporters as the app's download buttons. With
+    clusters, roads carry their ``cluster_id`` (see with_cluster_ids).
+
+    Returns:
+    - list of written file paths
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    if cluster_gdf is not None:
+        edges = with_cluster_ids(edges, cluster_gdf)
+    if output_format == "Shapefile":
+        files = {"roads.zip": lambda: export_shapefile_zip(edges, "roads")}
+        if cluster_gdf is not None:
+            files["clusters.zip"] = lambda: export_shapefile_zip(cluster_gdf, "clusters")
+    elif output_format == "GeoPackage":
+        layers = {'roads': edges}
+        if cluster_gdf is not None:
+            layers['clusters'] = cluster_gdf
+        files = {"roads.gpkg": lambda: export_geopackage(layers)}
+    elif output_format in SINGLE_LAYER_FORMATS:
+        exporter, extension, _ = SINGLE_LAYER_FORMATS[output_format]
+        files = {f"roads{extension}": lambda: exporter(edges)}
+        if cluster_gdf is not None:
+            files[f"clusters{extension}"] = lambda: exporter(cluster_gdf)
+    else:
+        raise ValueError(f"Unknown output format '{output_format}', expected one of {OUTPUT_FORMATS}")
+
+    paths = []
+    for file_name, export in files.items():
+        path = os.path.join(out_dir, file_name)
+        with export() as spooled, open(path, 'wb') as f:
+            while chunk := spooled.read(1024 ** 2):
+                f.write(chunk)
+        paths.append(path)
+    return paths
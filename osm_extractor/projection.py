@@ -0,0 +1,73 @@
+"""
+Local metric projection of road networks.
+
+Point spacing, edge lengths and polygon buffers are computed in meters.
+Web Mercator stretches distances by 1 / cos(latitude), about 20% at 34°N and
+40% at 45°N, so networks are projected to the UTM zone of their centre
+instead. Data derived from a frame's geometry (its projection, its edge
+store) is cached for as long as the frame and its geometry column are
+unchanged, so sampling and clustering of one extract share a single
+reprojection.
+"""
+import threading
+import weakref
+
+# (id(frame), key) -> (weak reference to the frame, its geometry array, value)
+_frame_cache = {}
+_lock = threading.Lock()
+
+
+def local_crs(gdf):
+    """
+    Metric CRS for ``gdf``: its own CRS when already projected (or unset),
+    otherwise the UTM zone of its centre.
+
+    The UTM lookup queries the PROJ database, so it is cached per frame.
+    """
+    if gdf.crs is None or gdf.crs.is_projected or len(gdf) == 0:
+        return gdf.crs
+    return cached_for_frame(gdf, 'local_crs', gdf.estimate_utm_crs)
+
+
+def cached_for_frame(gdf, key, build):
+    """
+    ``build()``, computed once per frame and ``key``.
+
+    The value is reused while ``gdf`` is alive and its geometry column is
+    the same array, and dropped when the frame is garbage collected.
+    """
+    values = gdf.geometry.values
+    cache_key = (id(gdf), key)
+    with _lock:
+        entry = _frame_cache.get(cache_key)
+    if entry is not None and entry[0]() is gdf and entry[1] is values:
+        return entry[2]
+
+    value = build()
+    with _lock:
+        _frame_cache[cache_key] = (weakref.ref(gdf), values, value)
+    weakref.finalize(gdf, _forget, cache_key, values)
+    return value
+
+
+def _forget(cache_key, values):
+    # Only drop the entry this finalizer was registered for
+    with _lock:
+        entry = _frame_cache.get(cache_key)
+        if entry is not None and entry[1] is values:
+            del _frame_cache[cache_key]
+
+
+def projected_geometry(gdf, crs=None):
+    """
+    Geometry of ``gdf`` in ``crs`` (default: ``local_crs(gdf)``), reprojected
+    at most once per frame.
+
+    Returns:
+    - GeoSeries in ``crs``
+    """
+    if crs is None:
+        crs = local_crs(gdf)
+    if gdf.crs is None or crs is None or gdf.crs == crs:
+        return gdf.geometry
+    return cached_for_frame(gdf, ('projected', str(crs)), lambda: gdf.geometry.to_crs(crs))
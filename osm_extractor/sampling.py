@@ -0,0 +1,156 @@
+"""
+Sampling of points along road edges.
+
+With a fixed spacing the number of samples grows with network miles, and
+edges shorter than the spacing get none. Budget sampling instead picks the
+spacing that keeps the sample count within a budget and gives every edge
+at least one sample, weighted by the miles it stands for, so clustering
+cost is bounded by the budget and every edge is clustered.
+
+Every sample stands for the stretch of its edge nearer to it than to the
+edge's other samples; its length is the sample's ``weight_mi``.
+"""
+import numpy as np
+import geopandas as gpd
+import shapely
+
+from osm_extractor import METERS_PER_MILE
+from osm_extractor.edge_store import edge_store
+
+
+# Bisection steps when searching the spacing for a sample budget
+BUDGET_SEARCH_STEPS = 40
+
+
+def sample_counts(line_lengths, spacing_meters, min_one_per_edge=False):
+    """
+    Samples per edge at ``spacing_meters``: points at 0, spacing, ...,
+    n * spacing on edges holding at least one full spacing, and none (or
+    one, with ``min_one_per_edge``) on shorter edges.
+    """
+    num_points = np.floor(line_lengths / spacing_meters).astype(np.int64)
+    return np.where(num_points > 0, num_points + 1, 1 if min_one_per_edge else 0)
+
+
+def budget_spacing(line_lengths, sample_budget):
+    """
+    Smallest spacing in meters at which one-per-edge sampling stays within
+    ``sample_budget`` samples.
+
+    Every edge takes one sample plus one per full spacing, so the count at
+    spacing s lies between sum(L) / s and n_edges + sum(L) / s; the
+    spacing is bisected between the two bounds. Budgets below the edge
+    count give one sample per edge.
+    """
+    n_edges = len(line_lengths)
+    total = float(line_lengths.sum())
+    if n_edges == 0 or total <= 0:
+        return 1.0
+    if sample_budget <= n_edges:
+        # Longer than every edge: one sample each
+        return float(line_lengths.max()) * 2 + 1.0
+
+    low, high = total / sample_budget, total / (sample_budget - n_edges)
+    for _ in range(BUDGET_SEARCH_STEPS):
+        mid = (low + high) / 2
+        if sample_counts(line_lengths, mid, min_one_per_edge=True).sum() <= sample_budget:
+            high = mid
+        else:
+            low = mid
+    return high
+
+
+def generate_points_along_lines(edges_gdf, spacing_miles=0.5, crs=None, sample_budget=None):
+    """
+    Generate points along each road segment at specified spacing.
+
+    All sample distances are computed per edge as NumPy arrays and
+    interpolated along the flat coordinates of the network's EdgeStore.
+
+    Parameters:
+    - edges_gdf: GeoDataFrame of road edges
+    - spacing_miles: spacing between points in miles
+    - crs: CRS of the returned points (default: that of ``edges_gdf``);
+      pass ``local_crs(edges_gdf)`` to keep them in meters and skip the
+      projection back
+    - sample_budget: when given, ``spacing_miles`` is ignored: the spacing
+      is chosen to produce at most this many points (see budget_spacing)
+      and edges shorter than it get one point at their middle
+
+    Returns:
+    - GeoDataFrame of points with ``edge_id``, ``edge_length_mi`` and
+      ``weight_mi`` (miles of the edge stretch nearest to the point)
+      columns, and the spacing used and the budget in
+      ``points_gdf.attrs['sampling']``
+    """
+    # Measure along the edges in the network's local metric CRS, using the
+    # edge store shared with clustering
+    output_crs = edges_gdf.crs if crs is None else crs
+    store = edge_store(edges_gdf)
+    projected_crs = store.crs
+
+    line_lengths = store.lengths()  # in meters (now that we're projected)
+
+    # Convert miles to meters
+    if sample_budget is None:
+        spacing_meters = spacing_miles * METERS_PER_MILE
+    else:
+        spacing_meters = budget_spacing(line_lengths, sample_budget)
+    sampling = {'spacing_miles': spacing_meters / METERS_PER_MILE, 'sample_budget': sample_budget}
+
+    # Number of full spacings that fit on each edge; edges shorter than the
+    # spacing get no points (one in budget mode), otherwise points at
+    # 0, spacing, ..., n * spacing
+    counts = sample_counts(line_lengths, spacing_meters, min_one_per_edge=sample_budget is not None)
+    total = int(counts.sum())
+
+    if total == 0:
+        # Return empty GeoDataFrame with correct structure
+        points_gdf = gpd.GeoDataFrame({
+            'edge_id': [],
+            'edge_length_mi': [],
+            'weight_mi': [],
+            'geometry': []
+        }, crs=output_crs)
+        points_gdf.attrs['sampling'] = sampling
+        return points_gdf
+
+    # Position of the source edge for every sample, and the sample's index
+    # within its edge (0, 1, 2, ... restarting at each edge)
+    edge_pos = np.repeat(np.arange(len(store)), counts)
+    starts = np.cumsum(counts) - counts
+    step = np.arange(total) - np.repeat(starts, counts)
+    distances = step * spacing_meters
+    if sample_budget is not None:
+        # The single sample of a short edge sits at its middle
+        single = counts[edge_pos] == 1
+        distances[single] = line_lengths[edge_pos[single]] / 2
+
+    # Guard against floating point overshoot at the end of the line
+    keep = distances <= line_lengths[edge_pos]
+    edge_pos = edge_pos[keep]
+    distances = distances[keep]
+
+    points = shapely.points(store.interpolate(edge_pos, distances))
+
+    # Each sample stands for the stretch of its edge between the midpoints
+    # to its neighbouring samples, or to the edge's ends
+    first = np.r_[True, edge_pos[1:] != edge_pos[:-1]]
+    last = np.r_[first[1:], True]
+    stretch_start = np.where(first, 0.0, (distances + np.r_[0.0, distances[:-1]]) / 2)
+    stretch_end = np.where(last, line_lengths[edge_pos], (distances + np.r_[distances[1:], 0.0]) / 2)
+
+    # Create GeoDataFrame in projected CRS
+    points_gdf = gpd.GeoDataFrame({
+        'edge_id': store.index.to_numpy()[edge_pos],
+        'edge_length_mi': line_lengths[edge_pos] / METERS_PER_MILE,
+        'weight_mi': (stretch_end - stretch_start) / METERS_PER_MILE,
+        'geometry': points
+    }, crs=projected_crs)
+
+    # Reproject to the requested CRS
+    if output_crs and projected_crs and output_crs != projected_crs:
+        points_gdf = points_gdf.to_crs(output_crs)
+
+    points_gdf.attrs['sampling'] = sampling
+    return points_gdf
@@ -0,0 +1,172 @@
+"""
+Tiled, parallel extraction for large bounding boxes and polygons.
+
+A single ``ox.graph_from_bbox`` call fetches and builds one monolithic
+graph, which times out or runs out of memory on large areas. Here the area
+is split into a grid of tiles that are fetched and built concurrently in a
+process pool, so each worker only ever holds one tile. Tiles are built
+unsimplified, stitched back together by de-duplicating nodes on their
+shared OSM ids and edges on ``(u, v, osmid)``, and the stitched graph is
+simplified once so edges crossing tile borders come out whole. Stitching
+happens in the calling process, which holds every tile until the end, so
+its memory still grows with the whole area.
+"""
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import osmnx as ox
+import shapely
+from shapely.geometry import box
+
+from osm_extractor.network_cache import tile_key
+
+# Default tile edge length in kilometers
+DEFAULT_TILE_KM = 10.0
+
+try:
+    from osmnx._errors import InsufficientResponseError
+except ImportError:  # osmnx < 1.3
+    InsufficientResponseError = ValueError
+
+
+def make_tiles(polygon, tile_km=DEFAULT_TILE_KM):
+    """
+    Split an EPSG:4326 polygon into a grid of roughly ``tile_km`` square tiles.
+
+    Returns the non-empty intersections of the grid cells with the polygon.
+    """
+    west, south, east, north = polygon.bounds
+    mid_lat = (north + south) / 2
+    dlat = tile_km / 111.32
+    dlon = tile_km / (111.32 * np.cos(np.radians(mid_lat)))
+
+    xs = np.arange(west, east, dlon)
+    ys = np.arange(south, north, dlat)
+    cells = shapely.box(*np.meshgrid(xs, ys), *np.meshgrid(np.minimum(xs + dlon, east),
+                                                           np.minimum(ys + dlat, north)))
+    cells = cells.ravel()
+    # A rectangular area needs no clipping beyond the grid itself
+    if not polygon.equals(box(west, south, east, north)):
+        cells = shapely.intersection(cells, polygon)
+    return [cell for cell in cells if not cell.is_empty and cell.area > 0]
+
+
+def _extract_tile(tile, network_type, pbf_path=None):
+    """
+    Fetch and build the unsimplified network of one tile in a worker process.
+
+    Edges crossing the tile boundary are kept (truncate_by_edge) so the
+    neighbouring tiles overlap on them, and disconnected pieces are kept
+    since they usually connect through a neighbouring tile.
+    """
+    try:
+        if pbf_path:
+            from osm_extractor.pbf_source import read_pbf_network
+            return read_pbf_network(pbf_path, network_type, polygon=tile, retain_all=True,
+                                    truncate_by_edge=True, simplify=False)
+        G = ox.graph_from_polygon(tile, network_type=network_type, simplify=False,
+                                  retain_all=True, truncate_by_edge=True)
+        return ox.graph_to_gdfs(G)
+    except (ValueError, InsufficientResponseError):
+        # No roads in this tile
+        return None
+
+
+def stitch_tiles(tile_results, polygon, retain_all=False):
+    """
+    Merge per-tile unsimplified ``(nodes, edges)`` into one network.
+
+    Nodes are de-duplicated on their OSM id and edges on ``(u, v, osmid)``.
+    The merged graph is simplified, truncated to ``polygon`` and, unless
+    ``retain_all`` is set, reduced to its largest weakly connected
+    component, matching what ``ox.graph_from_polygon`` returns.
+    """
+    tile_results = [result for result in tile_results if result is not None]
+    if not tile_results:
+        raise ValueError("No roads found in any tile of this area")
+
+    nodes = pd.concat([nodes for nodes, _ in tile_results])
+    nodes = nodes[~nodes.index.duplicated(keep='first')]
+
+    edges = pd.concat([edges for _, edges in tile_results]).reset_index()
+    edges = edges.drop_duplicates(subset=['u', 'v', 'osmid'])
+    # Parallel edges from different tiles need fresh keys
+    edges['key'] = edges.groupby(['u', 'v']).cumcount()
+    edges = edges.set_index(['u', 'v', 'key'])
+
+    crs = tile_results[0][1].crs
+    G = ox.graph_from_gdfs(gpd.GeoDataFrame(nodes, geometry='geometry', crs=crs),
+                           gpd.GeoDataFrame(edges, geometry='geometry', crs=crs))
+    G = ox.simplify_graph(G)
+    G = ox.truncate.truncate_graph_polygon(G, polygon)
+    if not retain_all:
+        try:
+            G = ox.truncate.largest_component(G, strongly=False)
+        except AttributeError:  # osmnx < 2.0
+            G = ox.utils_graph.get_largest_component(G, strongly=False)
+    return ox.graph_to_gdfs(G)
+
+
+def extract_tiled(polygon, network_type, tile_km=DEFAULT_TILE_KM, max_workers=None,
+                  cache=None, cache_source="overpass", pbf_path=None, progress=None):
+    """
+    Extract the network inside ``polygon`` tile by tile in a process pool.
+
+    Parameters:
+    - polygon: EPSG:4326 area to extract (bbox or uploaded polygon)
+    - network_type: 'drive', 'walk', 'bike' or 'all'
+    - tile_km: tile edge length in kilometers; bounds peak memory per worker
+      (the calling process holds all tiles for stitching)
+    - max_workers: number of worker processes (default: CPU count)
+    - cache: optional NetworkCache; every tile is cached individually
+    - cache_source: source tag for the tile cache keys
+    - pbf_path: read tiles from a local PBF file instead of Overpass
+    - progress: optional callback(done_tiles, total_tiles)
+
+    Returns:
+    - (nodes, edges) GeoDataFrames, with tile counts and timing in
+      ``edges.attrs['tiling']``
+    """
+    start = time.perf_counter()
+    tiles = make_tiles(polygon, tile_km)
+    results = [None] * len(tiles)
+    keys = [tile_key(tile, network_type, cache_source) for tile in tiles]
+
+    pending = []
+    for i, key in enumerate(keys):
+        cached = cache.get(key) if cache is not None else None
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending.append(i)
+
+    done = len(tiles) - len(pending)
+    if progress:
+        progress(done, len(tiles))
+
+    if pending:
+        # Spawned workers are safe to start from Streamlit's script threads
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+            futures = {pool.submit(_extract_tile, tiles[i], network_type, pbf_path): i
+                       for i in pending}
+            for future in as_completed(futures):
+                i = futures[future]
+                results[i] = future.result()
+                if cache is not None and results[i] is not None:
+                    cache.put(keys[i], *results[i], description=f"tile {i} ({network_type})")
+                done += 1
+                if progress:
+                    progress(done, len(tiles))
+
+    nodes, edges = stitch_tiles(results, polygon)
+    edges.attrs['tiling'] = {
+        'tiles': len(tiles),
+        'cached_tiles': len(tiles) - len(pending),
+        'seconds': time.perf_counter() - start,
+    }
+    return nodes, edges
@@ -1,251 +1,151 @@
 import streamlit as st
-import osmnx as ox
 import geopandas as gpd
-import folium
-from streamlit_folium import folium_static
 import tempfile
 import zipfile
 import os
-import io
-import numpy as np
 import pandas as pd
-from sklearn.cluster import KMeans
-from shapely.geometry import Point, MultiPoint
-from shapely.ops import unary_union
-from scipy.spatial import Voronoi
-import numpy as np
-import pandas as pd
-from sklearn.cluster import KMeans
-from shapely.geometry import Point, MultiPoint
-from shapely.ops import unary_union
-from shapely.geometry import Polygon as ShapelyPolygon
+# osmnx, scikit-learn, scipy and folium are imported where they are first
+# used (extraction, k-means, map rendering), not on every cold start
+from osm_extractor.clustering import MINIBATCH_THRESHOLD
+from osm_extractor.balancing import BALANCE_TOLERANCE
+from osm_extractor.network_cache import NetworkCache
+from osm_extractor.memo import ClusterMemo, edges_fingerprint
+from osm_extractor.pipeline import (network_key, add_length_miles, cluster_count, cluster_network,
+                                    with_cluster_ids, PlaceNotFoundError)
+from osm_extractor.export import export_shapefile_zip, export_geopackage, SINGLE_LAYER_FORMATS
+from osm_extractor.instrumentation import StageRecorder
+from osm_extractor.features import boundary_features, features_key, export_feature_packages
+from osm_extractor.jobs import JobQueue, extraction_job, feature_extraction_job, clustering_job
 
-# Helper functions for road network analysis
-def generate_points_along_lines(edges_gdf, spacing_miles=0.5):
-    """
-    Generate points along each road segment at specified spacing.
-    
-    Parameters:
-    - edges_gdf: GeoDataFrame of road edges
-    - spacing_miles: spacing between points in miles
-    
-    Returns:
-    - GeoDataFrame of points
-    """
-    points = []
-    edge_ids = []
-    edge_lengths = []  # Store the length of each edge for weighting
-    
-    # Store original CRS
-    original_crs = edges_gdf.crs
-    
-    # Project to a meter-based CRS if needed (use UTM or local projection)
-    # For now, use Web Mercator (EPSG:3857) which is in meters
-    if edges_gdf.crs and edges_gdf.crs.to_epsg() == 4326:
-        # WGS84 (lat/lon) - need to reproject
-        edges_projected = edges_gdf.to_crs(epsg=3857)
+# Seconds between progress polls of a running job, and how long a button
+# handler waits for a job before polling (cache hits finish well within it)
+JOB_POLL_SECONDS = 1.0
+JOB_QUICK_WAIT_SECONDS = 0.5
+
+# Default number of sample points in sample budget mode
+DEFAULT_SAMPLE_BUDGET = 50_000
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_job_progress(job_queue, job_id):
+    """Stage-by-stage progress of a background job; reruns the page when it finishes."""
+    job = job_queue.get(job_id)
+    if job is None or job.done:
+        st.rerun()
+    
+    if job.status == "queued":
+        st.info(f"🕒 Queued: {job.label}")
     else:
-        edges_projected = edges_gdf.copy()
-    
-    # Convert miles to meters (1 mile = 1609.34 meters)
-    spacing_meters = spacing_miles * 1609.34
-    
-    for idx, row in edges_projected.iterrows():
-        line = row.geometry
-        line_length = line.length  # in meters (now that we're projected)
-        line_length_mi = line_length / 1609.34
-        
-        # Calculate number of points needed
-        num_points = int(line_length / spacing_meters)
-        
-        if num_points > 0:
-            for i in range(num_points + 1):
-                distance = i * spacing_meters
-                if distance <= line_length:
-                    point = line.interpolate(distance)
-                    points.append(point)
-                    edge_ids.append(idx)
-                    edge_lengths.append(line_length_mi)  # Store edge length for weighting
-    
-    if len(points) == 0:
-        # Return empty GeoDataFrame with correct structure
-        return gpd.GeoDataFrame({
-            'edge_id': [],
-            'edge_length_mi': [],
-            'geometry': []
-        }, crs=original_crs)
-    
-    # Create GeoDataFrame in projected CRS
-    points_gdf = gpd.GeoDataFrame({
-        'edge_id': edge_ids,
-        'edge_length_mi': edge_lengths,
-        'geometry': points
-    }, crs=edges_projected.crs)
-    
-    # Reproject back to original CRS
-    if original_crs:
-        points_gdf = points_gdf.to_crs(original_crs)
-    
-    return points_gdf
-
-def create_cluster_polygons(points_gdf, n_clusters, edges_gdf):
+        st.info(f"⏳ Running: {job.label} ({job.elapsed():.0f}s)")
+    if job.requests > 1:
+        st.caption(f"🤝 Shared by {job.requests} requests for the same inputs")
+    lines = [f"- ✅ {record['stage'].strip()}: {record['wall_s']:.1f}s" for record in job.recorder.table()]
+    lines += [f"- ⏳ {name}: {seconds:.1f}s so far" for name, seconds in job.recorder.running()]
+    if lines:
+        st.markdown("\n".join(lines))
+    if job.progress is not None:
+        done, total = job.progress
+        st.progress(done / total, text=f"Extracted {done} of {total} areas")
+
+def submit_job(job_queue, key, fn, *args, **kwargs):
+    """Submit a job (or join an identical one) and give it a moment to finish."""
+    job = job_queue.submit(key, fn, *args, **kwargs)
+    job.wait(JOB_QUICK_WAIT_SECONDS)
+    return job
+
+@st.cache_data(show_spinner=False)
+def read_boundary_file(file_name, data):
+    """Read an uploaded boundary file (zipped Shapefile, GeoJSON or GeoPackage)."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if file_name.endswith('.zip'):
+            zip_path = os.path.join(tmpdir, "boundary.zip")
+            with open(zip_path, 'wb') as f:
+                f.write(data)
+            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                zip_ref.extractall(tmpdir)
+            
+            # Find .shp file
+            shp_files = [f for f in os.listdir(tmpdir) if f.endswith('.shp')]
+            if not shp_files:
+                raise ValueError("No shapefile found in zip")
+            boundary_path = os.path.join(tmpdir, shp_files[0])
+        else:
+            boundary_path = os.path.join(tmpdir, file_name)
+            with open(boundary_path, 'wb') as f:
+                f.write(data)
+        return gpd.read_file(boundary_path)
+
+def show_extraction_source(edges, cached):
+    """Tell the user where the network came from."""
+    if 'features' in edges.attrs:
+        fetch_info = edges.attrs['features']
+        st.info(f"🧩 Extracted {fetch_info['features']} features in {fetch_info['fetches']} fetches "
+                f"({fetch_info['merged_features']} features merged with a neighbour, "
+                f"{fetch_info['cached_fetches']} fetches from cache) in {fetch_info['seconds']:.1f}s")
+        if fetch_info['empty_features']:
+            st.warning(f"⚠️ No roads found in {len(fetch_info['empty_features'])} features: "
+                       f"{', '.join(str(feature_id) for feature_id in fetch_info['empty_features'])}")
+    elif cached:
+        st.success("⚡ Loaded road network from local cache")
+    elif 'tiling' in edges.attrs:
+        tiling = edges.attrs['tiling']
+        st.info(f"🧩 Stitched {tiling['tiles']} tiles ({tiling['cached_tiles']} from cache) "
+                f"in {tiling['seconds']:.1f}s")
+
+def recorded_export(recorder, file_name, export):
     """
-    Create polygons around clustered points using a balanced approach.
-    
-    Parameters:
-    - points_gdf: GeoDataFrame of points
-    - n_clusters: number of clusters
-    - edges_gdf: original edges for boundary
+    Download button callable that records the export as a stage and logs it.
     
-    Returns:
-    - GeoDataFrame of cluster polygons
+    Streamlit serves downloads from bytes it keeps in memory, so the
+    exporter's spooled file is read into bytes here.
     """
-    # Validate we have enough points
-    if len(points_gdf) == 0:
-        raise ValueError("No points generated. Try reducing the point spacing distance.")
-    
-    if len(points_gdf) < n_clusters:
-        n_clusters = len(points_gdf)
-    
-    # Store original CRS
-    original_crs = points_gdf.crs
-    
-    # Project to meter-based CRS for clustering
-    if points_gdf.crs and points_gdf.crs.to_epsg() == 4326:
-        points_projected = points_gdf.to_crs(epsg=3857)
-        edges_projected = edges_gdf.to_crs(epsg=3857)
-    else:
-        points_projected = points_gdf.copy()
-        edges_projected = edges_gdf.copy()
-    
-    # Perform k-means clustering on projected coordinates
-    coords = np.array([[p.x, p.y] for p in points_projected.geometry])
-    
-    # Create sample weights based on edge length (longer roads get more weight)
-    # This helps balance the mileage across clusters
-    sample_weights = points_projected['edge_length_mi'].values
-    
-    # Adjust n_clusters if we have very few points
-    actual_clusters = min(n_clusters, len(points_projected))
-    
-    # Use k-means with sample weights to bias toward balanced mileage
-    kmeans = KMeans(n_clusters=actual_clusters, random_state=42, n_init=50, max_iter=1000)
-    
-    # Weighted clustering - duplicate points based on their road length
-    # This is a trick to make k-means consider road mileage
-    weighted_coords = []
-    weighted_point_indices = []
-    for i, (coord, weight) in enumerate(zip(coords, sample_weights)):
-        # Duplicate points proportional to their weight (road length)
-        num_duplicates = max(1, int(weight * 10))  # Scale weight
-        for _ in range(num_duplicates):
-            weighted_coords.append(coord)
-            weighted_point_indices.append(i)
-    
-    weighted_coords = np.array(weighted_coords)
-    
-    # Cluster the weighted points
-    weighted_clusters = kmeans.fit_predict(weighted_coords)
-    
-    # Map back to original points (take mode of cluster assignments)
-    from scipy import stats
-    point_clusters = np.zeros(len(points_projected), dtype=int)
-    for i in range(len(points_projected)):
-        point_indices = [idx for idx, p_idx in enumerate(weighted_point_indices) if p_idx == i]
-        if point_indices:
-            point_clusters[i] = stats.mode([weighted_clusters[idx] for idx in point_indices], keepdims=True).mode[0]
-    
-    points_projected['cluster'] = point_clusters
-    points_gdf['cluster'] = points_projected['cluster'].values
-    
-    # Check cluster balance and potentially reassign
-    # Calculate miles per cluster
-    cluster_miles = {}
-    for cluster_id in range(actual_clusters):
-        cluster_points = points_gdf[points_gdf['cluster'] == cluster_id]
-        cluster_edge_ids = cluster_points['edge_id'].unique()
-        cluster_edges = edges_gdf[edges_gdf.index.isin(cluster_edge_ids)]
-        cluster_miles[cluster_id] = cluster_edges['length_mi'].sum() if 'length_mi' in cluster_edges.columns else 0
-    
-    st.info(f"Initial cluster distribution: {[f'{cluster_miles[i]:.1f}mi' for i in range(actual_clusters)]}")
-    
-    # Get cluster centroids
-    centroids = kmeans.cluster_centers_
-    
-    # Create polygons for each cluster based on the actual roads in that cluster
-    polygons = []
-    cluster_ids = []
-    
-    for cluster_id in range(actual_clusters):
-        # Get all points in this cluster
-        cluster_points = points_projected[points_projected['cluster'] == cluster_id]
-        
-        if len(cluster_points) < 3:
-            continue
-        
-        # Get the edge IDs that belong to this cluster
-        cluster_edge_ids = cluster_points['edge_id'].unique()
-        cluster_edges = edges_projected[edges_projected.index.isin(cluster_edge_ids)]
-        
-        # Create a buffer around the roads in this cluster
-        # Merge all road geometries and create a convex hull or buffer
-        if len(cluster_edges) > 0:
-            # Option 1: Convex hull around all roads in cluster
-            all_coords = []
-            for idx, edge in cluster_edges.iterrows():
-                coords = list(edge.geometry.coords)
-                all_coords.extend(coords)
-            
-            if len(all_coords) >= 3:
-                # Create convex hull
-                from shapely.geometry import MultiPoint
-                multi_point = MultiPoint(all_coords)
-                cluster_polygon = multi_point.convex_hull
-                
-                # Add small buffer to make it look nicer
-                cluster_polygon = cluster_polygon.buffer(100)  # 100 meter buffer
-                
-                polygons.append(cluster_polygon)
-                cluster_ids.append(cluster_id)
-    
-    # Create GeoDataFrame in projected CRS
-    cluster_gdf = gpd.GeoDataFrame({
-        'cluster_id': cluster_ids,
-        'geometry': polygons
-    }, crs=edges_projected.crs)
-    
-    # Reproject back to original CRS
-    if original_crs:
-        cluster_gdf = cluster_gdf.to_crs(original_crs)
-    
-    # Calculate stats for each cluster
-    cluster_stats = []
-    for cluster_id in range(actual_clusters):
-        cluster_points = points_gdf[points_gdf['cluster'] == cluster_id]
-        cluster_edges = edges_gdf[edges_gdf.index.isin(cluster_points['edge_id'])]
-        
-        stats = {
-            'cluster_id': cluster_id,
-            'num_points': len(cluster_points),
-            'total_miles': cluster_edges['length_mi'].sum() if 'length_mi' in cluster_edges.columns else 0
-        }
-        cluster_stats.append(stats)
-    
-    stats_df = pd.DataFrame(cluster_stats)
-    cluster_gdf = cluster_gdf.merge(stats_df, on='cluster_id', how='left')
-    
-    return cluster_gdf, points_gdf
+    def run():
+        with recorder.stage(f"export {file_name}"):
+            with export() as spooled:
+                data = spooled.read()
+        recorder.flush()
+        return data
+    
+    return run
+
+def show_performance(recorder, jobs=()):
+    """Collapsible per-stage timing table for this run and the background jobs it used."""
+    with st.expander("⏱️ Performance"):
+        rows = [row for job in jobs for row in job.recorder.table()] + recorder.table()
+        table = pd.DataFrame(rows)
+        if 'peak_mb' in table and table['peak_mb'].isna().all():
+            table = table.drop(columns='peak_mb')
+        st.dataframe(table, hide_index=True, column_config={
+            'wall_s': st.column_config.NumberColumn("Wall (s)", format="%.3f"),
+            'cpu_s': st.column_config.NumberColumn("CPU (s)", format="%.3f"),
+            'peak_mb': st.column_config.NumberColumn("Peak memory (MB)", format="%.1f"),
+        })
+        caption = "Exports are timed when their download button is clicked"
+        if recorder.log_path:
+            caption += f"; all stages are appended to `{recorder.log_path}`"
+        st.caption(caption)
 
 def process_and_display_network(edges, nodes, enable_clustering=False, 
                                 target_miles_per_cluster=50, point_spacing=0.5,
-                                output_format="GeoJSON"):
+                                output_format="GeoJSON", clustering_backend="auto",
+                                balance_tolerance=BALANCE_TOLERANCE, polygon_style="convex",
+                                sample_budget=None, recorder=None, job_queue=None, jobs=()):
     """
     Process network edges, optionally create clusters, display results and provide downloads.
     
+    Stages are recorded on ``recorder`` (a new one when not given) and
+    shown in a Performance panel together with those of ``jobs``. With a
+    ``job_queue`` clustering runs as a background job and the map is shown
+    without clusters until it finishes.
+    
     Returns the processed edges and cluster_gdf (if clustering enabled)
     """
+    if recorder is None:
+        recorder = StageRecorder(trace_memory=False)
+    jobs = list(jobs)
+    
     # Add miles field (convert meters to miles)
-    edges['length_mi'] = edges['length'] / 1609.34
+    add_length_miles(edges)
     total_miles = edges['length_mi'].sum()
     
     # Store in session state for persistent downloads
@@ -260,42 +160,97 @@ def process_and_display_network(edges, nodes, enable_clustering=False,
     col3.metric("Total Miles", f"{total_miles:.2f}")
     col4.metric("Total Length (km)", f"{edges['length'].sum()/1000:.2f}")
     
+    # Multi-feature uploads: one network per feature
+    if 'feature_id' in edges:
+        with st.expander(f"🧩 View {edges['feature_id'].nunique()} feature networks"):
+            st.dataframe(edges.groupby('feature_id', sort=False).agg(
+                edges=('length_mi', 'size'), miles=('length_mi', 'sum')
+            ).reset_index(), hide_index=True)
+    
     # Perform clustering if enabled
     cluster_gdf = None
     points_gdf = None
     if enable_clustering:
         with st.spinner("Generating cluster analysis..."):
             try:
-                # Calculate number of clusters
-                n_clusters = max(1, int(np.ceil(total_miles / target_miles_per_cluster)))
+                # Calculate number of clusters; features are clustered one by one
+                if 'feature_id' in edges:
+                    n_clusters = sum(cluster_count(miles, target_miles_per_cluster)
+                                     for miles in edges.groupby('feature_id', sort=False)['length_mi'].sum())
+                else:
+                    n_clusters = cluster_count(total_miles, target_miles_per_cluster)
                 
                 st.info(f"📊 Generating {n_clusters} clusters (Target: {target_miles_per_cluster} miles/cluster)")
                 
-                # Generate points along lines
-                points_gdf = generate_points_along_lines(edges, spacing_miles=point_spacing)
-                
-                # Check if we have enough points
-                if len(points_gdf) == 0:
-                    st.warning(f"⚠️ No points generated with {point_spacing} mile spacing. Network may be too small or spacing too large. Try reducing point spacing.")
-                elif len(points_gdf) < n_clusters:
-                    st.warning(f"⚠️ Only {len(points_gdf)} points generated, but {n_clusters} clusters requested. Adjusting to {len(points_gdf)} clusters.")
-                    n_clusters = len(points_gdf)
+                # Generate points along lines and cluster them, reusing an
+                # earlier run of this session with the same inputs
+                cluster_memo = st.session_state.cluster_memo
+                cluster_params = dict(target_miles=target_miles_per_cluster, point_spacing=point_spacing,
+                                      backend=clustering_backend, balance_tolerance=balance_tolerance,
+                                      polygon_style=polygon_style, sample_budget=sample_budget)
+                memo_hits = cluster_memo.hits
+                if job_queue is None:
+                    result = cluster_network(edges, memo=cluster_memo, recorder=recorder, **cluster_params)
+                else:
+                    # Sessions clustering the same network with the same
+                    # settings share one background job
+                    with recorder.stage('memo_lookup'):
+                        memo_key = cluster_memo.key(edges_fingerprint(edges), **cluster_params)
+                        result = cluster_memo.get(memo_key)
+                    if result is None:
+                        job = submit_job(job_queue, ('cluster',) + memo_key, clustering_job, edges,
+                                         label=f"clustering {len(edges):,} edges into {n_clusters} clusters",
+                                         trace_memory=recorder.trace_memory, **cluster_params)
+                        if job.status == "failed":
+                            raise job.error
+                        if job.done:
+                            result = job.result
+                            cluster_memo.put(memo_key, result)
+                            jobs.append(job)
+                        else:
+                            show_job_progress(job_queue, job.id)
+                if result is None:
+                    cluster_gdf, points_gdf, notes = None, None, []
+                else:
+                    cluster_gdf, points_gdf, notes = result
+                if cluster_memo.hits > memo_hits:
+                    st.caption("♻️ Reused clusters computed earlier in this session for these settings")
+                for note in notes:
+                    st.warning(f"⚠️ {note}")
                 
-                if len(points_gdf) >= 2:  # Need at least 2 points to cluster
-                    # Create cluster polygons
-                    cluster_gdf, points_gdf = create_cluster_polygons(points_gdf, n_clusters, edges)
+                if cluster_gdf is not None:
+                    fit_info = cluster_gdf.attrs['clustering']
+                    before, after = fit_info['balance_before'], fit_info['balance_after']
+                    st.info(f"⚖️ Largest cluster: {before['max_miles']:.1f}mi → {after['max_miles']:.1f}mi "
+                            f"({before['max_over_target']:.2f}× → {after['max_over_target']:.2f}× target, "
+                            f"{fit_info['balance_moves']:,} edges moved)")
                     
                     # Store in session state
                     st.session_state.cluster_gdf = cluster_gdf
                     
                     # Display clustering stats
-                    st.success(f"✅ Created {n_clusters} clusters")
+                    st.success(f"✅ Created {len(cluster_gdf)} clusters")
                     
                     cluster_stats_display = st.expander("📈 View Cluster Statistics")
                     with cluster_stats_display:
-                        st.dataframe(cluster_gdf[['cluster_id', 'total_miles']].sort_values('cluster_id'))
+                        st.caption(f"Backend: {fit_info['backend']} | "
+                                   f"Points: {fit_info['n_points']:,} | "
+                                   f"Iterations: {fit_info['n_iter']} | "
+                                   f"Inertia: {fit_info['inertia']:,.0f}")
+                        sampling = fit_info['sampling']
+                        if sampling['sample_budget'] is not None:
+                            spacing = ("chosen per feature" if sampling['spacing_miles'] is None
+                                       else f"{sampling['spacing_miles']:.3f} mi")
+                            st.caption(f"Sample budget: {sampling['sample_budget']:,} points | "
+                                       f"Spacing: {spacing} | Every edge has at least one sample")
+                        st.dataframe(pd.DataFrame(
+                            {'before': before, 'after': after}
+                        ).rename(index={'min_miles': 'Min miles', 'max_miles': 'Max miles',
+                                        'max_over_target': 'Max / target', 'cv': 'Coefficient of variation'}))
+                        if 'features' in fit_info:
+                            st.dataframe(fit_info['features'], hide_index=True)
+                        st.dataframe(fit_info['cluster_table'], hide_index=True)
                 else:
-                    st.warning("⚠️ Not enough points for clustering. Continuing without clusters.")
                     st.session_state.cluster_gdf = None
                     
             except Exception as cluster_error:
@@ -305,49 +260,53 @@ def process_and_display_network(edges, nodes, enable_clustering=False,
     else:
         st.session_state.cluster_gdf = None
     
+    # Compare the clustering runs of this network kept in the session memo
+    if enable_clustering:
+        runs = st.session_state.cluster_memo.entries(edges_fingerprint(edges))
+        if len(runs) > 1:
+            with st.expander(f"🔀 Compare {len(runs)} clustering runs from this session"):
+                rows = []
+                for params, (run_clusters, _, _) in runs:
+                    row = {**params, 'clusters': 0}
+                    if run_clusters is not None:
+                        balance = run_clusters.attrs['clustering']['balance_after']
+                        row.update(clusters=len(run_clusters), max_miles=balance['max_miles'],
+                                   max_over_target=balance['max_over_target'], cv=balance['cv'])
+                    rows.append(row)
+                st.dataframe(pd.DataFrame(rows), hide_index=True)
+    
     # Create map
     st.subheader("Network Preview")
-    map_center = [nodes.geometry.y.mean(), nodes.geometry.x.mean()]
-    m = folium.Map(location=map_center, zoom_start=13)
-    
-    # Add cluster polygons if enabled
-    if enable_clustering and cluster_gdf is not None:
-        # Define color palette for clusters
-        colors = ['red', 'blue', 'green', 'purple', 'orange', 'darkred', 
-                 'lightred', 'beige', 'darkblue', 'darkgreen', 'cadetblue', 
-                 'darkpurple', 'pink', 'lightblue', 'lightgreen', 'gray', 
-                 'black', 'lightgray']
+    with recorder.stage('map_render'):
+        import folium
+        from streamlit_folium import folium_static
+        from osm_extractor.map_layers import network_layer, cluster_layer, NetworkLayer
+        
+        west, south, east, north = edges.to_crs(epsg=4326).total_bounds
+        m = folium.Map(location=[(south + north) / 2, (west + east) / 2], zoom_start=13, prefer_canvas=True)
+        m.fit_bounds([[south, west], [north, east]])
+        
+        # Color roads by cluster when clustering ran
+        edge_labels = None
+        if enable_clustering and cluster_gdf is not None:
+            edge_labels = with_cluster_ids(edges, cluster_gdf)['cluster_id'].to_numpy()
         
-        for idx, row in cluster_gdf.iterrows():
-            color = colors[int(row['cluster_id']) % len(colors)]
+        # Whole network as one layer
+        network_payload, render_info = network_layer(edges, edge_labels)
+        NetworkLayer(network_payload).add_to(m)
+        
+        # Add cluster polygons if enabled
+        if enable_clustering and cluster_gdf is not None:
             folium.GeoJson(
-                row.geometry,
-                style_function=lambda x, color=color: {
-                    'fillColor': color,
-                    'color': color,
-                    'weight': 2,
-                    'fillOpacity': 0.2
-                },
-                tooltip=f"Cluster {int(row['cluster_id'])}: {row['total_miles']:.1f} miles"
+                cluster_layer(cluster_gdf),
+                tooltip=folium.GeoJsonTooltip(fields=['cluster_id', 'total_miles'],
+                                              aliases=['Cluster', 'Miles'])
             ).add_to(m)
-    
-    # Sample edges if too many (for performance)
-    edges_to_plot = edges.sample(min(1000, len(edges)))
-    
-    # Add edges to map
-    for idx, row in edges_to_plot.iterrows():
-        coords = list(row.geometry.coords)
-        folium.PolyLine(
-            locations=[(coord[1], coord[0]) for coord in coords],
-            color='blue',
-            weight=2,
-            opacity=0.6
-        ).add_to(m)
-    
-    if len(edges) > 1000:
-        st.info(f"📍 Showing 1,000 of {len(edges):,} edges for performance")
-    
-    folium_static(m, width=700, height=500)
+        
+        st.caption(f"🗺️ Rendered {render_info['features']:,} edges as one layer: "
+                   f"{render_info['bytes'] / 1024 ** 2:.1f} MB in {render_info['seconds']:.2f}s")
+        
+        folium_static(m, width=700, height=500)
     
     # Prepare download
     st.subheader("Download Your Data")
@@ -356,105 +315,126 @@ def process_and_display_network(edges, nodes, enable_clustering=False,
     download_edges = st.session_state.edges if st.session_state.edges is not None else edges
     download_cluster_gdf = st.session_state.cluster_gdf
     
-    with tempfile.TemporaryDirectory() as tmpdir:
-        if output_format == "Shapefile":
-            shp_path = os.path.join(tmpdir, "roads.shp")
-            download_edges.to_file(shp_path, driver='ESRI Shapefile')
-            
-            # Zip the shapefile components
-            zip_buffer = io.BytesIO()
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for ext in ['.shp', '.shx', '.dbf', '.prj', '.cpg']:
-                    file_path = os.path.join(tmpdir, f"roads{ext}")
-                    if os.path.exists(file_path):
-                        zipf.write(file_path, f"roads{ext}")
-            
-            zip_buffer.seek(0)
+    has_clusters = enable_clustering and download_cluster_gdf is not None
+    
+    def download_roads():
+        # Roads carry their cluster_id, so no spatial join is needed downstream
+        if has_clusters:
+            return with_cluster_ids(download_edges, download_cluster_gdf)
+        return download_edges
+    
+    # Files are generated only when a button is clicked, streamed into
+    # spooled temp files; on_click="ignore" keeps the results on the page
+    if output_format == "Shapefile":
+        st.download_button(
+            label="📥 Download Roads Shapefile (ZIP)",
+            data=recorded_export(recorder, "roads.zip", lambda: export_shapefile_zip(download_roads(), "roads")),
+            file_name="roads.zip",
+            mime="application/zip",
+            on_click="ignore",
+            key="roads_shp"
+        )
+        
+        # Add cluster download if enabled
+        if has_clusters:
             st.download_button(
-                label="📥 Download Roads Shapefile (ZIP)",
-                data=zip_buffer,
-                file_name="roads.zip",
+                label="📥 Download Cluster Polygons Shapefile (ZIP)",
+                data=recorded_export(recorder, "clusters.zip",
+                                     lambda: export_shapefile_zip(download_cluster_gdf, "clusters")),
+                file_name="clusters.zip",
                 mime="application/zip",
-                key="roads_shp"
+                on_click="ignore",
+                key="clusters_shp"
             )
-            
-            # Add cluster download if enabled
-            if enable_clustering and download_cluster_gdf is not None:
-                cluster_shp_path = os.path.join(tmpdir, "clusters.shp")
-                download_cluster_gdf.to_file(cluster_shp_path, driver='ESRI Shapefile')
-                
-                cluster_zip_buffer = io.BytesIO()
-                with zipfile.ZipFile(cluster_zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                    for ext in ['.shp', '.shx', '.dbf', '.prj', '.cpg']:
-                        file_path = os.path.join(tmpdir, f"clusters{ext}")
-                        if os.path.exists(file_path):
-                            zipf.write(file_path, f"clusters{ext}")
-                
-                cluster_zip_buffer.seek(0)
-                st.download_button(
-                    label="📥 Download Cluster Polygons Shapefile (ZIP)",
-                    data=cluster_zip_buffer,
-                    file_name="clusters.zip",
-                    mime="application/zip",
-                    key="clusters_shp"
-                )
+    
+    elif output_format in SINGLE_LAYER_FORMATS:
+        exporter, extension, mime = SINGLE_LAYER_FORMATS[output_format]
+        st.download_button(
+            label=f"📥 Download Roads {output_format}",
+            data=recorded_export(recorder, f"roads{extension}", lambda: exporter(download_roads())),
+            file_name=f"roads{extension}",
+            mime=mime,
+            on_click="ignore",
+            key=f"roads_{extension[1:]}"
+        )
         
-        elif output_format == "GeoJSON":
-            geojson_str = download_edges.to_json()
+        # Add cluster download if enabled
+        if has_clusters:
             st.download_button(
-                label="📥 Download Roads GeoJSON",
-                data=geojson_str,
-                file_name="roads.geojson",
-                mime="application/json",
-                key="roads_geojson"
+                label=f"📥 Download Cluster Polygons {output_format}",
+                data=recorded_export(recorder, f"clusters{extension}", lambda: exporter(download_cluster_gdf)),
+                file_name=f"clusters{extension}",
+                mime=mime,
+                on_click="ignore",
+                key=f"clusters_{extension[1:]}"
             )
-            
-            # Add cluster download if enabled
-            if enable_clustering and download_cluster_gdf is not None:
-                cluster_geojson_str = download_cluster_gdf.to_json()
-                st.download_button(
-                    label="📥 Download Cluster Polygons GeoJSON",
-                    data=cluster_geojson_str,
-                    file_name="clusters.geojson",
-                    mime="application/json",
-                    key="clusters_geojson"
-                )
+    
+    elif output_format == "GeoPackage":
+        # Add clusters to same geopackage if enabled
+        download_label = "📥 Download GeoPackage"
+        if has_clusters:
+            download_label += " (Roads + Clusters)"
         
-        elif output_format == "GeoPackage":
-            gpkg_path = os.path.join(tmpdir, "roads.gpkg")
-            download_edges.to_file(gpkg_path, driver='GPKG', layer='roads')
-            
-            # Add clusters to same geopackage if enabled
-            if enable_clustering and download_cluster_gdf is not None:
-                download_cluster_gdf.to_file(gpkg_path, driver='GPKG', layer='clusters')
-            
-            with open(gpkg_path, 'rb') as f:
-                gpkg_bytes = f.read()
-            
-            download_label = "📥 Download GeoPackage"
-            if enable_clustering and download_cluster_gdf is not None:
-                download_label += " (Roads + Clusters)"
-            
-            st.download_button(
-                label=download_label,
-                data=gpkg_bytes,
-                file_name="roads.gpkg",
-                mime="application/geopackage+sqlite3",
-                key="roads_gpkg"
-            )
+        def geopackage_layers():
+            layers = {'roads': download_roads()}
+            if has_clusters:
+                layers['clusters'] = download_cluster_gdf
+            return layers
+        
+        st.download_button(
+            label=download_label,
+            data=recorded_export(recorder, "roads.gpkg", lambda: export_geopackage(geopackage_layers())),
+            file_name="roads.gpkg",
+            mime="application/geopackage+sqlite3",
+            on_click="ignore",
+            key="roads_gpkg"
+        )
+    
+    # One folder of roads and clusters per feature, in the chosen format
+    if 'feature_id' in download_edges:
+        package_clusters = download_cluster_gdf if has_clusters else None
+        st.download_button(
+            label="📦 Download Per-Feature Packages (ZIP)",
+            data=recorded_export(recorder, "features.zip",
+                                 lambda: export_feature_packages(download_edges, package_clusters, output_format)),
+            file_name="features.zip",
+            mime="application/zip",
+            on_click="ignore",
+            key="features_zip"
+        )
     
     # Show attribute table sample
     with st.expander("📊 View Attribute Table (first 10 rows)"):
         display_cols = [col for col in edges.columns if col != 'geometry']
         st.dataframe(edges[display_cols].head(10))
     
+    show_performance(recorder, jobs)
+    recorder.flush()
+    
     return edges, cluster_gdf
 
 st.set_page_config(page_title="OSM Road Network Extractor", layout="wide")
 
-# Configure OSMnx
-ox.settings.use_cache = True
-ox.settings.log_console = False
+@st.cache_resource
+def configure_osmnx():
+    """Load and configure OSMnx once per server, on the first extraction."""
+    import osmnx as ox
+    ox.settings.use_cache = True
+    ox.settings.log_console = False
+
+@st.cache_resource
+def get_network_cache():
+    """One on-disk network cache shared by every session of this server."""
+    return NetworkCache()
+
+network_cache = get_network_cache()
+
+@st.cache_resource
+def get_job_queue():
+    """One background job queue shared by every session of this server."""
+    return JobQueue()
+
+job_queue = get_job_queue()
 
 # Initialize session state for persistent data
 if 'edges' not in st.session_state:
@@ -463,6 +443,10 @@ if 'nodes' not in st.session_state:
     st.session_state.nodes = None
 if 'cluster_gdf' not in st.session_state:
     st.session_state.cluster_gdf = None
+if 'cluster_memo' not in st.session_state:
+    st.session_state.cluster_memo = ClusterMemo()
+if 'extract_job' not in st.session_state:
+    st.session_state.extract_job = None
 
 st.title("🗺️ OpenStreetMap Road Network Extractor")
 st.markdown("Extract road networks by place name or upload a boundary polygon")
@@ -476,8 +460,36 @@ network_type = st.sidebar.selectbox("Network Type:",
                                     ["drive", "walk", "bike", "all"],
                                     help="Drive: car roads only | Walk: pedestrian paths | Bike: cycling routes | All: everything")
 
+data_source = st.sidebar.radio("Data source:",
+                               ["Overpass (online)", "Local PBF file"],
+                               help="Overpass downloads live OSM data | Local PBF reads an .osm.pbf extract on this server")
+pbf_path = None
+if data_source == "Local PBF file":
+    pbf_path = st.sidebar.text_input("PBF file path:",
+                                     value=os.environ.get("OSM_EXTRACTOR_PBF", ""),
+                                     placeholder="e.g., /data/california-latest.osm.pbf",
+                                     help="Path to a .osm.pbf extract covering your area (download from download.geofabrik.de)")
+    if pbf_path and not os.path.exists(pbf_path):
+        st.sidebar.error("❌ PBF file not found")
+    elif not pbf_path:
+        st.sidebar.warning("⚠️ Enter a PBF path, otherwise Overpass is used")
+
+use_tiling = st.sidebar.checkbox("Tiled extraction (large areas)", value=False,
+                                 help="Split bounding boxes and polygons into tiles that are extracted in parallel "
+                                      "and stitched together. Each tile is cached separately.")
+if use_tiling:
+    from osm_extractor.tiling import DEFAULT_TILE_KM
+    
+    tile_km = st.sidebar.number_input("Tile size (km):", min_value=1.0, max_value=100.0,
+                                      value=DEFAULT_TILE_KM, step=1.0,
+                                      help="Smaller tiles use less memory per worker")
+    tile_workers = st.sidebar.number_input("Parallel workers:", min_value=1, max_value=32,
+                                           value=min(4, os.cpu_count() or 1), step=1)
+
 output_format = st.sidebar.selectbox("Output Format:",
-                                     ["GeoJSON", "Shapefile", "GeoPackage"])
+                                     ["GeoJSON", "Shapefile", "GeoPackage", "GeoParquet", "FlatGeobuf"],
+                                     help="GeoParquet and FlatGeobuf are spatially indexed and "
+                                          "fastest to write and read for large networks")
 
 # Clustering options
 st.sidebar.markdown("---")
@@ -486,17 +498,83 @@ enable_clustering = st.sidebar.checkbox("Enable Road Network Clustering", value=
                                        help="Generate spatial clusters for dividing road networks")
 
 if enable_clustering:
-    point_spacing = st.sidebar.number_input("Point spacing (miles):", 
-                                           min_value=0.1, max_value=5.0, 
-                                           value=0.5, step=0.1,
-                                           help="Distance between points along roads")
+    sampling_mode = st.sidebar.radio("Point sampling:", ["Fixed spacing", "Sample budget"], horizontal=True,
+                                     help="Sample budget: the spacing is chosen to stay within a number of "
+                                          "points, and every road gets at least one, so time and memory "
+                                          "are bounded however large the area")
+    point_spacing, sample_budget = 0.5, None
+    if sampling_mode == "Fixed spacing":
+        point_spacing = st.sidebar.number_input("Point spacing (miles):", 
+                                               min_value=0.1, max_value=5.0, 
+                                               value=0.5, step=0.1,
+                                               help="Distance between points along roads")
+    else:
+        sample_budget = st.sidebar.number_input("Sample budget (points):", min_value=100, max_value=5_000_000,
+                                                value=DEFAULT_SAMPLE_BUDGET, step=10_000)
     
     target_miles_per_cluster = st.sidebar.number_input("Target miles per cluster:", 
                                                        min_value=1, max_value=1000, 
                                                        value=50, step=5,
                                                        help="Desired centerline miles in each cluster")
+    
+    clustering_backend = st.sidebar.selectbox("Clustering backend:",
+                                              ["auto", "kmeans", "minibatch", "graph"],
+                                              help="auto: exact KMeans for small networks, MiniBatch KMeans above "
+                                                   f"{MINIBATCH_THRESHOLD:,} sample points | "
+                                                   "graph: connected clusters grown along the road network")
+    
+    polygon_style = st.sidebar.selectbox("Cluster polygon style:",
+                                         ["convex", "concave", "road_buffer"],
+                                         help="convex: convex hull of the roads | concave: tighter concave hull | "
+                                              "road_buffer: union of 100 m buffers around the roads")
+    
+    balance_tolerance = st.sidebar.slider("Balance tolerance (%):",
+                                          min_value=0, max_value=100,
+                                          value=int(BALANCE_TOLERANCE * 100), step=5,
+                                          help="Boundary roads are moved between neighbouring clusters until "
+                                               "each cluster is within this percentage of the target miles") / 100
+
+# Instrumentation
+st.sidebar.markdown("---")
+measure_memory = st.sidebar.checkbox("Measure peak memory", value=False,
+                                     help="Record peak Python memory per stage in the Performance panel "
+                                          "(makes processing somewhat slower)")
+recorder = StageRecorder(trace_memory=measure_memory, method=extraction_method, network_type=network_type)
+
+display_options = dict(
+    enable_clustering=enable_clustering,
+    target_miles_per_cluster=target_miles_per_cluster if enable_clustering else 50,
+    point_spacing=point_spacing if enable_clustering else 0.5,
+    sample_budget=sample_budget if enable_clustering else None,
+    output_format=output_format,
+    clustering_backend=clustering_backend if enable_clustering else "auto",
+    balance_tolerance=balance_tolerance if enable_clustering else BALANCE_TOLERANCE,
+    polygon_style=polygon_style if enable_clustering else "convex",
+    recorder=recorder,
+    job_queue=job_queue
+)
+
+def submit_extraction(query, description, hint):
+    """
+    Queue extraction of ``query`` (place, bbox, polygon or the features of a
+    boundary layer) in the background, joining the job of any identical
+    request, and keep it for polling. ``hint`` is shown if the job fails.
+    """
+    configure_osmnx()
+    options = dict(pbf_path=pbf_path or None, cache=network_cache, tile_km=tile_km if use_tiling else None,
+                   max_workers=tile_workers if use_tiling else None)
+    if 'features' in query:
+        job = submit_job(job_queue, ('features', features_key(query['features'], network_type, pbf_path or None)),
+                         feature_extraction_job, query['features'], network_type, label=description,
+                         trace_memory=measure_memory, **options)
+    else:
+        key = network_key(network_type, pbf_path=pbf_path or None, **query)
+        job = submit_job(job_queue, ('extract', key), extraction_job, network_type, label=description,
+                         trace_memory=measure_memory, description=description, **options, **query)
+    st.session_state.extract_job = (job.id, hint)
 
 # Main content area
+extract_clicked = False
 if extraction_method == "Place Name":
     st.subheader("Extract by Place Name")
     
@@ -528,42 +606,11 @@ if extraction_method == "Place Name":
         - Avoid abbreviations when possible
         """)
     
-    if st.button("🚀 Extract Network", type="primary"):
+    extract_clicked = st.button("🚀 Extract Network", type="primary")
+    if extract_clicked:
         if place_name:
-            with st.spinner(f"Searching for '{place_name}'..."):
-                try:
-                    # Try to geocode first to verify the place exists
-                    try:
-                        location = ox.geocode(place_name)
-                        st.success(f"✓ Found location at coordinates: {location[0]:.4f}, {location[1]:.4f}")
-                    except Exception as geocode_error:
-                        st.error(f"❌ Could not find '{place_name}'")
-                        st.warning("""
-                        **Suggestions:**
-                        - Check spelling and try again
-                        - Add more detail: City, State, Country
-                        - Try searching on [OpenStreetMap.org](https://www.openstreetmap.org) first
-                        - Use the 'Upload Polygon' method instead for precise boundaries
-                        """)
-                        st.stop()
-                    
-                    # Download network
-                    with st.spinner(f"Downloading road network..."):
-                        G = ox.graph_from_place(place_name, network_type=network_type)
-                        nodes, edges = ox.graph_to_gdfs(G)
-                    
-                    # Process and display network
-                    process_and_display_network(
-                        edges, nodes, 
-                        enable_clustering=enable_clustering,
-                        target_miles_per_cluster=target_miles_per_cluster if enable_clustering else 50,
-                        point_spacing=point_spacing if enable_clustering else 0.5,
-                        output_format=output_format
-                    )
-                
-                except Exception as e:
-                    st.error(f"❌ Error: {str(e)}")
-                    st.info("💡 Try a more specific place name or check your spelling")
+            submit_extraction(dict(place=place_name), f"place: {place_name} ({network_type})",
+                              "💡 Try a more specific place name or check your spelling")
         else:
             st.warning("⚠️ Please enter a place name")
 
@@ -582,6 +629,9 @@ elif extraction_method == "Bounding Box (Coordinates)":
     
     # Show bbox on mini map
     with st.expander("🗺️ Preview Bounding Box"):
+        import folium
+        from streamlit_folium import folium_static
+        
         preview_map = folium.Map(location=[(north+south)/2, (east+west)/2], zoom_start=11)
         folium.Rectangle(
             bounds=[[south, west], [north, east]],
@@ -591,7 +641,8 @@ elif extraction_method == "Bounding Box (Coordinates)":
         ).add_to(preview_map)
         folium_static(preview_map, width=600, height=400)
     
-    if st.button("🚀 Extract Network", type="primary"):
+    extract_clicked = st.button("🚀 Extract Network", type="primary")
+    if extract_clicked:
         # Validate bbox
         if north <= south:
             st.error("❌ North latitude must be greater than South latitude")
@@ -600,24 +651,9 @@ elif extraction_method == "Bounding Box (Coordinates)":
             st.error("❌ East longitude must be greater than West longitude")
             st.stop()
         
-        with st.spinner(f"Downloading road network for bounding box..."):
-            try:
-                # Download network
-                G = ox.graph_from_bbox(north, south, east, west, network_type=network_type)
-                nodes, edges = ox.graph_to_gdfs(G)
-                
-                # Process and display network
-                process_and_display_network(
-                    edges, nodes,
-                    enable_clustering=enable_clustering,
-                    target_miles_per_cluster=target_miles_per_cluster if enable_clustering else 50,
-                    point_spacing=point_spacing if enable_clustering else 0.5,
-                    output_format=output_format
-                )
-            
-            except Exception as e:
-                st.error(f"❌ Error: {str(e)}")
-                st.info("💡 Try a smaller bounding box or check your coordinates")
+        submit_extraction(dict(bbox=(north, south, east, west)),
+                          f"bbox: {north}, {south}, {east}, {west} ({network_type})",
+                          "💡 Try a smaller bounding box or check your coordinates")
 
 elif extraction_method == "Upload Polygon":
     st.subheader("Extract by Polygon Upload")
@@ -625,62 +661,98 @@ elif extraction_method == "Upload Polygon":
     
     uploaded_file = st.file_uploader("Choose a file", 
                                      type=['zip', 'geojson', 'gpkg'],
-                                     help="Your polygon will be used as the boundary for extraction")
+                                     help="Every polygon in the file is used as a boundary for extraction")
     
-    if uploaded_file and st.button("🚀 Extract Network", type="primary"):
-        with st.spinner("Processing polygon and downloading network..."):
-            try:
-                with tempfile.TemporaryDirectory() as tmpdir:
-                    # Save uploaded file
-                    if uploaded_file.name.endswith('.zip'):
-                        zip_path = os.path.join(tmpdir, "boundary.zip")
-                        with open(zip_path, 'wb') as f:
-                            f.write(uploaded_file.read())
-                        
-                        # Extract zip
-                        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                            zip_ref.extractall(tmpdir)
-                        
-                        # Find .shp file
-                        shp_files = [f for f in os.listdir(tmpdir) if f.endswith('.shp')]
-                        if shp_files:
-                            boundary_path = os.path.join(tmpdir, shp_files[0])
-                        else:
-                            st.error("❌ No shapefile found in zip")
-                            st.stop()
-                    else:
-                        boundary_path = os.path.join(tmpdir, uploaded_file.name)
-                        with open(boundary_path, 'wb') as f:
-                            f.write(uploaded_file.read())
-                    
-                    # Read boundary
-                    boundary = gpd.read_file(boundary_path)
-                    
-                    # Show boundary info
-                    st.info(f"📍 Boundary loaded: {len(boundary)} feature(s), CRS: {boundary.crs}")
-                    
-                    # Use first feature if multiple
-                    polygon = boundary.geometry.iloc[0]
-                    
-                    # Download network
-                    G = ox.graph_from_polygon(polygon, network_type=network_type)
-                    nodes, edges = ox.graph_to_gdfs(G)
-                    
-                    # Process and display network
-                    process_and_display_network(
-                        edges, nodes,
-                        enable_clustering=enable_clustering,
-                        target_miles_per_cluster=target_miles_per_cluster if enable_clustering else 50,
-                        point_spacing=point_spacing if enable_clustering else 0.5,
-                        output_format=output_format
-                    )
-                    
-            except Exception as e:
-                st.error(f"❌ Error: {str(e)}")
-                st.info("💡 Make sure your file is a valid polygon geometry")
+    boundary = None
+    if uploaded_file is not None:
+        try:
+            boundary = read_boundary_file(uploaded_file.name, uploaded_file.getvalue())
+            
+            # Show boundary info
+            st.info(f"📍 Boundary loaded: {len(boundary)} feature(s), CRS: {boundary.crs}")
+        except Exception as e:
+            st.error(f"❌ Error: {str(e)}")
+            st.info("💡 Make sure your file is a valid polygon geometry")
+    
+    # Each feature of a layer (e.g. districts) gets its own network, clusters and output folder
+    id_column = None
+    if boundary is not None and len(boundary) > 1:
+        id_column = st.selectbox("Feature id column:",
+                                 [None] + [c for c in boundary.columns if c != boundary.geometry.name],
+                                 format_func=lambda c: "(row number)" if c is None else c,
+                                 help="Tags roads and clusters with each feature's id and names the "
+                                      "per-feature output folders")
+    
+    extract_clicked = boundary is not None and st.button("🚀 Extract Network", type="primary")
+    if extract_clicked:
+        try:
+            features = boundary_features(boundary, id_column)
+        except ValueError as e:
+            st.error(f"❌ Error: {str(e)}")
+            st.stop()
+        
+        hint = "💡 Make sure your file is a valid polygon geometry"
+        if len(features) == 1:
+            submit_extraction(dict(polygon=features.geometry.iloc[0]),
+                              f"polygon: {uploaded_file.name} ({network_type})", hint)
+        else:
+            submit_extraction(dict(features=features),
+                              f"{len(features)} features: {uploaded_file.name} ({network_type})", hint)
+
+# Extraction runs in the background: poll the submitted job until it
+# finishes, then show its network once
+extract_job = None
+if st.session_state.extract_job is not None:
+    job_id, hint = st.session_state.extract_job
+    extract_job = job_queue.get(job_id)
+    if extract_job is None:
+        st.session_state.extract_job = None
+        st.warning("⚠️ The extraction job expired before its result was shown; please extract again")
+
+if extract_job is not None and not extract_job.done:
+    show_job_progress(job_queue, extract_job.id)
+elif extract_job is not None:
+    st.session_state.extract_job = None
+    if isinstance(extract_job.error, PlaceNotFoundError):
+        st.error(f"❌ {extract_job.error}")
+        st.warning("""
+        **Suggestions:**
+        - Check spelling and try again
+        - Add more detail: City, State, Country
+        - Try searching on [OpenStreetMap.org](https://www.openstreetmap.org) first
+        - Use the 'Upload Polygon' method instead for precise boundaries
+        """)
+    elif extract_job.error is not None:
+        st.error(f"❌ Error: {str(extract_job.error)}")
+        st.info(hint)
+    else:
+        (nodes, edges), cached = extract_job.result
+        show_extraction_source(edges, cached)
+        
+        # Process and display network
+        process_and_display_network(edges, nodes, jobs=[extract_job], **display_options)
+
+# Widget changes rerun the script: keep showing the last network, with
+# clustering served from the session memo when its inputs are unchanged
+elif not extract_clicked and st.session_state.edges is not None:
+    st.caption("Showing the last extracted network")
+    process_and_display_network(st.session_state.edges, st.session_state.nodes, **display_options)
 
 # Footer
 st.sidebar.markdown("---")
+cache_stats = network_cache.stats()
+st.sidebar.caption(
+    f"🗄️ **Network cache:** {cache_stats['hits']:,} hits / {cache_stats['misses']:,} misses | "
+    f"{cache_stats['entries']:,} networks, "
+    f"{cache_stats['size_bytes'] / 1024 ** 2:.1f} of {cache_stats['max_bytes'] / 1024 ** 2:,.0f} MB"
+)
+if st.sidebar.button("Clear network cache"):
+    network_cache.clear()
+    st.rerun()
+job_stats = job_queue.stats()
+st.sidebar.caption(f"⚙️ **Background jobs:** {job_stats['running']} running, {job_stats['queued']} queued, "
+                   f"{job_stats['done'] + job_stats['failed']} recently finished")
+st.sidebar.markdown("---")
 st.sidebar.info("""
 💡 **About**
 
@@ -0,0 +1,42 @@
+"""Shared fixtures: the frozen grid extract in benchmarks/fixtures."""
+import os
+
+import numpy as np
+import pytest
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+
+from osm_extractor.graph_partition import edge_adjacency
+from osm_extractor.pbf_source import read_pbf_network
+from osm_extractor.pipeline import add_length_miles
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "fixtures")
+GRID_PBF = os.path.join(FIXTURES, "grid.osm.pbf")
+GRID_OSC = os.path.join(FIXTURES, "grid-changes.osc")
+
+# (north, south, east, west) covering the grid extract
+GRID_BBOX = (33.92, 33.89, -118.37, -118.41)
+
+
+def cluster_pieces(edge_u, edge_v, labels):
+    """Number of connected pieces of road in every cluster (label >= 0)."""
+    adjacency = edge_adjacency(edge_u, edge_v).tocoo()
+    same = labels[adjacency.row] == labels[adjacency.col]
+    within = sp.csr_matrix((np.ones(same.sum()), (adjacency.row[same], adjacency.col[same])),
+                           shape=adjacency.shape)
+    _, components = connected_components(within, directed=False)
+    return {int(label): len(np.unique(components[labels == label])) for label in np.unique(labels[labels >= 0])}
+
+
+@pytest.fixture(scope="session")
+def grid_network():
+    """(nodes, edges) of the grid extract, edges with ``length_mi``."""
+    nodes, edges = read_pbf_network(GRID_PBF)
+    add_length_miles(edges)
+    return nodes, edges
+
+
+@pytest.fixture
+def grid_edges(grid_network):
+    """Fresh copy of the grid edges, safe to modify."""
+    return grid_network[1].copy()
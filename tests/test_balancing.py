@@ -0,0 +1,45 @@
+"""Mileage balancing of edge clusters."""
+import numpy as np
+import shapely
+
+from osm_extractor.balancing import balance_cluster_mileage, edge_endpoints
+
+from tests.conftest import cluster_pieces
+
+
+def test_balancing_moves_edges_along_a_path():
+    # 20 one-mile edges in a row, split 15 / 5
+    u, v = np.arange(20), np.arange(1, 21)
+    labels = np.array([0] * 15 + [1] * 5)
+    balanced, moves = balance_cluster_mileage(u, v, np.ones(20), labels, target_miles=10, tolerance=0.0)
+    assert moves == 5
+    assert list(balanced) == [0] * 10 + [1] * 10
+
+
+def test_balancing_keeps_clusters_connected():
+    # Cluster 0 is the path 0-1-2-3 with a short middle edge; cluster 1 hangs
+    # off node 2. Giving cluster 1 the short edge (1, 2) would cut (0, 1) off.
+    u = np.array([0, 1, 2, 2, 5])
+    v = np.array([1, 2, 3, 5, 6])
+    miles = np.array([5.0, 0.1, 5.0, 1.0, 1.0])
+    labels = np.array([0, 0, 0, 1, 1])
+    balanced, moves = balance_cluster_mileage(u, v, miles, labels, target_miles=6, tolerance=0.0)
+    assert moves == 1
+    assert list(balanced) == [0, 0, 1, 1, 1]
+    assert set(cluster_pieces(u, v, balanced).values()) == {1}
+
+
+def test_balancing_caps_cluster_miles(grid_edges):
+    u, v = edge_endpoints(grid_edges)
+    miles = grid_edges['length_mi'].to_numpy()
+    # Vertical strips of very different size
+    x = shapely.get_x(shapely.get_point(grid_edges.geometry.to_numpy(), 0))
+    labels = np.digitize(x, np.quantile(x, [0.5, 0.75, 0.9]))
+    target = miles.sum() / 4
+
+    balanced, moves = balance_cluster_mileage(u, v, miles, labels, target_miles=target, tolerance=0.15)
+    cluster_miles = np.bincount(balanced, weights=miles, minlength=4)
+    assert moves > 0
+    assert set(cluster_pieces(u, v, balanced).values()) == {1}
+    assert cluster_miles.max() <= target * 1.15 + miles.max()
+    assert cluster_miles.max() < np.bincount(labels, weights=miles).max()
@@ -0,0 +1,38 @@
+"""Multi-feature boundary files in the batch and incremental command lines."""
+import geopandas as gpd
+import pytest
+from shapely.geometry import box
+
+from osm_extractor import incremental
+from osm_extractor.batch import run_job, JOB_DEFAULTS
+
+from tests.conftest import GRID_PBF, GRID_OSC
+
+WEST = box(-118.41, 33.89, -118.39, 33.92)
+EAST = box(-118.39, 33.89, -118.37, 33.92)
+
+
+def _boundary_file(tmp_path, polygons):
+    path = tmp_path / "boundary.geojson"
+    gpd.GeoDataFrame({'name': list(polygons)}, geometry=list(polygons.values()), crs=4326).to_file(path)
+    return str(path)
+
+
+def test_batch_extracts_every_feature(tmp_path):
+    job = {**JOB_DEFAULTS, 'name': "districts", 'pbf': GRID_PBF, 'id_column': "name", 'cluster': True,
+           'target_miles': 3, 'point_spacing': 0.05, 'output_format': "GeoParquet",
+           'polygon': _boundary_file(tmp_path, {'west': WEST, 'east': EAST})}
+    result = run_job(job, str(tmp_path / "out"), cache_dir=str(tmp_path / "cache"), perf_log=None)
+    assert result['status'] == "ok", result.get('traceback')
+
+    roads = gpd.read_parquet(tmp_path / "out" / "districts" / "roads.parquet")
+    clusters = gpd.read_parquet(tmp_path / "out" / "districts" / "clusters.parquet")
+    assert set(roads['feature_id']) == {'west', 'east'}
+    assert set(clusters['feature_id']) == {'west', 'east'}
+
+
+def test_incremental_rejects_multi_feature_boundary(tmp_path, capsys):
+    path = _boundary_file(tmp_path, {'west': WEST, 'east': EAST})
+    with pytest.raises(SystemExit):
+        incremental.main([GRID_PBF, '--osc', GRID_OSC, '--polygon', path, '--cache-dir', str(tmp_path)])
+    assert "2 polygon features" in capsys.readouterr().err
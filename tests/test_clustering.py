@@ -0,0 +1,53 @@
+"""Clustering of the grid extract: balance and contiguity."""
+import numpy as np
+import pytest
+
+from osm_extractor.balancing import BALANCE_TOLERANCE, edge_endpoints
+from osm_extractor.pipeline import add_length_miles, cluster_network, with_cluster_ids
+from benchmarks.synthetic import radial_network
+
+from tests.conftest import cluster_pieces
+
+TARGET_MILES = 3
+
+
+@pytest.mark.parametrize("backend", ["kmeans", "graph"])
+def test_clusters_are_balanced(grid_edges, backend):
+    clusters, _, notes = cluster_network(grid_edges, target_miles=TARGET_MILES, point_spacing=0.05,
+                                         backend=backend)
+    assert notes == []
+    assert clusters.attrs['clustering']['backend'] == backend
+
+    labels = with_cluster_ids(grid_edges, clusters)['cluster_id'].to_numpy()
+    assert (labels >= 0).all()
+    miles = np.bincount(labels, weights=grid_edges['length_mi'].to_numpy())
+    assert len(miles) == len(clusters)
+    assert miles.sum() == pytest.approx(grid_edges['length_mi'].sum())
+    assert miles.max() <= TARGET_MILES * (1 + BALANCE_TOLERANCE)
+    assert miles.min() >= miles.mean() * (1 - BALANCE_TOLERANCE)
+
+
+def test_graph_clusters_are_contiguous(grid_edges):
+    clusters, _, _ = cluster_network(grid_edges, target_miles=TARGET_MILES, point_spacing=0.05, backend="graph")
+    labels = with_cluster_ids(grid_edges, clusters)['cluster_id'].to_numpy()
+    assert set(cluster_pieces(*edge_endpoints(grid_edges), labels).values()) == {1}
+
+
+@pytest.mark.parametrize("tolerance", [BALANCE_TOLERANCE, 0.05])
+def test_balanced_graph_clusters_stay_contiguous(tolerance):
+    # Rings and spokes have many bridges for balancing to cut
+    edges = add_length_miles(radial_network(15, ring_meters=400)[1])
+    clusters, _, _ = cluster_network(edges, target_miles=10, backend="graph", balance_tolerance=tolerance)
+    assert clusters.attrs['clustering']['balance_moves'] > 0
+    labels = with_cluster_ids(edges, clusters)['cluster_id'].to_numpy()
+    assert (labels >= 0).all()
+    assert set(cluster_pieces(*edge_endpoints(edges), labels).values()) == {1}
+
+
+def test_every_road_gets_a_cluster_at_default_spacing():
+    # Most radial segments are shorter than the default 0.5 mi spacing
+    edges = add_length_miles(radial_network(15, ring_meters=400)[1])
+    clusters, _, _ = cluster_network(edges, target_miles=10)
+    labels = with_cluster_ids(edges, clusters)['cluster_id'].to_numpy()
+    assert (labels >= 0).all()
+    assert clusters.attrs['clustering']['cluster_table']['num_edges'].sum() == len(edges)
@@ -0,0 +1,54 @@
+"""Roads and clusters written by write_outputs read back unchanged."""
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+
+from osm_extractor.pipeline import OUTPUT_FORMATS, cluster_network, with_cluster_ids, write_outputs
+
+
+@pytest.fixture(scope="module")
+def clustered(grid_network):
+    edges = grid_network[1]
+    clusters, _, _ = cluster_network(edges, target_miles=3, point_spacing=0.05)
+    return with_cluster_ids(edges, clusters), clusters
+
+
+def _read(path, layer=None):
+    if path.endswith(".parquet"):
+        return gpd.read_parquet(path)
+    return gpd.read_file(path, layer=layer)
+
+
+def _in_order_of(read, written):
+    """Rows of ``read`` in the order of ``written``, matched by geometry
+    (GeoParquet and FlatGeobuf store rows in spatial order)."""
+    def keys(gdf):
+        return shapely.to_wkb(shapely.set_precision(gdf.geometry.to_numpy(), 1e-7))
+    position = {key: i for i, key in enumerate(keys(read))}
+    assert len(position) == len(read)
+    return read.iloc[[position[key] for key in keys(written)]]
+
+
+@pytest.mark.parametrize("output_format", OUTPUT_FORMATS)
+def test_export_round_trip(tmp_path, clustered, output_format):
+    edges, clusters = clustered
+    files = write_outputs(str(tmp_path), edges.drop(columns='cluster_id'), clusters, output_format)
+    if output_format == "GeoPackage":
+        assert len(files) == 1
+        roads, cluster_layer = _read(files[0], 'roads'), _read(files[0], 'clusters')
+    else:
+        assert len(files) == 2
+        roads, cluster_layer = (_read(path) for path in files)
+
+    assert len(roads) == len(edges)
+    assert roads.crs.to_epsg() == 4326
+    roads = _in_order_of(roads, edges)
+    np.testing.assert_array_equal(roads['cluster_id'].to_numpy(), edges['cluster_id'].to_numpy())
+    np.testing.assert_allclose(roads['length_mi'].to_numpy(), edges['length_mi'].to_numpy())
+    assert shapely.equals_exact(roads.geometry.to_numpy(), edges.geometry.to_numpy(), tolerance=1e-9).all()
+
+    assert len(cluster_layer) == len(clusters)
+    cluster_layer = _in_order_of(cluster_layer, clusters)
+    np.testing.assert_array_equal(cluster_layer['cluster_id'].to_numpy(), clusters['cluster_id'].to_numpy())
+    assert set(cluster_layer['cluster_id']) == set(roads['cluster_id'])
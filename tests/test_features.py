@@ -0,0 +1,47 @@
+import zipfile
+
+import geopandas as gpd
+from shapely.geometry import box
+
+from osm_extractor.features import boundary_features, extract_features, export_feature_packages
+from osm_extractor.pipeline import add_length_miles, cluster_network
+
+from tests.conftest import GRID_PBF
+
+
+def _extract(polygons):
+    boundary = gpd.GeoDataFrame({'name': list(polygons)}, geometry=list(polygons.values()), crs=4326)
+    (_, edges), _ = extract_features(boundary_features(boundary, 'name'), 'drive', pbf_path=GRID_PBF)
+    return add_length_miles(edges)
+
+
+def test_every_feature_is_extracted_and_clustered():
+    edges = _extract({'west': box(-118.41, 33.89, -118.39, 33.92), 'east': box(-118.39, 33.89, -118.37, 33.92)})
+    assert set(edges['feature_id']) == {'west', 'east'}
+
+    clusters, points, _ = cluster_network(edges, target_miles=3, point_spacing=0.05)
+    assert set(clusters['feature_id']) == {'west', 'east'}
+    assert clusters['cluster_id'].is_unique
+
+    names = zipfile.ZipFile(export_feature_packages(edges, clusters)).namelist()
+    assert sorted(names) == ['east/clusters.geojson', 'east/roads.geojson',
+                             'west/clusters.geojson', 'west/roads.geojson']
+
+
+def test_upload_with_one_feature_holding_roads():
+    # The second feature lies outside the extract and gets no roads
+    edges = _extract({'grid': box(-118.41, 33.89, -118.37, 33.92), 'empty': box(-118.30, 33.80, -118.29, 33.81)})
+    assert set(edges['feature_id']) == {'grid'}
+
+    clusters, _, _ = cluster_network(edges, target_miles=3, point_spacing=0.05)
+    assert set(clusters['feature_id']) == {'grid'}
+    names = zipfile.ZipFile(export_feature_packages(edges, clusters)).namelist()
+    assert sorted(names) == ['grid/clusters.geojson', 'grid/roads.geojson']
+
+
+def test_packages_accept_clusters_of_the_whole_network():
+    edges = _extract({'west': box(-118.41, 33.89, -118.39, 33.92), 'east': box(-118.39, 33.89, -118.37, 33.92)})
+    clusters, _, _ = cluster_network(edges.drop(columns='feature_id'), target_miles=3, point_spacing=0.05)
+
+    names = zipfile.ZipFile(export_feature_packages(edges, clusters)).namelist()
+    assert {name.split('/')[1] for name in names} == {'roads.geojson', 'clusters.geojson'}
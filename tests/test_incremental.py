@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from osm_extractor.incremental import incremental_update, edge_labels_from_points, main, _simplify_keeping
+from osm_extractor.pipeline import cluster_network
+
+from tests.conftest import GRID_PBF, GRID_OSC, GRID_BBOX
+
+
+def test_recluster_drops_clusters_left_empty_by_balancing(grid_network):
+    # Small targets on a fine sample leave empty clusters after balancing
+    nodes, edges = grid_network
+    options = dict(target_miles=0.5, point_spacing=0.05)
+    clusters, points, _ = cluster_network(edges, **options)
+
+    (_, new_edges), new_clusters, new_points, update, _ = incremental_update(
+        nodes, edges, clusters, points, GRID_PBF, [GRID_OSC], **options
+    )
+
+    info = new_clusters.attrs['clustering']
+    table = info['cluster_table']
+    assert table['cluster_id'].is_unique
+    assert (table['num_edges'] > 0).all()
+    labels = edge_labels_from_points(new_edges, new_points)
+    assert set(labels[labels >= 0]) == set(table['cluster_id'])
+    assert set(new_clusters['cluster_id']) <= set(table['cluster_id'])
+    assert np.isclose(table['total_miles'].sum(), new_edges['length_mi'][labels >= 0].sum())
+    assert not set(info['incremental']['retired']) & set(table['cluster_id'])
+
+
+def test_main_reclusters_from_the_saved_clustering(tmp_path, capsys):
+    updated_pbf = str(tmp_path / "week1.osm.pbf")
+    args = [GRID_PBF, '--osc', GRID_OSC, '--bbox', *map(str, GRID_BBOX), '--target-miles', '2',
+            '--point-spacing', '0.05', '--cache-dir', str(tmp_path / "cache"), '--perf-log', '',
+            '--output-pbf', updated_pbf]
+
+    assert main(args) == 0
+    first = capsys.readouterr().out
+    assert "clustered from scratch" in first
+    assert main(args) == 0
+    assert "loaded from the previous run" in capsys.readouterr().out
+
+    # The updated PBF as the next base starts from the clustering just saved
+    assert main([updated_pbf] + args[1:-2]) == 0
+    assert "loaded from the previous run" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('osmnx_1x', [False, True])
+def test_simplify_keeps_endpoints(monkeypatch, osmnx_1x):
+    import networkx as nx
+    import osmnx as ox
+
+    if osmnx_1x:
+        simplify_graph = ox.simplify_graph
+
+        def simplify_without_node_attrs(G, **kwargs):
+            if kwargs:
+                raise TypeError("simplify_graph() got an unexpected keyword argument")
+            return simplify_graph(G)
+
+        monkeypatch.setattr(ox, 'simplify_graph', simplify_without_node_attrs)
+
+    # A two-way street 1-2-3 that would simplify to a single edge
+    G = nx.MultiDiGraph(crs='EPSG:4326')
+    G.add_nodes_from((node_id, {'x': float(node_id), 'y': 0.0}) for node_id in (1, 2, 3))
+    for u, v in [(1, 2), (2, 3), (2, 1), (3, 2)]:
+        G.add_edge(u, v, osmid=7, length=1.0, oneway=False, reversed=u > v)
+
+    assert sorted(_simplify_keeping(G.copy(), set()).edges()) == [(1, 3), (3, 1)]
+    simplified = _simplify_keeping(G.copy(), {2, 99})
+    assert sorted(simplified.edges()) == [(1, 2), (2, 1), (2, 3), (3, 2)]
+    assert not any(data for _, data in simplified.nodes(data='_kept_endpoint'))
@@ -0,0 +1,42 @@
+"""NetworkCache shared between processes."""
+import multiprocessing
+
+from shapely.geometry import box
+
+from osm_extractor.network_cache import NetworkCache, polygon_key, tile_key
+
+from tests.conftest import GRID_PBF, GRID_BBOX
+
+
+def _put_networks(cache_dir, prefix, ready):
+    from osm_extractor.pbf_source import read_pbf_network
+    nodes, edges = read_pbf_network(GRID_PBF)
+    cache = NetworkCache(cache_dir)
+    # Both workers open the cache before either one stores anything
+    ready.wait()
+    for i in range(3):
+        cache.put(f"{prefix}{i}", nodes, edges, description=f"{prefix} {i}")
+
+
+def test_two_processes_keep_each_others_entries(tmp_path):
+    context = multiprocessing.get_context("spawn")
+    ready = context.Barrier(2)
+    workers = [context.Process(target=_put_networks, args=(str(tmp_path), prefix, ready)) for prefix in "ab"]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+    cache = NetworkCache(str(tmp_path))
+    assert cache.stats()['entries'] == 6
+    assert all(cache.get(f"{prefix}{i}") is not None for prefix in "ab" for i in range(3))
+    assert cache.stats()['hits'] == 6
+
+
+def test_tiles_do_not_share_keys_with_polygon_queries():
+    # Tiles are cached unsimplified; a same-shaped polygon query must miss them
+    north, south, east, west = GRID_BBOX
+    area = box(west, south, east, north)
+    assert tile_key(area, 'drive') != polygon_key(area, 'drive')
+    assert tile_key(area, 'drive') == tile_key(box(west, south, east, north), 'drive')
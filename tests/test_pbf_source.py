@@ -0,0 +1,29 @@
+"""Clipped extraction from the grid PBF."""
+import shapely
+from shapely.geometry import box
+
+from osm_extractor.pbf_source import bbox_polygon, read_pbf_network
+
+from tests.conftest import GRID_BBOX, GRID_PBF
+
+# South-west quarter of the grid extract
+CLIP = box(-118.41, 33.89, -118.39, 33.905)
+
+
+def test_clip_covering_the_extract_keeps_every_road(grid_network):
+    nodes, edges = grid_network
+    clipped_nodes, clipped_edges = read_pbf_network(GRID_PBF, polygon=bbox_polygon(*GRID_BBOX))
+    assert clipped_nodes.index.equals(nodes.index)
+    assert clipped_edges.index.equals(edges.index)
+
+
+def test_clip_keeps_roads_inside_the_polygon(grid_network):
+    nodes, edges = read_pbf_network(GRID_PBF, polygon=CLIP)
+    assert 0 < len(edges) < len(grid_network[1])
+    assert shapely.contains_xy(CLIP, nodes['x'], nodes['y']).all()
+
+
+def test_truncate_by_edge_reads_nodes_outside_the_clip():
+    nodes, edges = read_pbf_network(GRID_PBF, polygon=CLIP, truncate_by_edge=True)
+    assert not shapely.contains_xy(CLIP, nodes['x'], nodes['y']).all()
+    assert edges.geometry.intersects(CLIP).all()